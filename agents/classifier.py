@@ -1,18 +1,63 @@
+import asyncio
 import json
 from memory.shared_memory import SharedMemory
 from utils.llm_client import GeminiClient
+from utils.single_flight import SingleFlight, content_key
+from utils.intent_model import IntentModel, MAX_FEATURE_CHARS
+from utils.keyword_matcher import KeywordMatcher, get_keyword_matcher
+from utils.spooled_upload import SpooledUpload, SNIFF_BYTES
+from agents.pdf_probe import probe_pdf, PDFProbeError
+from agents.mime_parser import looks_like_email
+from utils.json_stream import JSON_STREAM_FORMATS, detect_json_stream, sniff_json_stream
+from utils.metrics import timed, record_event, label_request
+
+# The possible intent categories
+INTENT_CATEGORIES = ["rfq", "invoice", "complaint", "regulation", "inquiry", "unknown"]
+
+
+def sniff_format(head: bytes, tail: bytes) -> str:
+    """
+    Guess the format of a file upload from its first and last few KB.
+
+    Returns:
+        "pdf", "json_array", "ndjson", "json", "email" or "unknown"
+    """
+    if head.startswith(b'%PDF'):
+        return "pdf"
+    # JSON arrays and NDJSON are streamed record by record
+    stream_format = detect_json_stream(head, tail)
+    if stream_format:
+        return stream_format
+    sample = head[:1000].decode('utf-8', errors='ignore')
+    ending = tail.decode('utf-8', errors='ignore')
+    if sample.strip().startswith('{') and ending.strip().endswith('}'):
+        return "json"
+    if looks_like_email(head) or 'From:' in sample or 'Subject:' in sample:
+        return "email"
+    return "unknown"
 
 
 class ClassifierAgent:
-    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None):
+    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None,
+                 single_flight: SingleFlight = None, intent_model: IntentModel = None,
+                 keyword_matcher: KeywordMatcher = None):
         self.shared_memory = shared_memory
         self.llm_client = llm_client
+        self.single_flight = single_flight or SingleFlight()
+        self.intent_model = intent_model
+        self.keyword_matcher = keyword_matcher or get_keyword_matcher()
     
     async def classify(self, input_data, input_type):
         """
         Classify the input data into a format and intent using a combination of
         rule-based classification and LLM-based classification when available.
+        
+        Concurrent calls with identical input share one classification.
         """
+        key = content_key("classify", input_type, input_data)
+        return await self.single_flight.do(key, lambda: self._classify(input_data, input_type))
+    
+    async def _classify(self, input_data, input_type):
         # Detect format based on input type
         format_type = await self._detect_format(input_data, input_type)
         
@@ -21,58 +66,134 @@ class ClassifierAgent:
         
         return format_type, intent
     
+    async def classify_and_extract(self, input_data, input_type):
+        """
+        Classify the input and, for JSON and email, fetch the format agent's
+        extraction fields in the same LLM round trip.
+        
+        Returns (format_type, intent, extraction) where extraction is None when
+        the agent has to run its own analysis. Concurrent calls with identical
+        input share one result.
+        """
+        key = content_key("classify_and_extract", input_type, input_data)
+        return await self.single_flight.do(key, lambda: self._classify_and_extract(input_data, input_type))
+    
+    async def _classify_and_extract(self, input_data, input_type):
+        format_type = await self._detect_format(input_data, input_type)
+        
+        if self.llm_client and format_type in ("json", "email"):
+            content = await self._combined_content(input_data, format_type)
+            if content is not None:
+                try:
+                    result = await self.llm_client.classify_and_extract(
+                        format_type,
+                        content,
+                        INTENT_CATEGORIES
+                    )
+                    return format_type, result["intent"], result["fields"]
+                except Exception as e:
+                    print(f"Error using LLM for combined classification: {str(e)}")
+                    record_event("llm_fallback")
+                    # Fall back to the two-pass approach
+        
+        intent = await self._detect_intent(input_data, format_type)
+        return format_type, intent, None
+    
+    async def _combined_content(self, input_data, format_type):
+        """
+        Return the content exactly as the format agent would hand it to the LLM,
+        or None if the agent would not run an LLM analysis on it.
+        
+        IntakePipeline passes uploads already read; an upload handed in
+        directly is read off the event loop.
+        """
+        if format_type == "email":
+            if isinstance(input_data, SpooledUpload):
+                return await asyncio.to_thread(input_data.read_text)
+            if isinstance(input_data, bytes):
+                return input_data.decode('utf-8', errors='ignore')
+            return str(input_data)
+        
+        if isinstance(input_data, SpooledUpload):
+            input_data = await asyncio.to_thread(input_data.read_bytes)
+        if isinstance(input_data, (bytes, str)):
+            try:
+                input_data = json.loads(input_data)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                return None
+        return input_data if isinstance(input_data, dict) else None
+    
+    @timed("classifier.detect_format")
     async def _detect_format(self, input_data, input_type):
         """Detect the format of the input."""
         if input_type == "file":
-            # Try to detect if it's a PDF, JSON, or text file based on content
-            if isinstance(input_data, bytes):
-                # Check for PDF signature
-                if input_data.startswith(b'%PDF'):
-                    return "pdf"
-                else:
-                    # Try to parse as JSON
-                    try:
-                        # Convert first part of bytes to string to check
-                        sample = input_data[:1000].decode('utf-8', errors='ignore')
-                        if sample.strip().startswith('{') and sample.strip().endswith('}'):
-                            return "json"
-                        elif 'From:' in sample or 'Subject:' in sample:
-                            return "email"
-                        else:
-                            return "unknown"
-                    except:
-                        return "unknown"
+            # Try to detect if it's a PDF, JSON, or text file based on content;
+            # only the first and last few KB are read
+            if isinstance(input_data, SpooledUpload):
+                head, tail = input_data.head(), input_data.tail()
+            elif isinstance(input_data, bytes):
+                head, tail = input_data[:SNIFF_BYTES], input_data[-SNIFF_BYTES:]
             else:
                 return "unknown"
+            
+            format_type = sniff_format(head, tail)
+            # The trailer probe rejects truncated or corrupt PDFs before
+            # they reach the parser pool
+            if format_type == "pdf":
+                try:
+                    await asyncio.to_thread(probe_pdf, input_data)
+                except PDFProbeError:
+                    label_request(format="pdf")
+                    record_event("parse_failure")
+                    raise
+            return format_type
         elif input_type == "json":
+            # Arrays and NDJSON arrive unparsed so they can be streamed
+            if isinstance(input_data, (str, bytes)):
+                return sniff_json_stream(input_data) or "json"
             return "json"
         elif input_type == "email":
             return "email"
         else:
             return "unknown"
     
+    @timed("classifier.detect_intent")
     async def _detect_intent(self, input_data, format_type):
         """
         Detect the intent of the input based on its content and format.
-        Uses Gemini if available, otherwise falls back to rule-based approach.
+        Uses the local intent model when it is confident, then Gemini if
+        available, otherwise falls back to rule-based approach.
         """
-        # First, prepare text for classification
+        # First, prepare text for classification. The intent model and the
+        # LLM prompt only use the head of a document, so uploads and bytes
+        # are never read or decoded whole for this
         if format_type == "json":
             if isinstance(input_data, dict):
                 # Convert JSON to string for classification
                 text_content = json.dumps(input_data)
+            elif isinstance(input_data, SpooledUpload):
+                text_content = input_data.head(MAX_FEATURE_CHARS).decode('utf-8', errors='ignore')
             elif isinstance(input_data, bytes):
-                try:
-                    text_content = input_data.decode('utf-8', errors='ignore')
-                except:
-                    text_content = str(input_data)
+                text_content = input_data[:MAX_FEATURE_CHARS].decode('utf-8', errors='ignore')
             else:
                 text_content = str(input_data)
+        
+        elif format_type in JSON_STREAM_FORMATS:
+            # Only the first records are read, so a large export is never
+            # loaded whole just to pick an intent
+            if isinstance(input_data, SpooledUpload):
+                text_content = input_data.head().decode('utf-8', errors='ignore')
+            elif isinstance(input_data, bytes):
+                text_content = input_data[:SNIFF_BYTES].decode('utf-8', errors='ignore')
+            else:
+                text_content = str(input_data)[:SNIFF_BYTES]
                 
         elif format_type == "email":
             # For emails, ensure it's text
-            if isinstance(input_data, bytes):
-                text_content = input_data.decode('utf-8', errors='ignore')
+            if isinstance(input_data, SpooledUpload):
+                text_content = input_data.head(MAX_FEATURE_CHARS).decode('utf-8', errors='ignore')
+            elif isinstance(input_data, bytes):
+                text_content = input_data[:MAX_FEATURE_CHARS].decode('utf-8', errors='ignore')
             else:
                 text_content = str(input_data)
         
@@ -83,50 +204,26 @@ class ClassifierAgent:
         else:
             return "unknown"
         
+        # A confident local model prediction saves the LLM round trip
+        if self.intent_model:
+            intent = self.intent_model.predict_confident(text_content)
+            if intent is not None:
+                return intent
+        
         # If we have Gemini client, use it for intent classification
-        if self.llm_client and (format_type == "json" or format_type == "email"):
+        if self.llm_client and (format_type in ("json", "email") or format_type in JSON_STREAM_FORMATS):
             try:
-                # Define the possible intent categories
-                intent_categories = ["rfq", "invoice", "complaint", "regulation", "inquiry", "unknown"]
-                
                 # Use LLM to classify the content
                 intent = await self.llm_client.classify_content(
                     text_content, 
-                    intent_categories
+                    INTENT_CATEGORIES
                 )
                 return intent
             except Exception as e:
                 print(f"Error using LLM for classification: {str(e)}")
+                record_event("llm_fallback")
                 # Fall back to rule-based approach
         
-        # Rule-based approach (fallback)
-        intent = "unknown"
-        text_content = text_content.lower()
-        
-        if format_type == "json":
-            # For JSON, check specific fields or patterns
-            if "invoice" in text_content or "payment" in text_content or "bill" in text_content:
-                intent = "invoice"
-            elif "quote" in text_content or "rfq" in text_content or "request for quote" in text_content:
-                intent = "rfq"
-            elif "complaint" in text_content or "issue" in text_content or "problem" in text_content:
-                intent = "complaint"
-            elif "regulation" in text_content or "compliance" in text_content or "legal" in text_content:
-                intent = "regulation"
-            elif "inquiry" in text_content or "question" in text_content or "information" in text_content:
-                intent = "inquiry"
-        
-        elif format_type == "email":
-            # For emails, check content
-            if "rfq" in text_content or "request for quote" in text_content or "quotation" in text_content:
-                intent = "rfq"
-            elif "invoice" in text_content or "payment" in text_content or "bill" in text_content:
-                intent = "invoice"
-            elif "complaint" in text_content or "issue" in text_content or "problem" in text_content:
-                intent = "complaint"
-            elif "regulation" in text_content or "compliance" in text_content or "legal" in text_content:
-                intent = "regulation"
-            elif "inquiry" in text_content or "question" in text_content or "information" in text_content:
-                intent = "inquiry"
-        
-        return intent 
\ No newline at end of file
+        # Rule-based approach (fallback): a single keyword scan where the
+        # highest weighted score wins
+        return self.keyword_matcher.classify(text_content, "intent", "unknown")
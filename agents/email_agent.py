@@ -1,25 +1,62 @@
+import asyncio
 import re
+from agents.mime_parser import ParsedEmail, parse_email
 from memory.shared_memory import SharedMemory
 from utils.llm_client import GeminiClient
+from utils.single_flight import SingleFlight, content_key
+from utils.keyword_matcher import KeywordMatcher, get_keyword_matcher
+from utils.metrics import timed, record_event
 
 
 class EmailAgent:
-    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None):
+    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None,
+                 single_flight: SingleFlight = None, keyword_matcher: KeywordMatcher = None):
         self.shared_memory = shared_memory
         self.llm_client = llm_client
+        self.single_flight = single_flight or SingleFlight()
+        self.keyword_matcher = keyword_matcher or get_keyword_matcher()
 
-    async def process(self, email_text, input_id):
-        # Convert bytes to string if needed
-        if isinstance(email_text, bytes):
-            email_text = email_text.decode('utf-8')
+    @timed("email_agent.process")
+    async def process(self, email_text, input_record, llm_result=None, parsed: ParsedEmail = None):
+        """
+        Extract a CRM-style record from an email.
         
-        # Make sure email_text is a string
-        email_text = str(email_text)
+        llm_result may carry metadata already extracted by the classifier's
+        combined prompt, in which case no further LLM call is made. parsed is
+        the email already run through parse_email; otherwise it is parsed
+        here. Only the headers and the cleaned body reach the LLM.
+        """
+        if parsed is None:
+            parsed = await asyncio.to_thread(parse_email, email_text)
+        email_text = parsed.llm_text()
         
+        # Identical emails in flight share one extraction; each caller then
+        # stamps and logs its own copy under its own input id
+        key = content_key("email_agent", email_text, llm_result)
+        crm_record = await self.single_flight.do(key, lambda: self._extract(email_text, llm_result))
+        crm_record = dict(
+            crm_record,
+            body=parsed.body,
+            headers=parsed.headers,
+            attachments=[attachment.descriptor() for attachment in parsed.attachments],
+            processed_at=input_record.timestamp
+        )
+        
+        # Generate conversation_id for this email
+        conversation_id = f"email_{input_record.id}"
+        
+        # Log extracted fields to shared memory
+        await self.shared_memory.log_extracted_fields_async(input_record.id, "email_agent", crm_record, conversation_id)
+        
+        return crm_record
+    
+    async def _extract(self, email_text, llm_result):
+        """Build the CRM record for an email; processed_at is filled in by process()."""
         # Use Gemini for enhanced email extraction if available
         if self.llm_client:
             try:
-                llm_result = await self.llm_client.extract_email_metadata(email_text)
+                if llm_result is None:
+                    llm_result = await self.llm_client.extract_email_metadata(email_text)
                 
                 # Clean up the results for display
                 clean_result = {}
@@ -57,20 +94,15 @@ class EmailAgent:
                     "urgency": clean_result["urgency"],
                     "summary": clean_result["summary"],
                     "body": email_text,
-                    "processed_at": self.shared_memory.get_input_timestamp(input_id),
+                    "processed_at": None,
                     "ai_enhanced": True
                 }
                 
-                # Generate conversation_id for this email
-                conversation_id = f"email_{input_id}"
-                
-                # Log extracted fields to shared memory
-                self.shared_memory.log_extracted_fields(input_id, "email_agent", crm_record, conversation_id)
-                
                 return crm_record
                 
             except Exception as e:
                 print(f"Error using LLM for email extraction: {str(e)}")
+                record_event("llm_fallback")
                 # Fall back to regex extraction
         
         # Fallback: Use regex extraction (original implementation)
@@ -82,23 +114,10 @@ class EmailAgent:
         subject_match = re.search(r"Subject:\s*(.*?)(?:\n|$)", email_text)
         subject = subject_match.group(1).strip() if subject_match else ""
 
-        # Extract intent (simplified example)
-        intent = "unknown"
-        if "RFQ" in email_text or "Request for Quote" in email_text:
-            intent = "rfq"
-        elif "invoice" in email_text.lower() or "payment" in email_text.lower():
-            intent = "invoice"
-        elif "complaint" in email_text.lower() or "issue" in email_text.lower():
-            intent = "complaint"
-        elif "regulation" in email_text.lower() or "compliance" in email_text.lower():
-            intent = "regulation"
-
-        # Extract urgency (simplified example)
-        urgency = "normal"
-        if "URGENT" in email_text.upper() or "ASAP" in email_text.upper():
-            urgency = "high"
-        elif "low priority" in email_text.lower() or "when you have time" in email_text.lower():
-            urgency = "low"
+        # Extract intent and urgency with one keyword scan (weighted scoring)
+        hits = self.keyword_matcher.scan(email_text)
+        intent = self.keyword_matcher.best(hits, "intent", "unknown")
+        urgency = self.keyword_matcher.best(hits, "urgency", "normal")
 
         # Create CRM-style record
         crm_record = {
@@ -107,14 +126,8 @@ class EmailAgent:
             "intent": intent,
             "urgency": urgency,
             "body": email_text,
-            "processed_at": self.shared_memory.get_input_timestamp(input_id),
+            "processed_at": None,
             "ai_enhanced": False
         }
 
-        # Generate conversation_id for this email
-        conversation_id = f"email_{input_id}"
-
-        # Log extracted fields to shared memory
-        self.shared_memory.log_extracted_fields(input_id, "email_agent", crm_record, conversation_id)
-
         return crm_record 
\ No newline at end of file
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import logging
+import os
+import urllib.request
+from urllib.parse import urlparse
+
+from agents.pipeline import IntakePipeline
+from memory.job_queue import JobQueue
+from utils.json_stream import sniff_json_stream
+
+# Worker configuration (overridable per deployment through the environment)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_CALLBACK_TIMEOUT_SECONDS = float(os.environ.get("JOB_CALLBACK_TIMEOUT_SECONDS", "5"))
+
+LOCAL_CALLBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+logger = logging.getLogger(__name__)
+
+
+def is_local_url(url):
+    """Callbacks are only delivered to http(s) URLs on the local host."""
+    parsed = urlparse(url)
+    return parsed.scheme in ("http", "https") and parsed.hostname in LOCAL_CALLBACK_HOSTS
+
+
+def decode_payload(input_type, payload):
+    """Turn a stored job payload back into the pipeline's input_data."""
+    if input_type == "json":
+        text = payload.decode('utf-8')
+        # Arrays and NDJSON stay unparsed so the pipeline can stream them
+        return text if sniff_json_stream(text) else json.loads(text)
+    if input_type == "email":
+        return payload.decode('utf-8')
+    return payload
+
+
+def _post_callback(url, body):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode('utf-8'),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=JOB_CALLBACK_TIMEOUT_SECONDS) as response:
+        return response.status
+
+
+class JobWorkers:
+    """
+    In-process workers draining the job queue through the intake pipeline.
+
+    Workers wake immediately for jobs enqueued by this process and poll for
+    jobs enqueued by other processes sharing the database.
+    """
+
+    def __init__(self, job_queue: JobQueue, pipeline: IntakePipeline, concurrency=JOB_WORKERS,
+                 poll_interval=JOB_POLL_INTERVAL_SECONDS):
+        self.job_queue = job_queue
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wake = asyncio.Event()
+        self._tasks = []
+        self._running = {}
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.concurrency)]
+
+    def notify(self):
+        """Signal that a job was enqueued in this process."""
+        self._wake.set()
+
+    async def stop(self, grace_seconds=10):
+        """Let in-flight jobs finish for a grace period, then hand them back to the queue."""
+        self._stopping = True
+        self._wake.set()
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(self._tasks, timeout=grace_seconds)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for job_id in list(self._running.values()):
+            await asyncio.to_thread(self.job_queue.release, job_id)
+        self._tasks = []
+
+    async def _work(self, worker_index):
+        while not self._stopping:
+            try:
+                job = await asyncio.to_thread(self.job_queue.claim)
+            except Exception as e:
+                logger.warning("Job worker %d failed to claim a job: %s", worker_index, e)
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._running[worker_index] = job["id"]
+            await self._run_job(job)
+            self._running.pop(worker_index, None)
+
+    async def _run_job(self, job):
+        logger.debug("Running job %s (attempt %d)", job["id"], job["attempts"])
+        try:
+            input_data = decode_payload(job["input_type"], job["payload"])
+            renewal = asyncio.create_task(self._renew_lease(job["id"]))
+            try:
+                result = await self.pipeline.run(input_data, job["input_type"], source="job")
+            finally:
+                renewal.cancel()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("Job %s failed: %s", job["id"], e)
+            status = await asyncio.to_thread(self.job_queue.fail, job["id"], str(e), job["attempts"])
+            if status == "failed":
+                await self._callback(job, {"job_id": job["id"], "status": "failed", "error": str(e)})
+            return
+        await asyncio.to_thread(self.job_queue.complete, job["id"], result)
+        await self._callback(job, {"job_id": job["id"], "status": "succeeded", "result": result})
+
+    async def _renew_lease(self, job_id):
+        """Keep a running job's lease alive so only a dead worker lets it expire."""
+        # Renewing three times per lease tolerates a slow or failed renewal
+        interval = self.job_queue.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.job_queue.renew_async(job_id):
+                    logger.warning("Lease of job %s was lost; it may run again elsewhere", job_id)
+                    return
+            except Exception as e:
+                logger.warning("Failed to renew the lease of job %s: %s", job_id, e)
+
+    async def _callback(self, job, body):
+        if not job["callback_url"]:
+            return
+        try:
+            await asyncio.to_thread(_post_callback, job["callback_url"], body)
+        except Exception as e:
+            logger.warning("Callback for job %s to %s failed: %s", job["id"], job["callback_url"], e)
@@ -1,44 +1,209 @@
+import asyncio
 import json
+import logging
 from memory.shared_memory import SharedMemory
 from utils.llm_client import GeminiClient
+from utils.single_flight import SingleFlight, content_key
+from utils.spooled_upload import SpooledUpload
+from utils.json_summary import summarize_json
+from utils.json_stream import JSONStreamOptions, MalformedRecord, iter_records, take
+from utils.llm_scheduler import llm_priority, PRIORITY_BULK
+from utils.metrics import timed, timed_stage, record_event
+
+# Top-level fields every FlowBit document is expected to carry
+REQUIRED_FIELDS = ("id", "timestamp")
+# Record errors listed in a stream result; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+logger = logging.getLogger(__name__)
 
 
 class JSONAgent:
-    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None):
+    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None,
+                 single_flight: SingleFlight = None):
         self.shared_memory = shared_memory
         self.llm_client = llm_client
+        self.single_flight = single_flight or SingleFlight()
 
-    async def process(self, input_data, input_id):
+    @timed("json_agent.process")
+    async def process(self, input_data, input_record, llm_result=None, thread_id=None):
+        """
+        Re-format JSON input to the FlowBit schema with an AI analysis.
+        
+        llm_result may carry an analysis already produced by the classifier's
+        combined prompt, in which case no further LLM call is made. thread_id
+        links the result to a parent input, e.g. the email it was attached to.
+        """
         # Handle different input types
+        if isinstance(input_data, SpooledUpload):
+            input_data = await asyncio.to_thread(input_data.read_bytes)
         if isinstance(input_data, bytes):
             try:
                 input_data = json.loads(input_data.decode('utf-8'))
             except json.JSONDecodeError:
+                record_event("parse_failure")
                 input_data = {"raw": input_data.decode('utf-8', errors='replace')}
         
         elif isinstance(input_data, str):
             try:
                 input_data = json.loads(input_data)
             except json.JSONDecodeError:
+                record_event("parse_failure")
                 input_data = {"raw": input_data}
         
         # Ensure we have a dict at this point
         if not isinstance(input_data, dict):
             input_data = {"raw": str(input_data)}
         
-        # Basic checks for missing required fields
-        missing_fields = []
-        if "id" not in input_data:
-            missing_fields.append("id")
-        if "timestamp" not in input_data:
-            missing_fields.append("timestamp")
+        # Identical documents in flight share one analysis; each caller then
+        # stamps and logs its own copy under its own input id
+        key = content_key("json_agent", input_data, llm_result)
+        flowbit_data = await self.single_flight.do(key, lambda: self._analyze(input_data, llm_result))
+        flowbit_data = dict(flowbit_data)
+        flowbit_data["metadata"] = dict(flowbit_data["metadata"], processed_at=input_record.timestamp)
+
+        # Generate thread_id for this processing (could be a conversation ID or reference number)
+        thread_id = thread_id or f"thread_{input_record.id}"
+
+        # Log extracted fields to shared memory
+        await self.shared_memory.log_extracted_fields_async(input_record.id, "json_agent", flowbit_data, thread_id)
+
+        return flowbit_data
+    
+    @timed("json_agent.process_stream")
+    async def process_stream(self, input_data, input_record, format_type, options: JSONStreamOptions = None,
+                             thread_id=None):
+        """
+        Process a JSON array or NDJSON payload record by record with bounded memory.
+        
+        Every record becomes one extracted_fields row under this input's
+        thread_id. Records are parsed in chunks off the event loop; with
+        options.analyze each also gets the full LLM analysis, at most
+        options.concurrency at a time.
+        
+        Returns:
+            Counts of logged and failed records, with the first errors
+        """
+        options = options or JSONStreamOptions()
+        thread_id = thread_id or f"thread_{input_record.id}"
+        result = {
+            "document_type": format_type,
+            "thread_id": thread_id,
+            "records": 0,
+            "failed": 0,
+            "errors": [],
+            "complete": True,
+            "analyzed": options.analyze,
+            "processed_at": input_record.timestamp
+        }
+        records = iter_records(input_data, format_type)
+        pending = set()
+        reading = None
+        
+        def collect(done):
+            for task in done:
+                error = task.result()
+                if error is None:
+                    result["records"] += 1
+                else:
+                    self._stream_failure(result, *error)
+        
+        try:
+            while True:
+                # Shielded so a cancellation cannot leave the generator running
+                # in its thread while it is closed below
+                reading = asyncio.create_task(asyncio.to_thread(take, records))
+                chunk = await asyncio.shield(reading)
+                if not chunk:
+                    break
+                if not options.analyze:
+                    await asyncio.to_thread(self._log_records, chunk, input_record, thread_id, result)
+                    continue
+                for index, value in chunk:
+                    if isinstance(value, MalformedRecord):
+                        self._malformed_record(result, index, value)
+                        continue
+                    if len(pending) >= options.concurrency:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(asyncio.create_task(self._analyze_record(index, value, input_record, thread_id)))
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                collect(done)
+        finally:
+            for task in pending:
+                task.cancel()
+            if reading is not None and not reading.done():
+                await asyncio.gather(reading, return_exceptions=True)
+            records.close()
+        
+        return result
+    
+    def _malformed_record(self, result, index, malformed):
+        if malformed.line is None:
+            # A malformed array cannot be resynchronized; records before it stand
+            result["complete"] = False
+            self._stream_failure(result, index, malformed.error)
+        else:
+            self._stream_failure(result, index, f"line {malformed.line}: {malformed.error}")
+    
+    def _stream_failure(self, result, index, error):
+        record_event("parse_failure")
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"index": index, "error": error})
+    
+    def _log_records(self, chunk, input_record, thread_id, result):
+        """Log a chunk of records without analysis in one write (runs in a worker thread)."""
+        rows = []
+        for index, value in chunk:
+            if isinstance(value, MalformedRecord):
+                self._malformed_record(result, index, value)
+                continue
+            missing_fields = [field for field in REQUIRED_FIELDS if not isinstance(value, dict) or field not in value]
+            record = {
+                "data": value,
+                "metadata": {
+                    "source": "json_agent",
+                    "processed_at": input_record.timestamp,
+                    "record_index": index,
+                    "missing_fields": missing_fields
+                }
+            }
+            rows.append((input_record.id, "json_agent", record, thread_id))
+        with timed_stage("shared_memory.log_extracted_fields"):
+            self.shared_memory.log_extracted_fields_many(rows)
+        result["records"] += len(rows)
+    
+    async def _analyze_record(self, index, value, input_record, thread_id):
+        """Analyze and log one streamed record; returns (index, error) or None."""
+        # Per-record calls yield to interactive requests; this only changes
+        # the priority inside this task
+        llm_priority.set(PRIORITY_BULK)
+        try:
+            flowbit_data = await self._analyze(value, None)
+            flowbit_data["metadata"] = dict(flowbit_data["metadata"], processed_at=input_record.timestamp,
+                                            record_index=index)
+            await self.shared_memory.log_extracted_fields_async(input_record.id, "json_agent", flowbit_data, thread_id)
+        except Exception as e:
+            logger.debug("Error processing record %d: %s", index, e)
+            return index, str(e)
+        return None
+    
+    async def _analyze(self, input_data, llm_result):
+        """Build the FlowBit record for a document; processed_at is filled in by process()."""
+        # One walk over the document serves both the required-field checks
+        # and the structural summary the LLM sees
+        summary = await asyncio.to_thread(summarize_json, input_data)
+        missing_fields = summary.missing_fields(REQUIRED_FIELDS)
             
         # Use Gemini for enhanced JSON analysis if available
         ai_analysis = None
         if self.llm_client:
             try:
                 # Get AI analysis from Gemini
-                llm_result = await self.llm_client.analyze_json_data(input_data)
+                if llm_result is None:
+                    llm_result = await self.llm_client.analyze_json_data(input_data, summary)
                 
                 # Clean up the results for display
                 clean_result = {}
@@ -61,7 +226,8 @@ class JSONAgent:
                         # For array fields
                         if field in ["main_entities", "key_data_points", "missing_fields", "insights"]:
                             if isinstance(llm_result[field], list) and llm_result[field]:
-                                clean_result[field] = llm_result[field]
+                                # Copy so the caller's llm_result is never mutated below
+                                clean_result[field] = list(llm_result[field])
                             elif isinstance(llm_result[field], str):
                                 clean_result[field] = [llm_result[field]]
                             else:
@@ -104,7 +270,8 @@ class JSONAgent:
                 ai_analysis = clean_result
                 
             except Exception as e:
-                print(f"Error using LLM for JSON analysis: {str(e)}")
+                logger.debug("Error using LLM for JSON analysis: %s", e)
+                record_event("llm_fallback")
                 # Create a fallback analysis with basic information
                 ai_analysis = {
                     "main_entities": ["Data Object"],
@@ -134,7 +301,7 @@ class JSONAgent:
             "data": input_data,
             "metadata": {
                 "source": "json_agent",
-                "processed_at": self.shared_memory.get_input_timestamp(input_id),
+                "processed_at": None,
                 "missing_fields": missing_fields,
                 "ai_enhanced": True  # Always mark as AI enhanced since we always provide analysis
             }
@@ -144,10 +311,4 @@ class JSONAgent:
         flowbit_data["ai_analysis"] = ai_analysis
         flowbit_data["ai_enhanced"] = True
 
-        # Generate thread_id for this processing (could be a conversation ID or reference number)
-        thread_id = f"thread_{input_id}"
-
-        # Log extracted fields to shared memory
-        self.shared_memory.log_extracted_fields(input_id, "json_agent", flowbit_data, thread_id)
-
         return flowbit_data 
\ No newline at end of file
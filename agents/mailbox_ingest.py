@@ -0,0 +1,400 @@
+import asyncio
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterator, NamedTuple, Optional, Union
+
+from agents.pipeline import IntakePipeline
+from memory.group_commit import GroupCommitError
+from utils.spooled_upload import SpooledUpload, UploadTooLargeError, UPLOAD_CHUNK_BYTES
+
+# Messages run through the pipeline at once; reading stays this far ahead
+MAILBOX_CONCURRENCY = int(os.environ.get("MAILBOX_CONCURRENCY", "8"))
+# Completed messages between checkpoint writes (each flushes queued rows first)
+MAILBOX_CHECKPOINT_EVERY = int(os.environ.get("MAILBOX_CHECKPOINT_EVERY", "200"))
+MAILBOX_PROGRESS_SECONDS = float(os.environ.get("MAILBOX_PROGRESS_SECONDS", "10"))
+
+MAILBOX_FORMATS = ("mbox", "maildir", "eml")
+# Source recorded for every ingested message
+MAILBOX_SOURCE = "mailbox"
+# Message errors listed in the summary; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+# mboxrd escapes body lines starting with "From " as ">From ", ">>From ", ...
+MBOX_ESCAPED_FROM_RE = re.compile(rb"^>(>*From )")
+
+
+class MailboxMessage(NamedTuple):
+    """
+    One message read from a mailbox.
+
+    position: Where to resume once this message and all before it are done,
+        the byte offset after it for mbox, its sort key for directories
+    data: The spooled raw message, or None if it could not be read
+    """
+    key: str
+    position: Union[int, str]
+    size_bytes: int
+    data: Optional[SpooledUpload]
+    error: Optional[str] = None
+
+
+class CheckpointMismatchError(Exception):
+    """Raised when a checkpoint was written for another mailbox or no longer fits it."""
+
+
+def detect_mailbox_format(path: str) -> str:
+    """Maildir for a directory with cur/ and new/, .eml directory for other directories, else mbox."""
+    if os.path.isdir(path):
+        if os.path.isdir(os.path.join(path, "cur")) and os.path.isdir(os.path.join(path, "new")):
+            return "maildir"
+        return "eml"
+    return "eml" if path.lower().endswith(".eml") else "mbox"
+
+
+def _spool_file(path: str) -> SpooledUpload:
+    spool = SpooledUpload()
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                spool.write(chunk)
+        spool.finish()
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def iter_mbox(path: str, offset: int = 0) -> Iterator[MailboxMessage]:
+    """
+    Stream the messages of an mbox file from a byte offset, one line at a time.
+
+    A message starts at a "From " line at the start of the file or after a
+    blank line; mboxrd ">From " escapes are undone. Each message is spooled,
+    so memory is bounded by UPLOAD_SPOOL_MEMORY_BYTES per message in flight.
+
+    Raises:
+        CheckpointMismatchError: If offset is not the start of a message
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        line = f.readline()
+        if not line:
+            return
+        if not line.startswith(b"From "):
+            raise CheckpointMismatchError(f"Offset {offset} of {path} is not the start of a message")
+        index = 0
+        while line:
+            start = offset
+            offset += len(line)
+            spool, error, previous_blank = SpooledUpload(), None, False
+            pending_blank = b""
+            try:
+                while True:
+                    line = f.readline()
+                    if not line or (previous_blank and line.startswith(b"From ")):
+                        break
+                    offset += len(line)
+                    previous_blank = not line.strip()
+                    if error is not None:
+                        # Oversized message: skip to the next separator
+                        continue
+                    try:
+                        # The blank line before the next separator is not part of the message
+                        if pending_blank:
+                            spool.write(pending_blank)
+                            pending_blank = b""
+                        if previous_blank:
+                            pending_blank = line
+                        else:
+                            spool.write(MBOX_ESCAPED_FROM_RE.sub(rb"\1", line))
+                    except UploadTooLargeError as e:
+                        error = str(e)
+                spool.finish()
+            except BaseException:
+                spool.close()
+                raise
+            if error is not None:
+                spool.close()
+                spool = None
+            yield MailboxMessage(f"{os.path.basename(path)}#{index}@{start}", offset, offset - start, spool, error)
+            index += 1
+
+
+def _iter_files(paths, after: Optional[str]) -> Iterator[MailboxMessage]:
+    """Spool files from sorted (key, path) pairs, skipping keys up to after."""
+    for key, path in paths:
+        if after is not None and key <= after:
+            continue
+        try:
+            data, error = _spool_file(path), None
+        except FileNotFoundError:
+            # Moved or deleted by a mail client since the listing
+            data, error = None, "message file disappeared"
+        except UploadTooLargeError as e:
+            data, error = None, str(e)
+        yield MailboxMessage(key, key, len(data) if data else 0, data, error)
+
+
+def iter_maildir(path: str, after: Optional[str] = None) -> Iterator[MailboxMessage]:
+    """
+    Stream the messages in a Maildir's new/ and cur/ by unique name.
+
+    Names are compared without their ":2,<flags>" suffix, so flag changes
+    and moves from new/ to cur/ do not reorder messages.
+    """
+    paths = []
+    for folder in ("new", "cur"):
+        directory = os.path.join(path, folder)
+        for name in os.listdir(directory):
+            if not name.startswith("."):
+                paths.append((name.split(":", 1)[0], os.path.join(directory, name)))
+    return _iter_files(sorted(paths), after)
+
+
+def iter_eml(path: str, after: Optional[str] = None) -> Iterator[MailboxMessage]:
+    """Stream a single .eml file, or every .eml file under a directory by relative path."""
+    if not os.path.isdir(path):
+        return _iter_files([(os.path.basename(path), path)], after)
+    paths = []
+    for root, directories, files in os.walk(path):
+        directories.sort()
+        for name in files:
+            if name.lower().endswith(".eml"):
+                full_path = os.path.join(root, name)
+                paths.append((os.path.relpath(full_path, path).replace(os.sep, "/"), full_path))
+    return _iter_files(sorted(paths), after)
+
+
+def iter_messages(path: str, format: str, position=None) -> Iterator[MailboxMessage]:
+    """Messages of a mailbox in order, starting after a checkpointed position."""
+    if format == "mbox":
+        return iter_mbox(path, position or 0)
+    if format == "maildir":
+        return iter_maildir(path, position)
+    if format == "eml":
+        return iter_eml(path, position)
+    raise ValueError(f"Unsupported mailbox format: {format}")
+
+
+def load_checkpoint(checkpoint_path: str, source: str, format: str) -> Optional[Dict]:
+    """
+    Read the checkpoint for this mailbox, or None if there is none yet.
+
+    Raises:
+        CheckpointMismatchError: If it was written for another mailbox
+    """
+    try:
+        with open(checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    if checkpoint.get("source") != os.path.abspath(source) or checkpoint.get("format") != format:
+        raise CheckpointMismatchError(
+            f"{checkpoint_path} belongs to {checkpoint.get('format')} {checkpoint.get('source')}"
+        )
+    return checkpoint
+
+
+class MailboxIngester:
+    """
+    Feed the messages of an mbox, Maildir or .eml directory through the intake
+    pipeline with bounded concurrency.
+
+    Messages are read ahead only as far as the concurrency allows, so an
+    archive of any size is processed in constant memory. The pipeline should
+    write through a group-commit SharedMemory; before each checkpoint the
+    queued rows are flushed, so a checkpoint never covers uncommitted work.
+    The checkpoint holds the position up to which every message has finished;
+    resuming from it may re-process the messages that were in flight.
+    """
+
+    def __init__(self, pipeline: IntakePipeline, source: str, format: str = None, checkpoint_path: str = None,
+                 concurrency: int = MAILBOX_CONCURRENCY, checkpoint_every: int = MAILBOX_CHECKPOINT_EVERY,
+                 progress_seconds: float = MAILBOX_PROGRESS_SECONDS):
+        self.pipeline = pipeline
+        self.source = source
+        self.format = format or detect_mailbox_format(source)
+        if self.format not in MAILBOX_FORMATS:
+            raise ValueError(f"Unsupported mailbox format: {self.format}")
+        self.checkpoint_path = checkpoint_path or source.rstrip("/\\") + ".checkpoint.json"
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.progress_seconds = progress_seconds
+        self.total_bytes = os.path.getsize(source) if self.format == "mbox" else None
+
+        # Completion watermark: sequence numbers finish out of order, the
+        # checkpoint only advances over an unbroken run of finished ones
+        self._positions: Dict[int, Union[int, str]] = {}
+        self._finished = set()
+        self._next_sequence = 0
+        self._watermark_sequence = 0
+        self.position = None
+        self._checkpointed_at = 0
+        self._checkpoint_lock = asyncio.Lock()
+
+        self.messages = 0
+        self.failed = 0
+        self.attachments = 0
+        self.bytes = 0
+        self.errors = []
+        self.commit_error = None
+        self._started = None
+        self._resumed_messages = 0
+
+    async def run(self, limit: int = None, restart: bool = False) -> Dict:
+        """
+        Ingest the mailbox, resuming from the checkpoint unless restart is set.
+
+        Args:
+            limit: Stop after reading this many messages
+            restart: Ignore an existing checkpoint and start from the beginning
+
+        Returns:
+            The summary (see summary())
+        """
+        checkpoint = None if restart else load_checkpoint(self.checkpoint_path, self.source, self.format)
+        if checkpoint:
+            self.position = checkpoint["position"]
+            self._resumed_messages = checkpoint.get("messages", 0)
+            print(f"Resuming {self.source} from {self.format} position {self.position!r} "
+                  f"({self._resumed_messages} messages already ingested)")
+        # Directory listings can be large, so even building the iterator happens off the loop
+        messages = await asyncio.to_thread(iter_messages, self.source, self.format, self.position)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        self._started = time.perf_counter()
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            read = 0
+            while limit is None or read < limit:
+                await semaphore.acquire()
+                message = await asyncio.to_thread(next, messages, None)
+                if message is None:
+                    semaphore.release()
+                    break
+                read += 1
+                task = asyncio.create_task(self._ingest(self._track(message.position), message))
+                tasks.add(task)
+                task.add_done_callback(lambda done: (tasks.discard(done), semaphore.release()))
+            await asyncio.gather(*tasks)
+        finally:
+            reporter.cancel()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(reporter, *tasks, return_exceptions=True)
+            try:
+                messages.close()
+            except (AttributeError, ValueError):
+                # Plain iterators, or a generator still running in its thread
+                pass
+            await self.save_checkpoint()
+        return self.summary()
+
+    def _track(self, position) -> int:
+        sequence = self._next_sequence
+        self._next_sequence += 1
+        self._positions[sequence] = position
+        return sequence
+
+    def _finish(self, sequence):
+        self._finished.add(sequence)
+        while self._watermark_sequence in self._finished:
+            self._finished.remove(self._watermark_sequence)
+            self.position = self._positions.pop(self._watermark_sequence)
+            self._watermark_sequence += 1
+
+    async def _ingest(self, sequence, message: MailboxMessage):
+        try:
+            if message.data is None:
+                raise ValueError(message.error)
+            result = await self.pipeline.run(message.data, "email", source=MAILBOX_SOURCE)
+            self.attachments += sum(1 for attachment in result.get("attachment_results", [])
+                                    if attachment["status"] == "processed")
+        except Exception as e:
+            print(f"Error ingesting message {message.key}: {str(e)}")
+            self.failed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({"message": message.key, "error": str(e)})
+        else:
+            self.messages += 1
+        finally:
+            if message.data is not None:
+                message.data.close()
+        # Cancelled messages are not finished, so the checkpoint stops before them
+        self.bytes += message.size_bytes
+        self._finish(sequence)
+        if self._watermark_sequence - self._checkpointed_at >= self.checkpoint_every:
+            await self.save_checkpoint(self.checkpoint_every)
+
+    async def save_checkpoint(self, min_messages: int = 0):
+        """
+        Commit queued rows, then atomically record the position reached.
+
+        Args:
+            min_messages: Skip the write unless this many messages finished since the last one
+        """
+        async with self._checkpoint_lock:
+            if min_messages and self._watermark_sequence - self._checkpointed_at < min_messages:
+                return
+            if self.commit_error:
+                # Rows were lost after the last checkpoint; resuming must redo them
+                return
+            sequence, position = self._watermark_sequence, self.position
+            try:
+                await asyncio.to_thread(self.pipeline.shared_memory.flush)
+            except GroupCommitError as e:
+                self.commit_error = str(e)
+                raise
+            checkpoint = {
+                "source": os.path.abspath(self.source),
+                "format": self.format,
+                "position": position,
+                "messages": self._resumed_messages + sequence,
+                "updated_at": datetime.now().isoformat()
+            }
+            temporary_path = self.checkpoint_path + ".tmp"
+            with open(temporary_path, "w", encoding='utf-8') as f:
+                json.dump(checkpoint, f)
+            os.replace(temporary_path, self.checkpoint_path)
+            self._checkpointed_at = sequence
+
+    def summary(self) -> Dict:
+        """Counts, throughput and the checkpointed position of this run."""
+        seconds = time.perf_counter() - self._started if self._started else 0.0
+        done = self.messages + self.failed
+        summary = {
+            "source": self.source,
+            "format": self.format,
+            "messages": self.messages,
+            "failed": self.failed,
+            "attachments": self.attachments,
+            "bytes": self.bytes,
+            "seconds": round(seconds, 3),
+            "messages_per_second": round(done / seconds, 2) if seconds else 0.0,
+            "mb_per_second": round(self.bytes / 2 ** 20 / seconds, 3) if seconds else 0.0,
+            "position": self.position,
+            "errors": self.errors,
+            "commit_error": self.commit_error
+        }
+        if self.total_bytes and isinstance(self.position, int):
+            summary["percent"] = round(100.0 * self.position / self.total_bytes, 2)
+        return summary
+
+    def format_progress(self) -> str:
+        summary = self.summary()
+        line = (f"{summary['messages'] + summary['failed']} messages ({summary['failed']} failed, "
+                f"{summary['attachments']} attachments)  {summary['messages_per_second']:.1f} msg/s  "
+                f"{summary['mb_per_second']:.2f} MB/s")
+        if "percent" in summary:
+            line += f"  {summary['percent']:.1f}% of {self.total_bytes / 2 ** 20:.1f} MB"
+        return line
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_seconds)
+            print(f"[mailbox] {self.format_progress()}", flush=True)
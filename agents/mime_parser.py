@@ -0,0 +1,237 @@
+import base64
+import binascii
+import html
+import os
+import re
+from email import policy
+from email.parser import BytesFeedParser, FeedParser
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from utils.spooled_upload import SpooledUpload, SNIFF_BYTES, UPLOAD_CHUNK_BYTES
+
+# Attachments larger than this are described but not routed to an agent
+EMAIL_ATTACHMENT_MAX_BYTES = int(os.environ.get("EMAIL_ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+
+# Source recorded for inputs created from email attachments
+ATTACHMENT_SOURCE = "email_attachment"
+# Headers kept in the parsed record, by their key in ParsedEmail.headers
+HEADER_FIELDS = (
+    ("from", "From"),
+    ("to", "To"),
+    ("cc", "Cc"),
+    ("date", "Date"),
+    ("subject", "Subject"),
+    ("message_id", "Message-ID"),
+    ("in_reply_to", "In-Reply-To")
+)
+# A header block at the very start of the input marks it as an email
+EMAIL_HEADER_RE = re.compile(
+    rb"^(?:From|To|Subject|Date|Received|Return-Path|Delivered-To|MIME-Version|Message-ID|Reply-To|X-[\w-]+):",
+    re.IGNORECASE
+)
+# Lines starting a quoted earlier message; everything from there on is dropped
+REPLY_HEADER_RE = re.compile(
+    r"^(?:On .{1,300} wrote:|-{2,} ?Original Message ?-{2,}|-{2,} ?Forwarded message ?-{2,}|_{10,}|"
+    r"From: .+\n(?:(?:Sent|Date|To|Cc|Subject): .*\n?){1,4})",
+    re.IGNORECASE | re.MULTILINE
+)
+# RFC 3676 signature separator and common mobile sign-offs
+SIGNATURE_RE = re.compile(r"^(?:-- ?|Sent from my \w+.*|Get Outlook for \w+.*)$", re.MULTILINE)
+HTML_DROP_RE = re.compile(r"<(script|style|head)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+HTML_BREAK_RE = re.compile(r"<(?:br|/p|/div|/tr|/li|/h\d)\b[^>]*>", re.IGNORECASE)
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+BLANK_LINES_RE = re.compile(r"\n\s*\n(?:\s*\n)+")
+
+
+class EmailAttachment(NamedTuple):
+    """
+    An attachment of a parsed email.
+
+    format: "pdf" or "json" when an agent can process it, else None
+    payload: The decoded bytes, or None when over EMAIL_ATTACHMENT_MAX_BYTES
+    """
+    filename: str
+    content_type: str
+    size_bytes: int
+    format: Optional[str]
+    payload: Optional[bytes]
+
+    def descriptor(self) -> Dict:
+        return {
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size_bytes": self.size_bytes,
+            "format": self.format
+        }
+
+
+class ParsedEmail(NamedTuple):
+    """
+    Headers, readable body and attachments of an email.
+
+    body: The decoded text body with quoted replies and signature removed
+    """
+    headers: Dict[str, str]
+    body: str
+    attachments: List[EmailAttachment]
+
+    def llm_text(self) -> str:
+        """The headers, body and attachment list as sent to the LLM."""
+        lines = [f"{name}: {self.headers[key]}" for key, name in HEADER_FIELDS[:5] if self.headers.get(key)]
+        if self.attachments:
+            names = ", ".join(f"{attachment.filename} ({attachment.content_type})" for attachment in self.attachments)
+            lines.append(f"Attachments: {names}")
+        return "\n".join(lines) + "\n\n" + self.body if lines else self.body
+
+
+def looks_like_email(head: bytes) -> bool:
+    """Check whether a payload starts with an RFC 5322 header block."""
+    return bool(EMAIL_HEADER_RE.match(head.lstrip(b"\r\n")))
+
+
+def strip_quotes_and_signature(text: str) -> str:
+    """Remove quoted earlier messages, '>' quote lines and the signature from a reply."""
+    match = REPLY_HEADER_RE.search(text)
+    if match and match.start() > 0:
+        text = text[:match.start()]
+    lines = [line for line in text.split("\n") if not line.startswith(">")]
+    text = "\n".join(lines)
+    match = SIGNATURE_RE.search(text)
+    if match and match.start() > 0:
+        text = text[:match.start()]
+    return BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def html_to_text(markup: str) -> str:
+    text = HTML_DROP_RE.sub("", markup)
+    text = HTML_BREAK_RE.sub("\n", text)
+    text = html.unescape(HTML_TAG_RE.sub("", text))
+    return "\n".join(line.strip() for line in text.split("\n"))
+
+
+def attachment_format(content_type: str, filename: str, payload: bytes) -> Optional[str]:
+    """Pick the agent for an attachment from its type, name and first bytes."""
+    name = filename.lower()
+    if content_type == "application/pdf" or name.endswith(".pdf") or payload.startswith(b"%PDF"):
+        return "pdf"
+    if content_type in ("application/json", "application/x-ndjson") or name.endswith((".json", ".ndjson")):
+        return "json"
+    return None
+
+
+def _text_content(part) -> str:
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeError, AssertionError):
+        # Unknown or lying charset
+        payload = part.get_payload(decode=True) or b""
+        return payload.decode('utf-8', errors='replace')
+
+
+def _header(message, name) -> str:
+    try:
+        value = message.get(name)
+    except (IndexError, ValueError, TypeError):
+        # Headers the parser cannot model are kept raw
+        value = message.get_all(name, [""])[0] if hasattr(message, "get_all") else ""
+    return " ".join(str(value).split()) if value else ""
+
+
+def _feed(parser, source):
+    if isinstance(source, SpooledUpload):
+        with source.open() as f:
+            first = True
+            while True:
+                chunk = f.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                parser.feed(chunk.lstrip(b"\r\n") if first else chunk)
+                first = False
+    elif isinstance(source, bytes):
+        parser.feed(source.lstrip(b"\r\n"))
+    else:
+        parser.feed(str(source).lstrip("\r\n"))
+    return parser.close()
+
+
+def _encoded_size(part) -> Tuple[int, bytes]:
+    """
+    Estimate an attachment's decoded size from its encoded payload, and decode
+    just its first bytes, without decoding the whole attachment.
+    """
+    encoded = part.get_payload()
+    if not isinstance(encoded, str):
+        return 0, b""
+    encoding = part.get("Content-Transfer-Encoding", "").strip().lower()
+    if encoding != "base64":
+        return len(encoded), encoded[:8].encode('latin-1', errors='replace')
+    data_chars = len(encoded) - encoded.count("\n") - encoded.count("\r") - encoded.count(" ")
+    try:
+        head = base64.b64decode("".join(encoded[:64].split())[:12])
+    except (binascii.Error, ValueError):
+        head = b""
+    padding = len(encoded.rstrip()) - len(encoded.rstrip().rstrip("="))
+    return data_chars * 3 // 4 - padding, head
+
+
+def parse_email(source, max_attachment_bytes: int = EMAIL_ATTACHMENT_MAX_BYTES) -> ParsedEmail:
+    """
+    Parse an email with the stdlib parser, fed incrementally from uploads.
+
+    Input that does not start with a recognised header block is taken as a
+    bare body, so a first line like "Note: ..." is not read as a header.
+
+    Args:
+        source: SpooledUpload, bytes or str
+        max_attachment_bytes: Larger attachments are described without payload
+
+    Returns:
+        The ParsedEmail
+    """
+    if isinstance(source, SpooledUpload):
+        head = source.head()
+    elif isinstance(source, bytes):
+        head = source[:SNIFF_BYTES]
+    else:
+        source = str(source)
+        head = source[:SNIFF_BYTES].encode('utf-8', errors='ignore')
+    if not looks_like_email(head):
+        text = source.read_text() if isinstance(source, SpooledUpload) else source
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', errors='replace')
+        return ParsedEmail({key: "" for key, _ in HEADER_FIELDS}, strip_quotes_and_signature(text.replace("\r\n", "\n")), [])
+
+    parser = FeedParser(policy=policy.default) if isinstance(source, str) else BytesFeedParser(policy=policy.default)
+    message = _feed(parser, source)
+    headers = {key: _header(message, name) for key, name in HEADER_FIELDS}
+
+    plain, markup, attachments = [], [], []
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        content_type = part.get_content_type()
+        disposition = part.get_content_disposition()
+        filename = part.get_filename() or ""
+        if disposition != "attachment" and not filename and content_type in ("text/plain", "text/html"):
+            (plain if content_type == "text/plain" else markup).append(_text_content(part))
+            continue
+        if content_type == "message/rfc822" or part.get_content_maintype() == "multipart":
+            continue
+        estimated_bytes, head = _encoded_size(part)
+        if estimated_bytes > max_attachment_bytes:
+            # Described from the encoded payload; decoding would hold it in memory twice
+            size_bytes, payload = estimated_bytes, None
+        else:
+            payload = part.get_payload(decode=True) or b""
+            size_bytes, head = len(payload), payload[:8]
+        attachments.append(EmailAttachment(
+            filename=filename or f"attachment-{len(attachments) + 1}",
+            content_type=content_type,
+            size_bytes=size_bytes,
+            format=attachment_format(content_type, filename, head),
+            payload=payload if payload is not None and len(payload) <= max_attachment_bytes else None
+        ))
+
+    text = "\n\n".join(plain) if plain else "\n\n".join(html_to_text(markup_part) for markup_part in markup)
+    return ParsedEmail(headers, strip_quotes_and_signature(text.replace("\r\n", "\n")), attachments)
+
@@ -1,94 +1,92 @@
+import asyncio
 from memory.shared_memory import SharedMemory
 from utils.llm_client import GeminiClient
-import re
-import io
-import PyPDF2
+from agents.pdf_parser import PDFParserPool, PDFOptions, parse_pdf, PARSE_FAILURE_PREFIX
+from agents.pdf_probe import probe_pdf
+from utils.single_flight import SingleFlight, content_key
+from utils.spooled_upload import SpooledUpload
+from utils.metrics import timed, record_event
 
 class PDFAgent:
-    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None):
+    def __init__(self, shared_memory: SharedMemory, llm_client: GeminiClient = None,
+                 parser_pool: PDFParserPool = None, single_flight: SingleFlight = None):
         self.shared_memory = shared_memory
         self.llm_client = llm_client
+        self.parser_pool = parser_pool
+        self.single_flight = single_flight or SingleFlight()
 
-    async def process(self, pdf_data, input_id):
+    @timed("pdf_agent.process")
+    async def process(self, pdf_data, input_record, options: PDFOptions = None, thread_id=None):
         """
         Process a PDF file and extract text content and metadata.
         If Gemini is available, it will be used for enhanced analysis.
+        
+        options controls the page range and text budget (see PDFOptions); with
+        options.metadata_only only the trailer is read and the LLM is skipped.
+        thread_id links the record to a parent input instead of its own id.
         """
-        # PDF metadata and content extraction
-        pdf_text = ""
-        extracted_text = ""
-        pdf_version = "Unknown"
-        title = "Untitled"
-        page_count = 0
+        options = options or PDFOptions()
         
+        # Identical PDFs in flight share one parse and analysis; each caller
+        # then stamps and logs its own copy under its own input id
+        key = content_key("pdf_agent", pdf_data, list(options))
+        pdf_record = await self.single_flight.do(key, lambda: self._analyze(pdf_data, options))
+        pdf_record = dict(pdf_record, processed_at=input_record.timestamp)
+
+        # Generate a document ID for this PDF
+        document_id = thread_id or f"pdf_{input_record.id}"
+
+        # Log extracted fields to shared memory
+        await self.shared_memory.log_extracted_fields_async(input_record.id, "pdf_agent", pdf_record, document_id)
+
+        return pdf_record
+
+    async def _analyze(self, pdf_data, options):
+        """Build the PDF record; processed_at is filled in by process()."""
+        # PDF metadata and content extraction happens in the parser pool so
+        # PyPDF2 never blocks the event loop
+        # Spooled uploads are handed over by path so the bytes never have to
+        # be loaded into this process or pickled to a worker; an in-memory
+        # spool is written out in a worker thread
+        if options.metadata_only:
+            return await self._metadata_record(pdf_data, options)
+
+        source = await asyncio.to_thread(pdf_data.ensure_file) if isinstance(pdf_data, SpooledUpload) else pdf_data
         try:
-            # Create a PDF file reader object
-            pdf_file = io.BytesIO(pdf_data)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            
-            # Get page count
-            page_count = len(pdf_reader.pages)
-            
-            # Extract text from the first few pages (limit to 5 pages to avoid memory issues)
-            max_pages = min(5, page_count)
-            extracted_text = ""
-            for i in range(max_pages):
-                page = pdf_reader.pages[i]
-                page_text = page.extract_text()
-                if page_text:
-                    extracted_text += f"--- Page {i+1} ---\n{page_text}\n\n"
-            
-            # If we couldn't extract text or it's too short, indicate that
-            if not extracted_text or len(extracted_text.strip()) < 50:
-                extracted_text = "The PDF appears to contain mainly images or non-extractable content."
-            
-            # Truncate if it's too long (for display purposes)
-            if len(extracted_text) > 5000:
-                extracted_text = extracted_text[:5000] + "... (content truncated)"
-            
-            # Get PDF version from metadata if available
-            try:
-                if pdf_reader.pdf_header:
-                    version_match = re.search(r'%PDF-(\d+\.\d+)', pdf_reader.pdf_header)
-                    if version_match:
-                        pdf_version = version_match.group(1)
-            except:
-                # Fallback to regex on raw data for version extraction
-                sample = pdf_data[:1000].decode('utf-8', errors='ignore')
-                version_match = re.search(r'%PDF-(\d+\.\d+)', sample)
-                pdf_version = version_match.group(1) if version_match else "Unknown"
-            
-            # Try to get title from document info
-            try:
-                if pdf_reader.metadata:
-                    if pdf_reader.metadata.get('/Title'):
-                        title = pdf_reader.metadata.get('/Title')
-            except:
-                # Fallback to regex for title extraction
-                title_match = re.search(r'/Title\s*\(([^)]+)\)', pdf_data[:2000].decode('utf-8', errors='ignore'))
-                title = title_match.group(1) if title_match else "Untitled"
-            
-            # Get approximate size
-            size_kb = len(pdf_data) / 1024
-            
-            pdf_text = f"PDF document (version {pdf_version}), {page_count} pages, size: {size_kb:.1f} KB"
-            
+            if self.parser_pool:
+                parsed = await self.parser_pool.parse(source, options)
+            else:
+                parsed = await asyncio.to_thread(parse_pdf, source, options)
         except Exception as e:
-            pdf_text = f"Unable to extract PDF content: {str(e)}"
-            extracted_text = "Failed to extract text content from this PDF file."
-            pdf_version = "Unknown"
-            title = "Unknown"
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            parsed = {
+                "version": "Unknown",
+                "title": "Unknown",
+                "page_count": 0,
+                "content_preview": f"{PARSE_FAILURE_PREFIX}: {reason}",
+                "extracted_text": "Failed to extract text content from this PDF file.",
+                "pages_extracted": [],
+                "page_timings": []
+            }
+        
+        pdf_text = parsed["content_preview"]
+        if pdf_text.startswith(PARSE_FAILURE_PREFIX):
+            record_event("parse_failure")
+        extracted_text = parsed["extracted_text"]
+        page_count = parsed["page_count"]
         
         # Create structured output
         pdf_record = {
             "document_type": "pdf",
             "size_bytes": len(pdf_data),
-            "version": pdf_version,
-            "title": title,
+            "version": parsed["version"],
+            "title": parsed["title"],
             "page_count": page_count,
             "content_preview": pdf_text,
             "extracted_text": extracted_text,
-            "processed_at": self.shared_memory.get_input_timestamp(input_id),
+            "pages_extracted": parsed["pages_extracted"],
+            "page_timings": parsed["page_timings"],
+            "processed_at": None,
             "ai_enhanced": False
         }
         
@@ -158,11 +156,44 @@ class PDFAgent:
                     
             except Exception as e:
                 print(f"Error using LLM for PDF analysis: {str(e)}")
+                record_event("llm_fallback")
 
-        # Generate a document ID for this PDF
-        document_id = f"pdf_{input_id}"
+        return pdf_record 
 
-        # Log extracted fields to shared memory
-        self.shared_memory.log_extracted_fields(input_id, "pdf_agent", pdf_record, document_id)
+    async def _metadata_record(self, pdf_data, options):
+        """
+        Build a record from the header and trailer alone, without extracting
+        text. Falls back to a parse without text extraction when the probe
+        cannot decode the cross-reference data.
+        """
+        probed = await asyncio.to_thread(probe_pdf, pdf_data)
+        if not probed["complete"]:
+            source = await asyncio.to_thread(pdf_data.ensure_file) if isinstance(pdf_data, SpooledUpload) else pdf_data
+            try:
+                if self.parser_pool:
+                    parsed = await self.parser_pool.run(parse_pdf, source, options, False)
+                else:
+                    parsed = await asyncio.to_thread(parse_pdf, source, options, False)
+                probed["page_count"] = parsed["page_count"]
+                probed["title"] = probed["title"] or parsed["title"]
+            except Exception as e:
+                print(f"Error reading PDF metadata: {str(e)}")
+                record_event("parse_failure")
+                probed["page_count"] = 0
 
-        return pdf_record 
\ No newline at end of file
+        return {
+            "document_type": "pdf",
+            "size_bytes": len(pdf_data),
+            "version": probed["version"],
+            "title": probed["title"] or "Untitled",
+            "page_count": probed["page_count"],
+            "encrypted": probed["encrypted"],
+            "linearized": probed["linearized"],
+            "content_preview": f"PDF document (version {probed['version']}), {probed['page_count']} pages, "
+                               f"size: {len(pdf_data) / 1024:.1f} KB",
+            "extracted_text": "",
+            "pages_extracted": [],
+            "page_timings": [],
+            "processed_at": None,
+            "ai_enhanced": False
+        }
@@ -0,0 +1,535 @@
+import asyncio
+import io
+import itertools
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+from collections import deque
+from typing import NamedTuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Pool configuration (overridable per deployment through the environment)
+PDF_POOL_WORKERS = int(os.environ.get("PDF_POOL_WORKERS", str(os.cpu_count() or 2)))
+PDF_PARSE_TIMEOUT_SECONDS = float(os.environ.get("PDF_PARSE_TIMEOUT_SECONDS", "30"))
+PDF_POOL_MAX_JOBS_PER_WORKER = int(os.environ.get("PDF_POOL_MAX_JOBS_PER_WORKER", "50"))
+
+# Text extraction defaults; each can be overridden per request through PDFOptions
+PDF_TEXT_CHAR_BUDGET = int(os.environ.get("PDF_TEXT_CHAR_BUDGET", "5000"))
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", "0"))
+PDF_PAGE_STRATEGY = os.environ.get("PDF_PAGE_STRATEGY", "sequential")
+PDF_SAMPLE_PAGES = int(os.environ.get("PDF_SAMPLE_PAGES", "5"))
+PDF_PAGE_TIMEOUT_SECONDS = float(os.environ.get("PDF_PAGE_TIMEOUT_SECONDS", "5"))
+PDF_PARALLEL = os.environ.get("PDF_PARALLEL", "0") in ("1", "true", "yes")
+PDF_PARALLEL_CHUNK_PAGES = int(os.environ.get("PDF_PARALLEL_CHUNK_PAGES", "8"))
+
+# Start of content_preview when a PDF could not be parsed
+PARSE_FAILURE_PREFIX = "Unable to extract PDF content"
+
+PAGE_STRATEGIES = ("sequential", "sample")
+if PDF_PAGE_STRATEGY not in PAGE_STRATEGIES:
+    raise ValueError(f"Unsupported PDF_PAGE_STRATEGY: {PDF_PAGE_STRATEGY}")
+
+
+class PDFOptions(NamedTuple):
+    """
+    How much of a PDF to extract.
+
+    char_budget: Stop extracting once this many characters have been collected
+    first_page / last_page: 1-based inclusive page range (None = document bounds)
+    max_pages: Upper bound on pages extracted, 0 for no limit besides the budget
+    strategy: "sequential" reads pages in order; "sample" spreads the budget
+        over sample_pages pages taken first, last, middle, then bisecting
+    sample_pages: Pages read by the "sample" strategy
+    parallel: Split the selected pages into chunks extracted by several pool
+        workers at once (only applies when parsing through PDFParserPool)
+    page_timeout: Seconds a single page may take before it is skipped
+    metadata_only: Skip text extraction and LLM analysis; version, page count
+        and title come from the trailer/xref probe (agents.pdf_probe)
+    """
+    char_budget: int = PDF_TEXT_CHAR_BUDGET
+    first_page: Optional[int] = None
+    last_page: Optional[int] = None
+    max_pages: int = PDF_MAX_PAGES
+    strategy: str = PDF_PAGE_STRATEGY
+    sample_pages: int = PDF_SAMPLE_PAGES
+    parallel: bool = PDF_PARALLEL
+    page_timeout: float = PDF_PAGE_TIMEOUT_SECONDS
+    metadata_only: bool = False
+
+
+class PageTimeoutError(Exception):
+    """Raised inside a worker when one page exceeds the per-page timeout."""
+
+
+class JobTimeoutError(BaseException):
+    """
+    Raised inside a worker when a whole pool job exceeds its deadline.
+
+    A BaseException, so the generic error handling of the parser and of
+    PyPDF2 cannot swallow it and keep the job running.
+    """
+
+
+# Worker-side job deadline state; only touched inside pool worker processes
+_job_lock = threading.Lock()
+_active_job = None
+_expired_job = None
+# Queue on which a worker reports the job it is killed for, set by _init_worker
+_killed_jobs = None
+# A job still running this long after its deadline is stuck outside Python
+# code (where the interrupt cannot reach it), and its worker exits
+JOB_KILL_GRACE_SECONDS = 10
+
+
+def _interrupt_job(signum, frame):
+    if _active_job is not None and _active_job is _expired_job:
+        raise JobTimeoutError()
+
+
+def _init_worker(killed_jobs):
+    global _killed_jobs
+    _killed_jobs = killed_jobs
+
+
+def _expire_job(job, main_thread_id, kill):
+    global _expired_job
+    with _job_lock:
+        if _active_job is not job:
+            return
+        if kill:
+            # Tell the parent which job broke the pool so it is not retried
+            if _killed_jobs is not None:
+                _killed_jobs.put(job)
+            os._exit(1)
+        _expired_job = job
+    signal.pthread_kill(main_thread_id, signal.SIGUSR1)
+
+
+def run_job(func, args, timeout, job_id=None):
+    """
+    Run func(*args) in a pool worker under a deadline that starts when the
+    job starts, so time spent queued for a worker does not count.
+
+    At the deadline the job is interrupted with JobTimeoutError and the
+    worker stays available for other jobs; a job that cannot be interrupted
+    makes its worker report job_id and exit JOB_KILL_GRACE_SECONDS later.
+    """
+    global _active_job
+    job = object() if job_id is None else job_id
+    timers = []
+    if timeout and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, _interrupt_job)
+        main_thread_id = threading.get_ident()
+        timers = [
+            threading.Timer(timeout, _expire_job, (job, main_thread_id, False)),
+            threading.Timer(timeout + JOB_KILL_GRACE_SECONDS, _expire_job, (job, main_thread_id, True))
+        ]
+    with _job_lock:
+        _active_job = job
+    for timer in timers:
+        timer.daemon = True
+        timer.start()
+    try:
+        return func(*args)
+    finally:
+        with _job_lock:
+            _active_job = None
+        for timer in timers:
+            timer.cancel()
+
+
+def _open_source(source):
+    """
+    Return a readable buffer and the size for raw PDF bytes or a file path.
+    Files are memory-mapped, so only the pages actually parsed are read in.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size
+        return io.BytesIO(b""), 0
+    return io.BytesIO(source), len(source)
+
+
+def sample_order(first, last):
+    """Yield page indexes first, last, middle, then the midpoints of the remaining gaps."""
+    yield first
+    if last == first:
+        return
+    yield last
+    gaps = deque([(first, last)])
+    while gaps:
+        low, high = gaps.popleft()
+        if high - low < 2:
+            continue
+        middle = (low + high) // 2
+        yield middle
+        gaps.append((low, middle))
+        gaps.append((middle, high))
+
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeoutError()
+
+
+def extract_page(pdf_reader, index, timeout):
+    """
+    Extract the text of one page, giving up after timeout seconds.
+
+    The timeout uses SIGALRM, so it only applies on the main thread of a
+    process (as in pool workers); elsewhere pages run unbounded.
+
+    Returns:
+        Tuple of text, elapsed milliseconds and status ("ok", "timeout" or "error")
+    """
+    use_alarm = timeout and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    started = time.perf_counter()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_page_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        text, status = pdf_reader.pages[index].extract_text() or "", "ok"
+    except PageTimeoutError:
+        text, status = "", "timeout"
+    except Exception:
+        text, status = "", "error"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return text, (time.perf_counter() - started) * 1000, status
+
+
+def select_pages(page_count, options: PDFOptions):
+    """
+    Resolve the options to the page indexes to visit, in visiting order.
+
+    Returns:
+        Tuple of an index iterable, the maximum number of pages to visit
+        (0 for no limit) and the per-page character share (None for no cap)
+    """
+    first = max(1, options.first_page or 1) - 1
+    last = min(page_count, options.last_page or page_count) - 1
+    if page_count == 0 or first > last:
+        return [], 0, None
+    if options.strategy == "sample":
+        # Each sampled page gets an equal share so early pages cannot use up the budget
+        page_budget = max(1, options.char_budget // max(1, min(options.sample_pages, last - first + 1)))
+        return sample_order(first, last), options.sample_pages, page_budget
+    return range(first, last + 1), options.max_pages, None
+
+
+def format_page(index, text, page_budget):
+    part = f"--- Page {index+1} ---\n{text}\n\n"
+    if page_budget is not None and len(part) > page_budget:
+        part = part[:page_budget] + "...\n\n"
+    return part
+
+
+def page_timing(index, text, elapsed_ms, status):
+    return {"page": index + 1, "ms": round(elapsed_ms, 2), "chars": len(text), "status": status}
+
+
+def extract_pages(source, indexes, timeout):
+    """
+    Extract a chunk of pages in a pool worker for parallel extraction.
+
+    Returns:
+        List of (index, text, elapsed_ms, status) in the given order
+    """
+    import PyPDF2
+
+    pdf_file, _ = _open_source(source)
+    try:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        return [(i, *extract_page(pdf_reader, i, timeout)) for i in indexes]
+    finally:
+        pdf_file.close()
+
+
+def extract_text(pdf_reader, page_count, options: PDFOptions):
+    """
+    Extract page text lazily within the options' page range and character budget.
+
+    Returns:
+        Tuple of the assembled text (pages in document order), the list of
+        1-based page numbers that contributed to it and per-page timings
+    """
+    indexes, max_pages, page_budget = select_pages(page_count, options)
+    parts = {}
+    timings = []
+    collected = 0
+    for visited, i in enumerate(indexes, 1):
+        page_text, elapsed_ms, status = extract_page(pdf_reader, i, options.page_timeout)
+        timings.append(page_timing(i, page_text, elapsed_ms, status))
+        if page_text:
+            parts[i] = format_page(i, page_text, page_budget)
+            collected += len(parts[i])
+        if collected >= options.char_budget or (max_pages and visited >= max_pages):
+            break
+
+    pages = sorted(parts)
+    return "".join(parts[i] for i in pages), [i + 1 for i in pages], timings
+
+
+def finish_text(extracted_text, options: PDFOptions):
+    """Apply the placeholder for text-less PDFs and the display truncation."""
+    # If we couldn't extract text or it's too short, indicate that
+    if not extracted_text or len(extracted_text.strip()) < 50:
+        return "The PDF appears to contain mainly images or non-extractable content."
+
+    # Truncate if it's too long (for display purposes)
+    if len(extracted_text) > options.char_budget:
+        return extracted_text[:options.char_budget] + "... (content truncated)"
+    return extracted_text
+
+
+def parse_pdf(source, options: PDFOptions = None, with_text=True):
+    """
+    Extract metadata and text from a PDF. Runs inside a pool worker process.
+
+    Args:
+        source: Raw PDF bytes, or the path of a spooled upload so large files
+            are read from disk instead of being copied into the worker
+        options: Page range and text budget; defaults to PDFOptions()
+        with_text: False skips text extraction (used before parallel extraction)
+
+    Returns:
+        Dictionary with version, title, page_count, content_preview,
+        extracted_text, pages_extracted and page_timings
+    """
+    options = options or PDFOptions()
+    import PyPDF2
+
+    pdf_version = "Unknown"
+    title = "Untitled"
+    page_count = 0
+    pages_extracted = []
+    page_timings = []
+    extracted_text = ""
+    pdf_file = None
+
+    try:
+        # Create a PDF file reader object
+        pdf_file, size_bytes = _open_source(source)
+        head = pdf_file.read(2000)
+        pdf_file.seek(0)
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+
+        # Get page count
+        page_count = len(pdf_reader.pages)
+
+        # Extract pages lazily until the character budget is spent
+        if with_text:
+            extracted_text, pages_extracted, page_timings = extract_text(pdf_reader, page_count, options)
+            extracted_text = finish_text(extracted_text, options)
+
+        # Get PDF version from metadata if available
+        try:
+            if pdf_reader.pdf_header:
+                version_match = re.search(r'%PDF-(\d+\.\d+)', pdf_reader.pdf_header)
+                if version_match:
+                    pdf_version = version_match.group(1)
+        except Exception:
+            # Fallback to regex on raw data for version extraction
+            sample = head[:1000].decode('utf-8', errors='ignore')
+            version_match = re.search(r'%PDF-(\d+\.\d+)', sample)
+            pdf_version = version_match.group(1) if version_match else "Unknown"
+
+        # Try to get title from document info
+        try:
+            if pdf_reader.metadata:
+                if pdf_reader.metadata.get('/Title'):
+                    title = str(pdf_reader.metadata.get('/Title'))
+        except Exception:
+            # Fallback to regex for title extraction
+            title_match = re.search(r'/Title\s*\(([^)]+)\)', head.decode('utf-8', errors='ignore'))
+            title = title_match.group(1) if title_match else "Untitled"
+
+        # Get approximate size
+        size_kb = size_bytes / 1024
+
+        pdf_text = f"PDF document (version {pdf_version}), {page_count} pages, size: {size_kb:.1f} KB"
+
+    except Exception as e:
+        pdf_text = f"{PARSE_FAILURE_PREFIX}: {str(e)}"
+        extracted_text = "Failed to extract text content from this PDF file."
+        pdf_version = "Unknown"
+        title = "Unknown"
+    finally:
+        if pdf_file is not None:
+            pdf_file.close()
+
+    return {
+        "version": pdf_version,
+        "title": title,
+        "page_count": page_count,
+        "content_preview": pdf_text,
+        "extracted_text": extracted_text,
+        "pages_extracted": pages_extracted,
+        "page_timings": page_timings
+    }
+
+
+class PDFParserPool:
+    """
+    Bounded process pool that keeps PyPDF2 parsing off the event loop.
+
+    Each job's deadline is enforced inside its worker from the moment the job
+    starts (see run_job), so a pathological PDF cannot hold a worker forever
+    and neither queueing nor a slow job affects other requests' jobs. The
+    pool is replaced after a fixed number of jobs per worker to contain
+    PyPDF2 memory growth.
+    """
+
+    def __init__(self, max_workers=PDF_POOL_WORKERS, timeout=PDF_PARSE_TIMEOUT_SECONDS,
+                 max_jobs_per_worker=PDF_POOL_MAX_JOBS_PER_WORKER):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._executor = None
+        self._jobs = 0
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._killed_jobs = None
+        self._killed_ids = set()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is not None and self._jobs >= self.max_workers * self.max_jobs_per_worker:
+                # Recycle: in-flight jobs finish on the old workers, new jobs go to fresh ones
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            if self._executor is None:
+                # Not max_tasks_per_child: it rules out fork, and spawned workers
+                # re-import the entry module (the whole app) every time they recycle
+                if self._killed_jobs is None:
+                    self._killed_jobs = multiprocessing.SimpleQueue()
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                                     initargs=(self._killed_jobs,))
+                self._jobs = 0
+            self._jobs += 1
+            return self._executor
+
+    def _discard(self, executor):
+        """Stop using a pool whose worker died; its surviving jobs still finish."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _was_killed(self, job_id):
+        """Whether a worker exited because this job overran its deadline."""
+        with self._lock:
+            while self._killed_jobs is not None and not self._killed_jobs.empty():
+                self._killed_ids.add(self._killed_jobs.get())
+            if job_id in self._killed_ids:
+                self._killed_ids.discard(job_id)
+                return True
+            return False
+
+    async def run(self, func, *args, timeout=None):
+        """
+        Run a picklable function in the pool and await its result.
+
+        Args:
+            timeout: Seconds the job may run once started (default: the pool timeout)
+
+        Raises:
+            asyncio.TimeoutError: If the job does not finish within the timeout
+        """
+        for attempt in range(2):
+            executor = self._get_executor()
+            job_id = next(self._job_ids)
+            future = executor.submit(run_job, func, args, timeout or self.timeout, job_id)
+            try:
+                return await asyncio.wrap_future(future)
+            except JobTimeoutError:
+                raise asyncio.TimeoutError() from None
+            except BrokenProcessPool:
+                self._discard(executor)
+                if self._was_killed(job_id):
+                    # This job is the stuck one; running it again would break the next pool too
+                    raise asyncio.TimeoutError() from None
+                # Another job's worker exited and broke the pool; retry once on a fresh one
+                if attempt:
+                    raise
+
+    async def parse(self, source, options: PDFOptions = None):
+        """Parse PDF bytes or a PDF file path in the pool. See parse_pdf for the returned fields."""
+        options = options or PDFOptions()
+        if options.parallel:
+            return await self._parse_parallel(source, options)
+        return await self.run(parse_pdf, source, options)
+
+    async def _parse_parallel(self, source, options):
+        """
+        Read the metadata, then extract the selected pages in chunks spread
+        over the pool's workers and reassemble them in page order. Chunks not
+        yet needed are cancelled once the character budget is reached.
+        """
+        parsed = await self.run(parse_pdf, source, options, False)
+        indexes, max_pages, page_budget = select_pages(parsed["page_count"], options)
+        indexes = list(indexes)[:max_pages or None]
+        if not indexes:
+            if not parsed["extracted_text"]:
+                parsed["extracted_text"] = finish_text("", options)
+            return parsed
+
+        # The sample strategy visits pages out of order; chunk them in document order
+        ordered = sorted(indexes)
+        chunk_size = max(1, PDF_PARALLEL_CHUNK_PAGES)
+        # At most one chunk per worker is submitted at a time, so this document
+        # never queues more work than the pool can start
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def run_chunk(chunk):
+            # Every page may use its full page timeout; the pool timeout covers opening the document
+            timeout = self.timeout + len(chunk) * options.page_timeout
+            async with semaphore:
+                try:
+                    return await self.run(extract_pages, source, chunk, options.page_timeout, timeout=timeout)
+                except asyncio.TimeoutError:
+                    # Only this chunk's pages are lost
+                    return [(i, "", timeout * 1000, "timeout") for i in chunk]
+
+        tasks = [
+            asyncio.create_task(run_chunk(ordered[start:start + chunk_size]))
+            for start in range(0, len(ordered), chunk_size)
+        ]
+        parts = []
+        pages = []
+        timings = []
+        collected = 0
+        try:
+            for task in tasks:
+                for i, page_text, elapsed_ms, status in await task:
+                    timings.append(page_timing(i, page_text, elapsed_ms, status))
+                    if page_text and collected < options.char_budget:
+                        part = format_page(i, page_text, page_budget)
+                        parts.append(part)
+                        pages.append(i + 1)
+                        collected += len(part)
+                if collected >= options.char_budget:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        parsed["extracted_text"] = finish_text("".join(parts), options)
+        parsed["pages_extracted"] = pages
+        parsed["page_timings"] = timings
+        return parsed
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,324 @@
+import mmap
+import re
+import zlib
+from contextlib import contextmanager
+
+from utils.spooled_upload import SpooledUpload
+
+# How far from each end of the file the probe looks for the header and startxref
+HEADER_WINDOW = 1024
+TAIL_WINDOW = 1024 * 1024
+# Bytes read for one object's dictionary
+OBJECT_WINDOW = 4096
+# Guard against /Prev loops in damaged files
+MAX_XREF_SECTIONS = 32
+
+VERSION_RE = re.compile(rb"%PDF-(\d+\.\d+)")
+STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+OBJECT_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj\b")
+SUBSECTION_RE = re.compile(rb"\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)")
+ENTRY_RE = re.compile(rb"(\d{10})\s(\d{5})\s([nf])")
+LINEARIZED_RE = re.compile(rb"<<\s*/Linearized\s+[\d.]+(.{0,512}?)>>", re.DOTALL)
+
+
+class PDFProbeError(ValueError):
+    """Raised when a file is not a structurally valid PDF (no header, or truncated before the trailer)."""
+
+
+def _ref(text, key):
+    match = re.search(rb"/" + key + rb"\s+(\d+)\s+(\d+)\s+R", text)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _int(text, key):
+    match = re.search(rb"/" + key + rb"\s+(\d+)", text)
+    return int(match.group(1)) if match else None
+
+
+def _int_array(text, key):
+    match = re.search(rb"/" + key + rb"\s*\[([\d\s]*)\]", text)
+    return [int(value) for value in match.group(1).split()] if match else None
+
+
+def _decode_string(raw):
+    """Decode a PDF literal (...) or hex <...> string."""
+    if raw.startswith(b"<"):
+        data = bytes.fromhex(re.sub(rb"\s", b"", raw[1:-1]).decode('ascii'))
+    else:
+        data = bytearray()
+        body = raw[1:-1]
+        escapes = {ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t", ord("b"): b"\b", ord("f"): b"\f"}
+        i = 0
+        while i < len(body):
+            char = body[i]
+            if char == 0x5C and i + 1 < len(body):
+                following = body[i + 1]
+                octal = re.match(rb"[0-7]{1,3}", body[i + 1:i + 4])
+                if octal:
+                    data.append(int(octal.group(0), 8) & 0xFF)
+                    i += 1 + len(octal.group(0))
+                    continue
+                data += escapes.get(following, bytes([following]))
+                i += 2
+                continue
+            data.append(char)
+            i += 1
+        data = bytes(data)
+    if data.startswith(b"\xfe\xff"):
+        return data[2:].decode('utf-16-be', errors='replace')
+    return data.decode('latin-1')
+
+
+def _title(text):
+    match = re.search(rb"/Title\s*(\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>)", text, re.DOTALL)
+    return _decode_string(match.group(1)) if match else None
+
+
+def _unpredict(data, columns, predictor):
+    """Undo the PNG row predictors used by cross-reference streams."""
+    if predictor < 10:
+        return data
+    row_size = columns + 1
+    rows = []
+    previous = bytearray(columns)
+    for start in range(0, len(data) - row_size + 1, row_size):
+        kind, row = data[start], bytearray(data[start + 1:start + row_size])
+        if kind == 1:
+            for i in range(1, columns):
+                row[i] = (row[i] + row[i - 1]) & 0xFF
+        elif kind == 2:
+            for i in range(columns):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif kind != 0:
+            raise ValueError(f"Unsupported PNG predictor {kind}")
+        rows.append(bytes(row))
+        previous = row
+    return b"".join(rows)
+
+
+class _Probe:
+    """Resolves objects through the cross-reference data at the end of the file."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.size = len(buf)
+        # Newest first: ("table", [(first, count, entries_offset), ...]) for
+        # classic xref tables, read lazily, or ("stream", {number: entry})
+        self.sections = []
+        self.trailer = b""
+
+    def _stream_data(self, dict_end):
+        stream_at = self.buf.find(b"stream", dict_end, dict_end + 64)
+        if stream_at < 0:
+            raise ValueError("Missing stream")
+        start = stream_at + len(b"stream")
+        if self.buf[start:start + 2] == b"\r\n":
+            start += 2
+        elif self.buf[start:start + 1] in (b"\n", b"\r"):
+            start += 1
+        end = self.buf.find(b"endstream", start)
+        if end < 0:
+            raise ValueError("Unterminated stream")
+        return zlib.decompressobj().decompress(self.buf[start:end])
+
+    def _object_at(self, offset):
+        """Return the dictionary text of the object at offset and where it ends."""
+        match = OBJECT_RE.match(self.buf, offset)
+        if not match:
+            raise ValueError(f"No object at offset {offset}")
+        window = self.buf[match.end():match.end() + OBJECT_WINDOW]
+        end = len(window)
+        for marker in (b"stream", b"endobj"):
+            found = window.find(marker)
+            if 0 <= found < end:
+                end = found
+        return window[:end], match.end() + end
+
+    def _read_classic(self, offset):
+        subsections = []
+        pos = offset + len(b"xref")
+        while True:
+            match = SUBSECTION_RE.match(self.buf, pos)
+            if not match:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            # Entries are fixed 20-byte lines, so they are only read on lookup
+            subsections.append((first, count, match.end()))
+            pos = match.end() + count * 20
+        trailer_at = self.buf.find(b"trailer", pos, pos + 64)
+        if trailer_at < 0:
+            raise ValueError("Missing trailer")
+        self.sections.append(("table", subsections))
+        end = self.buf.find(b"startxref", trailer_at)
+        return self.buf[trailer_at:end if end > 0 else trailer_at + OBJECT_WINDOW]
+
+    def _read_stream(self, offset):
+        text, dict_end = self._object_at(offset)
+        if b"/XRef" not in text:
+            raise ValueError("Not a cross-reference stream")
+        widths = _int_array(text, b"W")
+        index = _int_array(text, b"Index") or [0, _int(text, b"Size") or 0]
+        row_size = sum(widths)
+        predictor = _int(text, b"Predictor") or 1
+        data = _unpredict(self._stream_data(dict_end), _int(text, b"Columns") or row_size, predictor)
+        entries = {}
+        row = 0
+        for first, count in zip(index[0::2], index[1::2]):
+            for k in range(count):
+                entry = data[row * row_size:(row + 1) * row_size]
+                row += 1
+                fields, pos = [], 0
+                for width in widths:
+                    fields.append(int.from_bytes(entry[pos:pos + width], 'big') if width else None)
+                    pos += width
+                kind = 1 if fields[0] is None else fields[0]
+                if kind == 1:
+                    entries[first + k] = ("offset", fields[1])
+                elif kind == 2:
+                    entries[first + k] = ("compressed", fields[1])
+                else:
+                    entries[first + k] = None
+        self.sections.append(("stream", entries))
+        return text
+
+    def _locate(self, number):
+        for kind, section in self.sections:
+            if kind == "stream":
+                if number in section:
+                    return section[number]
+                continue
+            for first, count, entries_offset in section:
+                if first <= number < first + count:
+                    entry = ENTRY_RE.match(self.buf, entries_offset + (number - first) * 20)
+                    if entry is None:
+                        raise ValueError("Malformed xref entry")
+                    return ("offset", int(entry.group(1))) if entry.group(3) == b"n" else None
+        return None
+
+    def read_xref(self, offset):
+        """Load every cross-reference section reachable from offset, newest first."""
+        for _ in range(MAX_XREF_SECTIONS):
+            if offset is None or not 0 <= offset < self.size:
+                raise ValueError(f"xref offset {offset} outside the file")
+            if self.buf[offset:offset + 4] == b"xref":
+                trailer = self._read_classic(offset)
+            else:
+                trailer = self._read_stream(offset)
+            if not self.trailer:
+                self.trailer = trailer
+            offset = _int(trailer, b"Prev")
+            if offset is None:
+                return
+
+    def resolve(self, ref):
+        """Return the dictionary text of an indirect object, or None if it cannot be located."""
+        if ref is None:
+            return None
+        number = ref[0]
+        location = self._locate(number)
+        if location is None:
+            return None
+        kind, value = location
+        if kind == "offset":
+            return self._object_at(value)[0]
+
+        # The object lives in a compressed object stream
+        stream_location = self._locate(value)
+        if stream_location is None or stream_location[0] != "offset":
+            return None
+        header, dict_end = self._object_at(stream_location[1])
+        data = self._stream_data(dict_end)
+        count, first = _int(header, b"N"), _int(header, b"First")
+        pairs = [int(item) for item in data[:first].split()[:2 * count]]
+        offsets = dict(zip(pairs[0::2], pairs[1::2]))
+        if number not in offsets:
+            return None
+        following = sorted(item for item in offsets.values() if item > offsets[number])
+        end = first + following[0] if following else len(data)
+        return data[first + offsets[number]:end]
+
+
+@contextmanager
+def _probe_buffer(source):
+    if isinstance(source, SpooledUpload):
+        if source.path is None:
+            yield source.read_bytes()
+            return
+        source = source.path
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else b""
+        try:
+            yield buf
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+        return
+    yield source
+
+
+def probe_pdf(source):
+    """
+    Read PDF metadata from the header and the trailer/xref without parsing pages.
+
+    Only the first KB, the end of the file and the handful of objects needed
+    (catalog, page tree root, info dictionary) are touched, so this takes
+    milliseconds regardless of file size.
+
+    Args:
+        source: PDF bytes, a file path or a SpooledUpload
+
+    Returns:
+        Dictionary with version, page_count, title, encrypted, linearized,
+        size_bytes and complete (False if page_count could not be resolved
+        and a full parse is needed)
+
+    Raises:
+        PDFProbeError: If the file has no PDF header or is truncated before
+            its trailer
+    """
+    with _probe_buffer(source) as buf:
+        size = len(buf)
+        header = buf[:HEADER_WINDOW]
+        version_match = VERSION_RE.search(header)
+        if version_match is None:
+            raise PDFProbeError("Missing %PDF header")
+
+        tail_start = max(0, size - TAIL_WINDOW)
+        startxref_at = buf.rfind(b"startxref", tail_start)
+        if startxref_at < 0 or buf.find(b"%%EOF", startxref_at) < 0:
+            raise PDFProbeError("Truncated PDF: no startxref/%%EOF trailer")
+        startxref = STARTXREF_RE.match(buf, startxref_at)
+
+        result = {
+            "version": version_match.group(1).decode('ascii'),
+            "page_count": None,
+            "title": None,
+            "encrypted": False,
+            "linearized": False,
+            "size_bytes": size,
+            "complete": False
+        }
+
+        linearized = LINEARIZED_RE.search(header)
+        if linearized:
+            result["linearized"] = True
+            result["page_count"] = _int(linearized.group(1), b"N")
+
+        probe = _Probe(buf)
+        try:
+            probe.read_xref(int(startxref.group(1)) if startxref else None)
+            result["encrypted"] = b"/Encrypt" in probe.trailer
+            catalog = probe.resolve(_ref(probe.trailer, b"Root"))
+            pages = probe.resolve(_ref(catalog, b"Pages")) if catalog else None
+            if pages is not None and _int(pages, b"Count") is not None:
+                result["page_count"] = _int(pages, b"Count")
+            info = probe.resolve(_ref(probe.trailer, b"Info"))
+            if info is not None and not result["encrypted"]:
+                result["title"] = _title(info)
+        except (ValueError, zlib.error, IndexError, TypeError) as e:
+            # Damaged cross-reference data; a full parse may still recover the file
+            print(f"PDF probe could not read the cross-reference data: {str(e)}")
+
+        result["complete"] = result["page_count"] is not None
+        return result
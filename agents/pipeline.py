@@ -0,0 +1,216 @@
+import asyncio
+import json
+import logging
+import os
+from agents.classifier import ClassifierAgent, sniff_format
+from agents.json_agent import JSONAgent
+from agents.email_agent import EmailAgent
+from agents.pdf_agent import PDFAgent
+from agents.pdf_parser import PDFOptions
+from agents.mime_parser import ATTACHMENT_SOURCE, ParsedEmail, looks_like_email, parse_email
+from memory.shared_memory import SharedMemory
+from utils.llm_scheduler import llm_priority, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+from utils.keyword_matcher import get_keyword_matcher
+from utils.json_stream import JSONStreamOptions, JSON_STREAM_FORMATS, sniff_json_stream
+from utils.spooled_upload import SpooledUpload, SNIFF_BYTES
+from utils.metrics import timed, start_request, finish_request, label_request
+
+# "two_pass" runs classification and extraction as separate LLM calls,
+# "combined" asks for intent and extraction fields in a single prompt
+INTAKE_MODE = os.environ.get("INTAKE_MODE", "two_pass")
+if INTAKE_MODE not in ("two_pass", "combined"):
+    raise ValueError(f"Unsupported INTAKE_MODE: {INTAKE_MODE}")
+
+# Sources whose LLM calls yield to interactive requests
+BULK_SOURCES = ("batch", "job", "mailbox")
+
+# PDF and JSON email attachments become child inputs in the email's thread
+EMAIL_ROUTE_ATTACHMENTS = os.environ.get("EMAIL_ROUTE_ATTACHMENTS", "1").lower() not in ("0", "false", "no")
+# Attachments routed per email; the rest are only listed in the email record
+EMAIL_MAX_ATTACHMENTS = int(os.environ.get("EMAIL_MAX_ATTACHMENTS", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+def load_json_document(upload: SpooledUpload):
+    """Read and parse an uploaded JSON document; malformed JSON is returned as bytes."""
+    data = upload.read_bytes()
+    try:
+        return json.loads(data)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # The JSON agent records it as raw text
+        return data
+
+
+class UnsupportedFormatError(Exception):
+    """Raised when the classifier cannot map an input to any format agent."""
+
+    def __init__(self, format_type):
+        super().__init__(f"Unsupported format: {format_type}")
+        self.format_type = format_type
+
+
+class IntakePipeline:
+    """
+    Classify an input, log it to shared memory and route it to the matching
+    format agent. Shared by /intake and the bulk intake paths.
+    """
+
+    def __init__(self, shared_memory: SharedMemory, classifier: ClassifierAgent, json_agent: JSONAgent,
+                 email_agent: EmailAgent, pdf_agent: PDFAgent, mode: str = INTAKE_MODE):
+        self.shared_memory = shared_memory
+        self.classifier = classifier
+        self.json_agent = json_agent
+        self.email_agent = email_agent
+        self.pdf_agent = pdf_agent
+        self.mode = mode
+
+    @staticmethod
+    def llm_priority_for(source, email_text=None):
+        """Pick the scheduler lane: urgent emails first, bulk sources last."""
+        if email_text is not None:
+            if get_keyword_matcher().classify(email_text[:2000], "urgency", "normal") == "high":
+                return PRIORITY_HIGH
+        return PRIORITY_BULK if source in BULK_SOURCES else PRIORITY_NORMAL
+
+    @timed("pipeline")
+    async def run(self, input_data, input_type, source="api", pdf_options: PDFOptions = None,
+                  json_options: JSONStreamOptions = None):
+        """
+        Process one input end to end.
+
+        pdf_options overrides the PDF page range and text budget for this input;
+        json_options controls how JSON arrays and NDJSON are streamed.
+
+        Returns:
+            The agent result with an 'input_metadata' entry added
+
+        Raises:
+            UnsupportedFormatError: If no agent handles the detected format
+        """
+        # Emails move to the high lane in _run once parsed and found urgent
+        token = llm_priority.set(self.llm_priority_for(source))
+        metrics_token = start_request()
+        try:
+            return await self._run(input_data, input_type, source, pdf_options, json_options)
+        finally:
+            finish_request(metrics_token)
+            llm_priority.reset(token)
+
+    async def _run(self, input_data, input_type, source, pdf_options, json_options):
+        # Emails are parsed once up front; the classifier and the agent only
+        # see the headers and cleaned body, never the encoded MIME parts
+        parsed = None
+        classify_data, classify_type = input_data, input_type
+        upload_format = None
+        if isinstance(input_data, SpooledUpload) and input_type == "file":
+            upload_format = sniff_format(input_data.head(), input_data.tail())
+        if self._is_email(input_data, input_type) or upload_format == "email":
+            parsed = await self._parse_email(input_data)
+            classify_data, classify_type = parsed.llm_text(), "email"
+            llm_priority.set(self.llm_priority_for(source, classify_data))
+        elif upload_format == "json":
+            # A single JSON document is read and parsed once, off the event
+            # loop; the classifier and the JSON agent share the result
+            input_data = classify_data = await asyncio.to_thread(load_json_document, input_data)
+            if isinstance(input_data, dict):
+                classify_type = "json"
+
+        # Classify input and route to the appropriate agent
+        llm_result = None
+        if self.mode == "combined":
+            format_type, intent, llm_result = await self.classifier.classify_and_extract(classify_data, classify_type)
+        else:
+            format_type, intent = await self.classifier.classify(classify_data, classify_type)
+        logger.debug("Classified as format: %s, intent: %s", format_type, intent)
+        label_request(format_type, intent)
+
+        # Log input and get its record (id + timestamp) to thread through the agents
+        input_record = await self.shared_memory.log_input_async(source, input_type, format_type, intent)
+        logger.debug("Logged input with ID: %s", input_record.id)
+
+        if format_type == "json":
+            result = await self.json_agent.process(input_data, input_record, llm_result)
+        elif format_type in JSON_STREAM_FORMATS:
+            result = await self.json_agent.process_stream(input_data, input_record, format_type, json_options)
+        elif format_type == "email":
+            if parsed is None:
+                parsed = await self._parse_email(input_data)
+                llm_priority.set(self.llm_priority_for(source, parsed.llm_text()))
+            result = await self.email_agent.process(input_data, input_record, llm_result, parsed)
+            if EMAIL_ROUTE_ATTACHMENTS and parsed.attachments:
+                result["attachment_results"] = await self.route_attachments(
+                    parsed, input_record, intent, pdf_options, json_options)
+        elif format_type == "pdf":
+            result = await self.pdf_agent.process(input_data, input_record, pdf_options)
+        else:
+            raise UnsupportedFormatError(format_type)
+
+        # Add input metadata to the response
+        result["input_metadata"] = {
+            "id": input_record.id,
+            "format": format_type,
+            "intent": intent,
+            "timestamp": input_record.timestamp,
+            "pipeline_mode": self.mode
+        }
+        return result
+
+    @staticmethod
+    @timed("mime_parser.parse_email")
+    async def _parse_email(input_data):
+        return await asyncio.to_thread(parse_email, input_data)
+
+    @staticmethod
+    def _is_email(input_data, input_type):
+        if input_type == "email":
+            return True
+        if input_type != "file":
+            return False
+        if isinstance(input_data, SpooledUpload):
+            return looks_like_email(input_data.head())
+        return isinstance(input_data, bytes) and looks_like_email(input_data[:SNIFF_BYTES])
+
+    async def route_attachments(self, parsed: ParsedEmail, input_record, intent, pdf_options: PDFOptions = None,
+                                json_options: JSONStreamOptions = None):
+        """
+        Run the PDF and JSON attachments of an email through their agents.
+
+        Each attachment is logged as its own input, inheriting the email's
+        intent, and its extracted fields join the email's thread
+        (email_<id>). Attachments run concurrently; one failing does not
+        fail the email.
+
+        Returns:
+            One status entry per attachment, in attachment order
+        """
+        thread_id = f"email_{input_record.id}"
+
+        async def route(attachment):
+            entry = attachment.descriptor()
+            if attachment.format is None:
+                return dict(entry, status="skipped", reason="unsupported type")
+            if attachment.payload is None:
+                return dict(entry, status="skipped", reason="too large")
+            format_type = attachment.format
+            if format_type == "json":
+                format_type = sniff_json_stream(attachment.payload) or "json"
+            child = await self.shared_memory.log_input_async(ATTACHMENT_SOURCE, "file", format_type, intent)
+            try:
+                if format_type == "pdf":
+                    await self.pdf_agent.process(attachment.payload, child, pdf_options, thread_id)
+                elif format_type == "json":
+                    await self.json_agent.process(attachment.payload, child, thread_id=thread_id)
+                else:
+                    await self.json_agent.process_stream(attachment.payload, child, format_type, json_options,
+                                                         thread_id)
+            except Exception as e:
+                logger.debug("Error processing attachment %s: %s", attachment.filename, e)
+                return dict(entry, status="failed", input_id=child.id, error=str(e))
+            return dict(entry, status="processed", input_id=child.id, format=format_type)
+
+        routed = parsed.attachments[:EMAIL_MAX_ATTACHMENTS]
+        results = list(await asyncio.gather(*(route(attachment) for attachment in routed)))
+        results.extend(dict(attachment.descriptor(), status="skipped", reason="attachment limit")
+                       for attachment in parsed.attachments[EMAIL_MAX_ATTACHMENTS:])
+        return results
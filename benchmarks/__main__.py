@@ -0,0 +1,193 @@
+"""
+Offline benchmarks for the intake service; no Gemini API key or network is
+needed. Run from the repository root:
+
+    python -m benchmarks run [--scenarios classifier,agent,pipeline,app] [--formats email,json,pdf]
+                             [--sizes small,medium,large] [--requests 100] [--concurrency 8]
+                             [--latency-ms 50] [--jitter 0.5] [--error-rate 0] [--out FILE]
+    python -m benchmarks replay [--db shared_memory.db] [--archive DIR] [--formats email,json]
+                                [--limit N] [--rate 20] [--live-llm] [--out FILE]
+    python -m benchmarks startup [--runs 5] [--out FILE]
+    python -m benchmarks compare BASELINE.json CANDIDATE.json
+
+Results are written to benchmarks/results/<time>-<commit>.json by default.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.corpus import CORPUS_FORMATS, CORPUS_SIZES
+from benchmarks.fake_llm import LatencyProfile
+from benchmarks.harness import (BenchmarkConfig, SCENARIOS, compare_reports, format_result, run_benchmarks,
+                                save_report)
+from benchmarks.replay import ReplayConfig, format_agreement, run_replay
+from benchmarks.startup import format_startup, run_startup
+
+
+def _list(choices):
+    def parse(value):
+        items = tuple(item.strip() for item in value.split(",") if item.strip())
+        unknown = [item for item in items if item not in choices]
+        if unknown or not items:
+            raise argparse.ArgumentTypeError(f"choose from {', '.join(choices)}")
+        return items
+    return parse
+
+
+def _isolate_environment(workdir):
+    """
+    Point the service at throwaway databases and turn off everything that
+    would make runs depend on earlier ones. Explicit settings are kept.
+    """
+    os.environ.setdefault("SHARED_MEMORY_PATH", os.path.join(workdir, "shared_memory.db"))
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(workdir, "llm_cache.db"))
+    os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+    os.environ.setdefault("INTENT_MODEL_ENABLED", "0")
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("METRICS_ENABLED", "1")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="intake-benchmark-")
+    # main.py reads its configuration when run_benchmarks imports it
+    _isolate_environment(workdir)
+
+    responses = None
+    if args.responses:
+        with open(args.responses) as f:
+            responses = json.load(f)
+    config = BenchmarkConfig(
+        scenarios=args.scenarios,
+        formats=args.formats,
+        sizes=args.sizes,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        profile=LatencyProfile(args.latency_ms, args.jitter, args.error_rate, args.error_code, args.seed),
+        llm_rate=args.llm_rate,
+        responses=responses,
+        seed=args.seed
+    )
+    try:
+        report = run_benchmarks(config, on_result=lambda result: print(format_result(result), flush=True))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"Saved results to {save_report(report, args.out)}")
+
+
+def replay(args):
+    # Resolved before the service is pointed at its own throwaway database
+    db_path = args.db or (None if args.archive else os.environ.get("SHARED_MEMORY_PATH", "shared_memory.db"))
+    workdir = tempfile.mkdtemp(prefix="intake-replay-")
+    _isolate_environment(workdir)
+    if db_path and os.path.abspath(db_path) == os.path.abspath(os.environ["SHARED_MEMORY_PATH"]):
+        shutil.rmtree(workdir, ignore_errors=True)
+        sys.exit("Refusing to replay into the recorded database; unset SHARED_MEMORY_PATH or pass another --db")
+
+    config = ReplayConfig(
+        db_path=db_path,
+        archive=args.archive,
+        formats=args.formats,
+        limit=args.limit,
+        rate=args.rate,
+        concurrency=args.concurrency,
+        live_llm=args.live_llm,
+        profile=LatencyProfile(args.latency_ms, args.jitter, args.error_rate, args.error_code, args.seed),
+        llm_rate=args.llm_rate
+    )
+    try:
+        report = run_replay(config)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    for result in report["results"]:
+        print(format_result(result))
+    print("\n".join(format_agreement(report)))
+    print(f"Saved results to {save_report(report, args.out)}")
+
+
+def startup(args):
+    workdir = tempfile.mkdtemp(prefix="intake-startup-")
+    _isolate_environment(workdir)
+    try:
+        report = run_startup(args.runs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    for result in report["results"]:
+        print(format_startup(result))
+    loaded = report["startup"]["loaded_at_import"]
+    print(f"Loaded by import main: {', '.join(loaded) if loaded else 'none of the lazy modules'}")
+    print(f"Saved results to {save_report(report, args.out)}")
+
+
+def _add_llm_arguments(parser):
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Median fake LLM latency")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Sigma of the log-normal latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake LLM calls that fail")
+    parser.add_argument("--error-code", type=int, default=503)
+    parser.add_argument("--llm-rate", type=float, default=1000.0, help="Scheduler rate limit in calls/s")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Results file (default: benchmarks/results/<time>-<commit>.json)")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print("\n".join(compare_reports(baseline, candidate)))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Offline benchmarks against a deterministic fake LLM")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run scenarios and save the results as JSON")
+    run_parser.add_argument("--scenarios", type=_list(SCENARIOS), default=SCENARIOS)
+    run_parser.add_argument("--formats", type=_list(CORPUS_FORMATS), default=("email", "json", "pdf"))
+    run_parser.add_argument("--sizes", type=_list(CORPUS_SIZES), default=("small",))
+    run_parser.add_argument("--requests", type=int, default=100, help="Requests per scenario, format and size")
+    run_parser.add_argument("--responses", help="JSON file of canned responses by prompt kind "
+                                                "(classify, combined, email, json, pdf)")
+    _add_llm_arguments(run_parser)
+    run_parser.set_defaults(func=run)
+
+    replay_parser = subparsers.add_parser("replay", help="Replay recorded inputs and diff the results")
+    replay_parser.add_argument("--db", help="Recorded SharedMemory database (default: SHARED_MEMORY_PATH, "
+                                            "or none when only --archive is given)")
+    replay_parser.add_argument("--archive", help="Directory of captured payloads; <input_id>.<ext> files are "
+                                                 "matched to recorded inputs")
+    replay_parser.add_argument("--formats", type=_list(("email", "json", "json_array", "ndjson", "pdf")),
+                               help="Only replay inputs recorded with these formats")
+    replay_parser.add_argument("--limit", type=int, help="Replay at most this many inputs")
+    replay_parser.add_argument("--rate", type=float, help="Target requests per second (default: as fast as possible)")
+    replay_parser.add_argument("--live-llm", action="store_true",
+                               help="Call the configured Gemini model instead of the fake one")
+    _add_llm_arguments(replay_parser)
+    replay_parser.set_defaults(func=replay)
+
+    startup_parser = subparsers.add_parser("startup", help="Time cold starts in fresh interpreters")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--out", help="Results file (default: benchmarks/results/<time>-<commit>.json)")
+    startup_parser.set_defaults(func=startup)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two saved results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    if args.command == "run" and args.requests < 1:
+        parser.error("--requests must be at least 1")
+    if args.command == "startup" and args.runs < 1:
+        parser.error("--runs must be at least 1")
+    if args.command in ("run", "replay") and args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
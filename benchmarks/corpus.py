@@ -0,0 +1,149 @@
+"""
+Synthetic, seeded inputs for the benchmarks.
+
+Every document embeds its index, so identical requests are never coalesced
+by SingleFlight or answered from a cache unless a scenario repeats them on
+purpose.
+"""
+import json
+import random
+import zlib
+from typing import List
+
+CORPUS_FORMATS = ("email", "json", "ndjson", "pdf")
+CORPUS_SIZES = ("small", "medium", "large")
+
+# Per size: email paragraphs, JSON line items, NDJSON records, PDF pages
+SIZE_PARAMETERS = {
+    "small": {"email": 3, "json": 5, "ndjson": 100, "pdf": 1},
+    "medium": {"email": 30, "json": 200, "ndjson": 2000, "pdf": 10},
+    "large": {"email": 300, "json": 5000, "ndjson": 20000, "pdf": 50}
+}
+
+# Subject and opening line per intent, so the keyword rules see realistic mixes
+EMAIL_TOPICS = (
+    ("rfq", "Request for quote: {count} units", "Could you send a quotation for the parts listed below?"),
+    ("invoice", "Invoice INV-{index} attached", "Please find our invoice for last month's deliveries; payment is due in 30 days."),
+    ("complaint", "Complaint about order {index}", "We have an issue with the last shipment and want to raise a complaint."),
+    ("regulation", "Compliance update {index}", "The new regulation requires updated compliance documents from all suppliers."),
+    ("inquiry", "Question about order {index}", "I have a question and would like some information about your catalogue.")
+)
+FILLER_WORDS = (
+    "delivery", "schedule", "warehouse", "contract", "pallet", "supplier", "account", "shipment",
+    "pricing", "terms", "batch", "customer", "catalogue", "order", "quantity", "freight", "approval"
+)
+PRODUCTS = ("bolt", "washer", "bracket", "hinge", "gasket", "valve", "bearing", "spring")
+
+
+def _sentence(rng, words=12):
+    text = " ".join(rng.choice(FILLER_WORDS) for _ in range(words))
+    return text.capitalize() + "."
+
+
+def make_email(index: int, size: str, rng: random.Random) -> str:
+    _, subject, opening = EMAIL_TOPICS[index % len(EMAIL_TOPICS)]
+    count = rng.randint(10, 5000)
+    urgency = "This is urgent, please reply asap." if index % 7 == 0 else ""
+    paragraphs = [" ".join(_sentence(rng) for _ in range(4)) for _ in range(SIZE_PARAMETERS[size]["email"])]
+    body = "\n\n".join([opening + " " + urgency] + paragraphs)
+    return (
+        f"From: buyer{index}@example.com\n"
+        f"To: sales@example.com\n"
+        f"Subject: {subject.format(index=index, count=count)}\n\n"
+        f"Hello,\n\n{body}\n\nRegards,\nBuyer {index}\n"
+    )
+
+
+def _line_item(rng, number):
+    return {
+        "line": number,
+        "sku": f"{rng.choice(PRODUCTS).upper()}-{rng.randint(100, 999)}",
+        "quantity": rng.randint(1, 500),
+        "unit_price": round(rng.uniform(0.1, 250.0), 2),
+        "note": rng.choice((None, "", _sentence(rng, 6)))
+    }
+
+
+def make_json(index: int, size: str, rng: random.Random) -> str:
+    items = [_line_item(rng, n) for n in range(SIZE_PARAMETERS[size]["json"])]
+    document = {
+        "id": f"ORD-{index:06d}",
+        "timestamp": f"2024-01-{index % 28 + 1:02d}T{index % 24:02d}:00:00Z",
+        "type": rng.choice(("invoice", "purchase_order", "quote")),
+        "customer": {
+            "name": f"Customer {index}",
+            "email": f"customer{index}@example.com",
+            "address": {"city": rng.choice(("Berlin", "Lyon", "Leeds", "Porto")), "country": "EU"}
+        },
+        "items": items,
+        "total": round(sum(item["quantity"] * item["unit_price"] for item in items), 2)
+    }
+    return json.dumps(document)
+
+
+def make_ndjson(index: int, size: str, rng: random.Random) -> str:
+    lines = []
+    for n in range(SIZE_PARAMETERS[size]["ndjson"]):
+        record = dict(_line_item(rng, n), id=f"EVT-{index}-{n}", timestamp=f"2024-02-01T00:00:{n % 60:02d}Z")
+        lines.append(json.dumps(record))
+    return "\n".join(lines) + "\n"
+
+
+def _pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(index: int, size: str, rng: random.Random) -> bytes:
+    """A text PDF with a classic xref table, one Flate content stream per page."""
+    pages = SIZE_PARAMETERS[size]["pdf"]
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        4: b"<< /Title (Benchmark invoice %d) /Producer (benchmarks) >>" % index
+    }
+    kids = []
+    for page in range(pages):
+        page_number, content_number = 5 + 2 * page, 6 + 2 * page
+        kids.append(b"%d 0 R" % page_number)
+        lines = [f"Invoice {index} page {page + 1}"] + [_sentence(rng, 10) for _ in range(40)]
+        text = "".join(f"({_pdf_string(line)}) Tj T* " for line in lines)
+        stream = zlib.compress(f"BT /F1 10 Tf 14 TL 50 760 Td {text}ET".encode('latin-1'))
+        objects[page_number] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        objects[content_number] = (
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref_offset = len(out)
+    size_entries = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size_entries
+    for number in range(1, size_entries):
+        out += b"%010d 00000 n \n" % offsets[number]
+    out += b"trailer\n<< /Size %d /Root 1 0 R /Info 4 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size_entries, xref_offset)
+    return bytes(out)
+
+
+GENERATORS = {"email": make_email, "json": make_json, "ndjson": make_ndjson, "pdf": make_pdf}
+
+
+def build_corpus(format: str, size: str, count: int, seed: int = 0) -> List:
+    """
+    Generate count distinct documents of one format and size.
+
+    Returns:
+        Email/JSON/NDJSON documents as str, PDFs as bytes
+    """
+    if format not in GENERATORS:
+        raise ValueError(f"Unsupported corpus format: {format}")
+    if size not in SIZE_PARAMETERS:
+        raise ValueError(f"Unsupported corpus size: {size}")
+    rng = random.Random(f"{seed}:{format}:{size}")
+    return [GENERATORS[format](index, size, rng) for index in range(count)]
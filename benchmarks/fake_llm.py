@@ -0,0 +1,149 @@
+"""
+Deterministic stand-in for the Gemini model behind GeminiClient.
+
+Only the model object is replaced, so the client's prompts, response parsing,
+scheduler and cache all run as in production. Latency and errors are drawn
+from a generator seeded with the prompt and how many times it was seen, so a
+run is reproducible however the calls interleave.
+"""
+import asyncio
+import json
+import math
+import random
+import zlib
+from typing import Dict, NamedTuple, Optional
+
+from utils.keyword_matcher import get_keyword_matcher
+
+
+class LatencyProfile(NamedTuple):
+    """
+    Behaviour of the fake model.
+
+    latency_ms: Median response time
+    jitter: Sigma of the log-normal latency distribution (0 = constant)
+    error_rate: Share of calls that fail with error_code
+    error_code: HTTP status of the simulated failures (429/503 shrink the
+        scheduler's concurrency window, 5xx are retried)
+    seed: Varies the draws between otherwise identical runs
+    """
+    latency_ms: float = 50.0
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    error_code: int = 503
+    seed: int = 0
+
+
+class FakeLLMError(Exception):
+    """Simulated API failure; the scheduler reads the status from .code."""
+
+    def __init__(self, code):
+        super().__init__(f"Simulated Gemini error {code}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+# Prompt markers, checked in order, and the response kind they select
+PROMPT_KINDS = (
+    ("'fields'", "combined"),
+    ("Classify the following content", "classify"),
+    ("from this email", "email"),
+    ("Analyze this JSON data", "json"),
+    ("extracted PDF content", "pdf")
+)
+# Where the input starts in each prompt, for picking a plausible intent
+CONTENT_MARKERS = ("Content:", "Email:", "JSON structure (")
+
+DEFAULT_RESPONSES = {
+    "email": {
+        "sender": "buyer@example.com",
+        "subject": "Benchmark message",
+        "intent": "inquiry",
+        "urgency": "normal",
+        "summary": "A synthetic benchmark email."
+    },
+    "json": {
+        "main_entities": ["Order", "Customer"],
+        "structure_description": "Nested order records with line items.",
+        "key_data_points": ["Order totals", "Customer contact"],
+        "missing_fields": [],
+        "data_quality": "good",
+        "likely_purpose": "Order processing",
+        "insights": ["Synthetic benchmark data"],
+        "summary": "Synthetic order data used for benchmarking."
+    },
+    "pdf": {
+        "likely_document_type": "invoice",
+        "estimated_page_count": "unknown",
+        "content_summary": "A synthetic benchmark document.",
+        "topics": ["Billing"],
+        "recommended_next_steps": ["Review document contents"]
+    }
+}
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel with canned, deterministic answers."""
+
+    def __init__(self, profile: LatencyProfile = LatencyProfile(), responses: Optional[Dict] = None):
+        self.profile = profile
+        self.responses = dict(DEFAULT_RESPONSES, **(responses or {}))
+        self._seen = {}
+        self.calls = 0
+        self.errors = 0
+
+    def _draw(self, prompt):
+        digest = zlib.crc32(prompt.encode('utf-8'))
+        attempt = self._seen.get(digest, 0)
+        self._seen[digest] = attempt + 1
+        return random.Random(f"{self.profile.seed}:{digest}:{attempt}")
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        rng = self._draw(prompt)
+        latency = self.profile.latency_ms * math.exp(self.profile.jitter * rng.gauss(0, 1))
+        await asyncio.sleep(latency / 1000)
+        if rng.random() < self.profile.error_rate:
+            self.errors += 1
+            raise FakeLLMError(self.profile.error_code)
+        return FakeResponse(self._respond(prompt))
+
+    def _respond(self, prompt):
+        kind = next((kind for marker, kind in PROMPT_KINDS if marker in prompt), None)
+        if kind in self.responses and kind not in ("classify", "combined"):
+            response = self.responses[kind]
+            return response if isinstance(response, str) else json.dumps(response)
+
+        content = prompt
+        for marker in CONTENT_MARKERS:
+            if marker in prompt:
+                content = prompt.rsplit(marker, 1)[1]
+                break
+        intent = get_keyword_matcher().classify(content, "intent", "inquiry")
+        if kind == "classify":
+            return self.responses.get("classify", intent)
+        if kind == "combined":
+            if "combined" in self.responses:
+                return json.dumps(self.responses["combined"])
+            fields = self.responses["email" if "Email:" in prompt else "json"]
+            return json.dumps({"intent": intent, "fields": dict(fields, intent=intent)})
+        return "{}"
+
+    def stats(self):
+        return {"calls": self.calls, "errors": self.errors}
+
+
+def install_fake_llm(client, profile: LatencyProfile = LatencyProfile(),
+                     responses: Optional[Dict] = None) -> FakeGenerativeModel:
+    """
+    Swap the model behind an existing GeminiClient for a FakeGenerativeModel.
+
+    utils.llm_client is deliberately not imported here: it reads the cache
+    settings at import time, before the benchmark has isolated them.
+    """
+    client.model = FakeGenerativeModel(profile, responses)
+    return client.model
@@ -0,0 +1,364 @@
+"""
+Benchmark scenarios for the intake service, run offline against
+FakeGenerativeModel.
+
+Each scenario drives one layer of the app as wired in main.py: the
+classifier, the format agents, the whole pipeline, or the /intake endpoint
+through an in-process ASGI client. Results carry throughput, latency
+percentiles, peak RSS and time spent in SQLite writes, and are saved as JSON
+so runs can be compared across commits.
+
+main.py is only imported by run_benchmarks, once the caller has set up the
+environment it reads at import time.
+"""
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_llm import LatencyProfile, install_fake_llm
+from utils.llm_scheduler import LLMScheduler
+from utils.metrics import STAGE_SECONDS
+
+SCENARIOS = ("classifier", "agent", "pipeline", "app")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Stages whose time counts as SQLite write time
+SQLITE_WRITE_STAGES = ("shared_memory.log_input", "shared_memory.log_extracted_fields")
+RSS_SAMPLE_SECONDS = 0.01
+# Environment prefixes of the service's tuning knobs, recorded with every run
+CONFIG_ENV_PREFIXES = ("INTAKE_", "SHARED_MEMORY_", "SQLITE_", "LLM_", "PDF_", "JSON_", "SEARCH_", "INTENT_",
+                       "METRICS_", "UPLOAD_")
+
+# How each corpus format is handed to the pipeline and to /intake
+INPUT_TYPES = {"email": "email", "json": "json", "ndjson": "json", "pdf": "file"}
+FORM_FIELDS = {"email": "email_text", "json": "json_data", "ndjson": "json_data"}
+
+
+class BenchmarkConfig(NamedTuple):
+    """
+    What to run.
+
+    requests: Requests per scenario, format and size
+    concurrency: Requests in flight at once
+    llm_rate: Scheduler rate limit (calls per second) in front of the fake model
+    responses: Canned response overrides for FakeGenerativeModel, by prompt kind
+    """
+    scenarios: Sequence[str] = SCENARIOS
+    formats: Sequence[str] = ("email", "json", "pdf")
+    sizes: Sequence[str] = ("small",)
+    requests: int = 100
+    concurrency: int = 8
+    profile: LatencyProfile = LatencyProfile()
+    llm_rate: float = 1000.0
+    responses: Optional[Dict] = None
+    seed: int = 0
+
+
+class PeakRSS:
+    """
+    Track the peak resident set size of this process while in the block.
+
+    /proc/self/statm is sampled from a background thread; elsewhere the
+    process-lifetime ru_maxrss is reported instead.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_SECONDS):
+        self.interval = interval
+        self.start_bytes = self.peak_bytes = self._current()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _current():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, self._current())
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = self._current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, self._current())
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def latency_summary(sorted_latencies: List[float]) -> Dict[str, float]:
+    """Mean, percentiles and maximum in milliseconds."""
+    count = len(sorted_latencies)
+    return {
+        "mean": round(sum(sorted_latencies) / count * 1000, 3) if count else 0.0,
+        "p50": round(percentile(sorted_latencies, 0.50) * 1000, 3),
+        "p95": round(percentile(sorted_latencies, 0.95) * 1000, 3),
+        "p99": round(percentile(sorted_latencies, 0.99) * 1000, 3),
+        "max": round(sorted_latencies[-1] * 1000, 3) if count else 0.0
+    }
+
+
+def sqlite_write_seconds() -> float:
+    totals = STAGE_SECONDS.totals()
+    return sum(totals.get((stage,), (0.0, 0))[0] for stage in SQLITE_WRITE_STAGES)
+
+
+def git_revision() -> Dict:
+    """Commit and dirty flag of the working tree, or None outside a git checkout."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+async def drive(call, items: Iterable, concurrency: int, rate: Optional[float] = None):
+    """
+    Run call(item) for every item, concurrency at a time.
+
+    With a rate (calls per second) the n-th call is scheduled n / rate seconds
+    after the start, and its latency counts from that moment, so time spent
+    queued behind slow calls is not hidden.
+
+    Returns:
+        (sorted latencies in seconds, failed calls, wall time in seconds)
+    """
+    latencies = []
+    errors = 0
+    items = iter(enumerate(items))
+    started = time.perf_counter()
+
+    async def worker():
+        nonlocal errors
+        for number, item in items:
+            call_started = time.perf_counter()
+            if rate:
+                call_started = started + number / rate
+                await asyncio.sleep(max(call_started - time.perf_counter(), 0))
+            try:
+                await call(item)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - call_started)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sorted(latencies), errors, time.perf_counter() - started
+
+
+class Harness:
+    """Runs scenarios against the objects wired up in main.py."""
+
+    def __init__(self, app_module, config: BenchmarkConfig):
+        self.main = app_module
+        self.config = config
+        self.model = install_fake_llm(app_module.gemini_client, config.profile, config.responses)
+        app_module.gemini_client.scheduler = LLMScheduler(rate_per_second=config.llm_rate, burst=config.llm_rate)
+        self._client = None
+
+    async def _http_client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=self.main.app),
+                                             base_url="http://benchmark")
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def _scenario_call(self, scenario, format, documents):
+        """Build the call(index) coroutine function for one scenario."""
+        pipeline = self.main.pipeline
+        input_type = INPUT_TYPES[format]
+
+        if scenario == "classifier":
+            return lambda index: pipeline.classifier.classify(documents[index], input_type)
+
+        if scenario == "pipeline":
+            return lambda index: pipeline.run(documents[index], input_type, source="benchmark")
+
+        if scenario == "agent":
+            # Inputs are logged up front so only the agent itself is timed
+            records = [self.main.shared_memory.log_input("benchmark", input_type, format, "unknown")
+                       for _ in documents]
+            if format == "email":
+                return lambda index: pipeline.email_agent.process(documents[index], records[index])
+            if format == "json":
+                return lambda index: pipeline.json_agent.process(documents[index], records[index])
+            if format == "ndjson":
+                return lambda index: pipeline.json_agent.process_stream(documents[index], records[index], "ndjson")
+            return lambda index: pipeline.pdf_agent.process(documents[index], records[index])
+
+        client = await self._http_client()
+
+        async def post(index):
+            if format == "pdf":
+                files = {"file": (f"benchmark-{index}.pdf", documents[index], "application/pdf")}
+                response = await client.post("/intake", files=files)
+            else:
+                response = await client.post("/intake", data={FORM_FIELDS[format]: documents[index]})
+            if response.status_code != 200:
+                raise RuntimeError(f"/intake returned {response.status_code}")
+        return post
+
+    async def run_scenario(self, scenario: str, format: str, size: str) -> Dict:
+        config = self.config
+        documents = build_corpus(format, size, config.requests, config.seed)
+        call = await self._scenario_call(scenario, format, documents)
+        # One untimed request first, so worker processes and lazy imports are not measured
+        warmup = build_corpus(format, size, 1, config.seed + 1)
+        warmup_call = await self._scenario_call(scenario, format, warmup)
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            with contextlib.suppress(Exception):
+                await warmup_call(0)
+            llm_calls, llm_errors = self.model.calls, self.model.errors
+            sqlite_before = sqlite_write_seconds()
+            with PeakRSS() as rss:
+                latencies, errors, seconds = await drive(call, range(config.requests), config.concurrency)
+            sqlite_seconds = sqlite_write_seconds() - sqlite_before
+
+        return {
+            "scenario": scenario,
+            "format": format,
+            "size": size,
+            "requests": config.requests,
+            "errors": errors,
+            "seconds": round(seconds, 4),
+            "requests_per_second": round(config.requests / seconds, 2) if seconds else 0.0,
+            "latency_ms": latency_summary(latencies),
+            "rss_start_mb": round(rss.start_bytes / 2 ** 20, 1),
+            "peak_rss_mb": round(rss.peak_bytes / 2 ** 20, 1),
+            "sqlite_write_seconds": round(sqlite_seconds, 4),
+            "sqlite_write_ms_per_request": round(sqlite_seconds / config.requests * 1000, 3),
+            "llm_calls": self.model.calls - llm_calls,
+            "llm_errors": self.model.errors - llm_errors
+        }
+
+    async def run(self, on_result=None) -> List[Dict]:
+        results = []
+        try:
+            for scenario in self.config.scenarios:
+                for format in self.config.formats:
+                    for size in self.config.sizes:
+                        result = await self.run_scenario(scenario, format, size)
+                        results.append(result)
+                        if on_result:
+                            on_result(result)
+        finally:
+            await self.close()
+        return results
+
+
+def run_benchmarks(config: BenchmarkConfig, on_result=None) -> Dict:
+    """
+    Run every configured scenario against main.py's app and return the report.
+
+    The environment (database paths, LLM cache, job workers) must be set up
+    before this is called, since main.py reads it at import time.
+    """
+    import main
+    try:
+        results = asyncio.run(Harness(main, config).run(on_result))
+    finally:
+        main.pdf_parser_pool.shutdown()
+        main.shared_memory.close()
+        main.gemini_client.close()
+
+    config = dict(config._asdict(), profile=config.profile._asdict(), responses=bool(config.responses))
+    return dict(run_metadata(), config=config, results=results)
+
+
+def run_metadata() -> Dict:
+    """When, where and on which commit a report was produced, with the service's settings."""
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "environment": {key: value for key, value in sorted(os.environ.items())
+                        if key.startswith(CONFIG_ENV_PREFIXES)}
+    }
+
+
+def default_output_path(report: Dict) -> str:
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    commit = report["git"]["commit"] or "nogit"
+    return os.path.join(RESULTS_DIR, f"{stamp}-{commit}.json")
+
+
+def save_report(report: Dict, path: Optional[str] = None) -> str:
+    path = path or default_output_path(report)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def format_result(result: Dict) -> str:
+    latency = result["latency_ms"]
+    line = (f"{result['scenario']:<10} {result['format']:<6} {result['size']:<8} "
+            f"{result['requests_per_second']:>9.1f} req/s  "
+            f"p50 {latency['p50']:>8.1f}  p95 {latency['p95']:>8.1f}  p99 {latency['p99']:>8.1f} ms  "
+            f"rss {result['peak_rss_mb']:>7.1f} MB")
+    if result.get("sqlite_write_ms_per_request") is not None:
+        line += f"  sqlite {result['sqlite_write_ms_per_request']:>7.3f} ms/req"
+    return line + f"  errors {result['errors']}"
+
+
+def _change(before, after):
+    if not before:
+        return "    n/a"
+    return f"{(after - before) / before * 100:+6.1f}%"
+
+
+def compare_reports(baseline: Dict, candidate: Dict) -> List[str]:
+    """Side-by-side throughput and latency of two saved reports, matched by scenario/format/size."""
+    def key(result):
+        return result["scenario"], result["format"], result["size"]
+
+    lines = [f"baseline  {baseline['git']['commit']} ({baseline['created_at']})",
+             f"candidate {candidate['git']['commit']} ({candidate['created_at']})",
+             f"{'scenario':<10} {'format':<6} {'size':<8} "
+             + "  ".join(f"{column:>28}" for column in ("req/s", "p95 ms", "p99 ms", "peak rss MB"))]
+    baseline_results = {key(result): result for result in baseline["results"]}
+    for result in candidate["results"]:
+        before = baseline_results.get(key(result))
+        if before is None:
+            continue
+        columns = []
+        for name, get in (("rps", lambda r: r["requests_per_second"]),
+                          ("p95", lambda r: r["latency_ms"]["p95"]),
+                          ("p99", lambda r: r["latency_ms"]["p99"]),
+                          ("rss", lambda r: r["peak_rss_mb"])):
+            columns.append(f"{get(before):>8.1f} -> {get(result):>8.1f} {_change(get(before), get(result))}")
+        lines.append(f"{result['scenario']:<10} {result['format']:<6} {result['size']:<8} " + "  ".join(columns))
+    return lines
@@ -0,0 +1,352 @@
+"""
+Replay recorded intake traffic through the current pipeline.
+
+Payloads are rebuilt from a SharedMemory database, which is only ever opened
+read-only: emails from the stored headers and body, JSON documents from the stored data,
+streamed arrays and NDJSON from their per-record rows. PDF bytes are not
+stored, so PDFs are replayed only from a payload archive: a directory of
+captured files named <input_id>.<ext>, which also take precedence over
+rebuilt payloads. Archive files with other names are replayed without
+recorded outputs to compare against.
+
+Each replayed input's format, intent and extraction fields are diffed
+against what was recorded, alongside the usual latency and throughput.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from agents.mime_parser import HEADER_FIELDS
+from benchmarks.fake_llm import LatencyProfile, install_fake_llm
+from benchmarks.harness import PeakRSS, drive, latency_summary, run_metadata, sqlite_write_seconds
+from utils.json_stream import JSON_STREAM_FORMATS
+from utils.llm_scheduler import LLMScheduler
+
+INPUT_PAGE_SIZE = 200
+MAX_MISMATCHES = 50
+MAX_VALUE_CHARS = 200
+# Top-level result keys holding the payload itself or per-run bookkeeping
+PAYLOAD_FIELDS = ("body", "data", "input_metadata", "attachment_results")
+# Keys that differ on every run
+VOLATILE_FIELDS = ("processed_at", "page_timings")
+
+
+class ReplayCase(NamedTuple):
+    """
+    One input to replay.
+
+    format: The recorded format, or None for unmatched archive files
+    expected: Recorded format, intent and flattened extraction fields, or
+        None when nothing was recorded for this payload
+    """
+    name: str
+    input_type: str
+    payload: bytes
+    format: Optional[str]
+    expected: Optional[Dict]
+
+
+class ReplayConfig(NamedTuple):
+    """
+    What to replay and how.
+
+    db_path: SharedMemory database holding the recorded traffic
+    archive: Directory of captured payloads
+    formats: Only replay inputs recorded with these formats
+    rate: Target requests per second; None replays as fast as possible
+    live_llm: Call the configured Gemini model instead of the fake one
+    """
+    db_path: Optional[str] = None
+    archive: Optional[str] = None
+    formats: Optional[Sequence[str]] = None
+    limit: Optional[int] = None
+    rate: Optional[float] = None
+    concurrency: int = 8
+    live_llm: bool = False
+    profile: LatencyProfile = LatencyProfile()
+    llm_rate: float = 1000.0
+
+
+def flatten_fields(result: Dict, prefix: str = "") -> Dict:
+    """Nested extraction fields as dotted paths, without payload and volatile keys."""
+    fields = {}
+    for key, value in result.items():
+        if key in VOLATILE_FIELDS or (not prefix and key in PAYLOAD_FIELDS):
+            continue
+        if isinstance(value, dict) and value:
+            fields.update(flatten_fields(value, f"{prefix}{key}."))
+        else:
+            fields[f"{prefix}{key}"] = value
+    return fields
+
+
+def extraction_fields(result: Dict, format: str) -> Dict:
+    """The fields compared between a recorded and a replayed result."""
+    if format in JSON_STREAM_FORMATS:
+        return {"records": result.get("records")}
+    return flatten_fields(result)
+
+
+def rebuild_payload(format: str, rows: List[Dict]) -> Optional[bytes]:
+    """Reconstruct the original payload from an input's extracted_fields rows."""
+    if format in JSON_STREAM_FORMATS:
+        rows = sorted(rows, key=lambda row: row.get("metadata", {}).get("record_index", 0))
+        records = [json.dumps(row["data"]) for row in rows if "data" in row]
+        text = "".join(record + "\n" for record in records) if format == "ndjson" else "[" + ",".join(records) + "]"
+        return text.encode('utf-8')
+    if not rows:
+        return None
+    row = rows[0]
+    if format == "email" and isinstance(row.get("body"), str):
+        # The body was stored parsed; its headers go back in front of it
+        headers = row.get("headers") if isinstance(row.get("headers"), dict) else {}
+        lines = [f"{name}: {headers[key]}" for key, name in HEADER_FIELDS if headers.get(key)]
+        return ("".join(line + "\n" for line in lines) + "\n" + row["body"] if lines else row["body"]).encode('utf-8')
+    if format == "json" and isinstance(row.get("data"), dict):
+        data = row["data"]
+        # Unparseable JSON was recorded as {"raw": text}
+        if set(data) == {"raw"} and isinstance(data["raw"], str):
+            return data["raw"].encode('utf-8')
+        return json.dumps(data).encode('utf-8')
+    return None
+
+
+def iter_recorded(db_path: str) -> Iterator:
+    """
+    Yield (input_id, type, format, intent, rows) for every recorded input,
+    oldest first, with rows the decoded extracted_fields data.
+    """
+    conn = sqlite3.connect(Path(db_path).absolute().as_uri() + "?mode=ro", uri=True)
+    try:
+        last_id = 0
+        while True:
+            inputs = conn.execute(
+                "SELECT id, type, format, intent FROM inputs WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, INPUT_PAGE_SIZE)
+            ).fetchall()
+            if not inputs:
+                return
+            last_id = inputs[-1][0]
+            rows = {}
+            ids = [row[0] for row in inputs]
+            for input_id, data in conn.execute(
+                f"SELECT input_id, data FROM extracted_fields WHERE input_id IN ({','.join('?' * len(ids))}) "
+                "ORDER BY id",
+                ids
+            ):
+                try:
+                    rows.setdefault(input_id, []).append(json.loads(data))
+                except (TypeError, ValueError):
+                    continue
+            for input_id, input_type, format, intent in inputs:
+                yield input_id, input_type, format, intent, rows.get(input_id, [])
+    finally:
+        conn.close()
+
+
+def iter_cases(config: ReplayConfig, skipped: Counter) -> Iterator[ReplayCase]:
+    """
+    Yield the inputs to replay, counting those that cannot be rebuilt in
+    skipped by their recorded format.
+    """
+    archive = {}
+    if config.archive:
+        archive = {path.name: path for path in sorted(Path(config.archive).iterdir()) if path.is_file()}
+    by_id = {path.stem: name for name, path in archive.items() if path.stem.isdigit()}
+    emitted = 0
+
+    def wanted(format):
+        return config.formats is None or format in config.formats
+
+    if config.db_path:
+        for input_id, input_type, format, intent, rows in iter_recorded(config.db_path):
+            if not wanted(format):
+                continue
+            if config.limit is not None and emitted >= config.limit:
+                return
+            archived = by_id.pop(str(input_id), None)
+            if archived:
+                payload = archive.pop(archived).read_bytes()
+            else:
+                payload = rebuild_payload(format, rows)
+            if payload is None:
+                skipped[format or "unknown"] += 1
+                continue
+            records = [row for row in rows if isinstance(row, dict)]
+            recorded = {"records": len(records)} if format in JSON_STREAM_FORMATS else (
+                flatten_fields(records[0]) if records else {})
+            expected = {"format": format, "intent": intent, "fields": recorded}
+            emitted += 1
+            yield ReplayCase(f"input {input_id}", input_type, payload, format, expected)
+
+    if config.formats is not None:
+        return
+    for name, path in archive.items():
+        if config.limit is not None and emitted >= config.limit:
+            return
+        emitted += 1
+        yield ReplayCase(name, "file", path.read_bytes(), None, None)
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _clip(value):
+    text = value if isinstance(value, str) else _canonical(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS] + "..."
+
+
+class Agreement:
+    """Per-field agreement between recorded and replayed outputs."""
+
+    def __init__(self):
+        self.fields: Dict[str, List[int]] = {}
+        self.mismatches = []
+
+    def compare(self, case: ReplayCase, field: str, recorded, replayed):
+        stats = self.fields.setdefault(field, [0, 0])
+        stats[0] += 1
+        if _canonical(recorded) == _canonical(replayed):
+            stats[1] += 1
+        elif len(self.mismatches) < MAX_MISMATCHES:
+            self.mismatches.append({
+                "input": case.name,
+                "field": field,
+                "recorded": _clip(recorded),
+                "replayed": _clip(replayed)
+            })
+
+    def compare_result(self, case: ReplayCase, result: Dict):
+        expected = case.expected
+        metadata = result.get("input_metadata", {})
+        self.compare(case, "format", expected["format"], metadata.get("format"))
+        self.compare(case, "intent", expected["intent"], metadata.get("intent"))
+        recorded = expected["fields"]
+        replayed = extraction_fields(result, expected["format"])
+        for field in sorted(set(recorded) | set(replayed)):
+            self.compare(case, f"fields.{field}", recorded.get(field), replayed.get(field))
+
+    def compare_error(self, case: ReplayCase, error: Exception):
+        self.compare(case, "format", case.expected["format"], f"error: {error}")
+
+    def report(self) -> Dict:
+        fields = {
+            field: {"compared": compared, "matched": matched, "rate": round(matched / compared, 4)}
+            for field, (compared, matched) in self.fields.items()
+        }
+        return {"fields": fields, "mismatches": self.mismatches}
+
+
+class Replayer:
+    """Drives ReplayCases through main.py's pipeline and collects timings and diffs."""
+
+    def __init__(self, app_module, config: ReplayConfig):
+        from agents.job_worker import decode_payload
+        self.main = app_module
+        self.config = config
+        self.decode_payload = decode_payload
+        self.model = None
+        if not config.live_llm:
+            self.model = install_fake_llm(app_module.gemini_client, config.profile)
+            app_module.gemini_client.scheduler = LLMScheduler(rate_per_second=config.llm_rate,
+                                                              burst=config.llm_rate)
+        self.agreement = Agreement()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors = Counter()
+
+    async def replay_one(self, case: ReplayCase):
+        input_data = self.decode_payload(case.input_type, case.payload)
+        started = time.perf_counter()
+        try:
+            result = await self.main.pipeline.run(input_data, case.input_type, source="replay")
+        except Exception as e:
+            self.errors[case.format or "unrecorded"] += 1
+            if case.expected is not None:
+                self.agreement.compare_error(case, e)
+            raise
+        finally:
+            self.latencies.setdefault(case.format or "unrecorded", []).append(time.perf_counter() - started)
+        if case.expected is not None:
+            self.agreement.compare_result(case, result)
+
+    async def run(self, cases: Iterator[ReplayCase]) -> List[Dict]:
+        config = self.config
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            llm_calls = self.model.calls if self.model else 0
+            sqlite_before = sqlite_write_seconds()
+            with PeakRSS() as rss:
+                latencies, errors, seconds = await drive(self.replay_one, cases, config.concurrency, config.rate)
+            sqlite_seconds = sqlite_write_seconds() - sqlite_before
+
+        def entry(format, format_latencies, format_errors, totals=False):
+            count = len(format_latencies)
+            entry = {
+                "scenario": "replay",
+                "format": format,
+                "size": "recorded",
+                "requests": count,
+                "errors": format_errors,
+                "seconds": round(seconds, 4),
+                "requests_per_second": round(count / seconds, 2) if seconds else 0.0,
+                "latency_ms": latency_summary(sorted(format_latencies)),
+                "rss_start_mb": round(rss.start_bytes / 2 ** 20, 1),
+                "peak_rss_mb": round(rss.peak_bytes / 2 ** 20, 1)
+            }
+            if totals:
+                entry.update({
+                    "sqlite_write_seconds": round(sqlite_seconds, 4),
+                    "sqlite_write_ms_per_request": round(sqlite_seconds / count * 1000, 3) if count else 0.0,
+                    "llm_calls": self.model.calls - llm_calls if self.model else None
+                })
+            return entry
+
+        results = [entry(format, self.latencies[format], self.errors[format]) for format in sorted(self.latencies)]
+        results.append(entry("all", latencies, errors, totals=True))
+        return results
+
+
+def run_replay(config: ReplayConfig) -> Dict:
+    """
+    Replay the configured inputs against main.py's pipeline and return the report.
+
+    As with run_benchmarks, the environment must point main.py at throwaway
+    databases before this is called.
+    """
+    import asyncio
+    if config.db_path and not os.path.exists(config.db_path):
+        raise FileNotFoundError(f"No SharedMemory database at {config.db_path}")
+    import main
+    skipped = Counter()
+    try:
+        replayer = Replayer(main, config)
+        results = asyncio.run(replayer.run(iter_cases(config, skipped)))
+    finally:
+        main.pdf_parser_pool.shutdown()
+        main.shared_memory.close()
+        main.gemini_client.close()
+
+    settings = dict(config._asdict(), profile=config.profile._asdict())
+    return dict(run_metadata(), config=settings, results=results, replay={
+        "skipped": dict(skipped),
+        "agreement": replayer.agreement.report()
+    })
+
+
+def format_agreement(report: Dict) -> List[str]:
+    """Agreement lines for the console, least matching fields first after format and intent."""
+    fields = report["replay"]["agreement"]["fields"]
+    order = [field for field in ("format", "intent") if field in fields]
+    order += sorted((field for field in fields if field not in order), key=lambda field: (fields[field]["rate"], field))
+    lines = [f"{field:<48} {fields[field]['matched']:>6}/{fields[field]['compared']:<6} "
+             f"{fields[field]['rate']:>7.1%}" for field in order]
+    skipped = report["replay"]["skipped"]
+    if skipped:
+        lines.append("skipped (payload not recorded): " + ", ".join(f"{format} {count}"
+                                                                    for format, count in sorted(skipped.items())))
+    return lines
@@ -0,0 +1,107 @@
+"""
+Cold start of the API in fresh interpreters: importing main.py, running the
+lifespan startup, and the first requests a new worker serves.
+
+Each run is a separate process executing this module, which prints its
+phase timings as JSON; run_startup aggregates them. The first /intake
+request uses the fake model, so it measures the service's own warm-up and
+not Gemini's latency.
+"""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks.harness import PeakRSS, latency_summary, run_metadata
+
+# Phases reported by every run, in order
+STARTUP_PHASES = ("import", "lifespan_startup", "first_get", "first_intake", "ready", "llm_preload")
+# Modules that should not be imported until first use
+LAZY_MODULES = ("google.generativeai", "PyPDF2", "httpx")
+FIRST_EMAIL = "From: buyer@example.com\nSubject: Request for quote\n\nPlease send a quotation for 200 hinges."
+
+
+def measure_startup() -> Dict:
+    """Time one cold start in this (fresh) process."""
+    import asyncio
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    loaded_at_import = [name for name in LAZY_MODULES if name in sys.modules]
+
+    async def first_requests():
+        import httpx
+        from benchmarks.fake_llm import LatencyProfile, install_fake_llm
+        timings = {}
+        lifespan_started = time.perf_counter()
+        async with main.lifespan(main.app):
+            timings["lifespan_startup"] = time.perf_counter() - lifespan_started
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                         base_url="http://startup") as client:
+                request_started = time.perf_counter()
+                (await client.get("/inputs")).raise_for_status()
+                timings["first_get"] = time.perf_counter() - request_started
+                # Installed after startup, so the real SDK preload still runs alongside
+                install_fake_llm(main.gemini_client, LatencyProfile(latency_ms=1.0, jitter=0.0))
+                request_started = time.perf_counter()
+                (await client.post("/intake", data={"email_text": FIRST_EMAIL})).raise_for_status()
+                timings["first_intake"] = time.perf_counter() - request_started
+                timings["ready"] = time.perf_counter() - started
+        # Leaving the lifespan waits for the background SDK preload to finish
+        timings["llm_preload"] = time.perf_counter() - started
+        return timings
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        timings = asyncio.run(first_requests())
+    timings["import"] = imported - started
+    timings["loaded_at_import"] = loaded_at_import
+    timings["peak_rss_mb"] = round(PeakRSS._current() / 2 ** 20, 1)
+    return timings
+
+
+def run_startup(runs: int) -> Dict:
+    """
+    Measure runs cold starts, each in a new interpreter, and return the report.
+
+    The environment must already point the service at throwaway databases.
+    """
+    samples: List[Dict] = []
+    process_seconds = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-m", "benchmarks.startup"], capture_output=True, text=True)
+        process_seconds.append(time.perf_counter() - started)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Startup run failed:\n{completed.stderr[-2000:]}")
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    def entry(phase, seconds):
+        return {
+            "scenario": "startup",
+            "format": phase,
+            "size": "cold",
+            "requests": len(seconds),
+            "errors": 0,
+            "seconds": round(sum(seconds), 4),
+            "requests_per_second": 0.0,
+            "latency_ms": latency_summary(sorted(seconds)),
+            "peak_rss_mb": max(sample["peak_rss_mb"] for sample in samples)
+        }
+
+    results = [entry(phase, [sample[phase] for sample in samples]) for phase in STARTUP_PHASES]
+    results.append(entry("process", process_seconds))
+    loaded = sorted({name for sample in samples for name in sample["loaded_at_import"]})
+    return dict(run_metadata(), config={"runs": runs}, results=results, startup={"loaded_at_import": loaded})
+
+
+def format_startup(result: Dict) -> str:
+    latency = result["latency_ms"]
+    return (f"{result['format']:<18} p50 {latency['p50']:>8.1f}  max {latency['max']:>8.1f} ms  "
+            f"rss {result['peak_rss_mb']:>7.1f} MB")
+
+
+if __name__ == "__main__":
+    print(json.dumps(measure_startup()))
@@ -0,0 +1,68 @@
+"""
+Backfill historical mail from an mbox file, a Maildir or a directory of .eml
+files into shared_memory.db without going through the HTTP API. Messages run
+through the intake pipeline like /intake/batch items, their writes are
+group-committed, and progress is checkpointed so an interrupted run resumes
+where it stopped.
+
+    python ingest_mailbox.py archive.mbox [--concurrency 8] [--checkpoint archive.mbox.checkpoint.json]
+    python ingest_mailbox.py ~/Maildir --format maildir --restart
+"""
+import argparse
+import asyncio
+import json
+
+from agents.mailbox_ingest import (
+    MailboxIngester, MAILBOX_FORMATS, MAILBOX_CONCURRENCY, MAILBOX_CHECKPOINT_EVERY, MAILBOX_PROGRESS_SECONDS
+)
+
+
+async def run(args):
+    # Imported here so --help does not open the database or load the agents
+    from main import batch_pipeline
+    ingester = MailboxIngester(
+        batch_pipeline,
+        args.source,
+        format=args.format,
+        checkpoint_path=args.checkpoint,
+        concurrency=args.concurrency,
+        checkpoint_every=args.checkpoint_every,
+        progress_seconds=args.progress_seconds
+    )
+    print(f"Ingesting {ingester.format} {args.source} with {args.concurrency} concurrent messages, "
+          f"checkpoint {ingester.checkpoint_path}")
+    try:
+        summary = await ingester.run(limit=args.limit, restart=args.restart)
+    except asyncio.CancelledError:
+        print(f"Interrupted; checkpoint saved at position {ingester.position!r}")
+        raise
+    print(f"[mailbox] done: {ingester.format_progress()}")
+    print(json.dumps(summary, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest an mbox, Maildir or .eml directory into shared memory")
+    parser.add_argument("source", help="mbox file, Maildir, .eml file or directory of .eml files")
+    parser.add_argument("--format", choices=MAILBOX_FORMATS, help="Mailbox format (detected from the path by default)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <source>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--concurrency", type=int, default=MAILBOX_CONCURRENCY)
+    parser.add_argument("--checkpoint-every", type=int, default=MAILBOX_CHECKPOINT_EVERY,
+                        help="Messages between checkpoints")
+    parser.add_argument("--progress-seconds", type=float, default=MAILBOX_PROGRESS_SECONDS)
+    parser.add_argument("--limit", type=int, help="Stop after this many messages")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        import main as service
+        service.pdf_parser_pool.shutdown()
+        service.shared_memory.close()
+        service.gemini_client.close()
+
+
+if __name__ == "__main__":
+    main()
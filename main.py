@@ -1,42 +1,224 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, PlainTextResponse
 from agents.classifier import ClassifierAgent
 from agents.json_agent import JSONAgent
 from agents.email_agent import EmailAgent
 from agents.pdf_agent import PDFAgent
+from agents.pdf_parser import PDFParserPool, PDFOptions
+from agents.pdf_probe import PDFProbeError
+from agents.pipeline import IntakePipeline, UnsupportedFormatError
+from agents.job_worker import JobWorkers, JOB_WORKERS, is_local_url
+from memory.job_queue import JobQueue
+from memory.group_commit import CommitScope, GroupCommitError, commit_scope
 from memory.shared_memory import SharedMemory
-from utils.llm_client import GeminiClient
+from utils.llm_client import GeminiClient, LLM_PRELOAD
+from utils.single_flight import SingleFlight
+from utils.intent_model import load_intent_model
+from utils.spooled_upload import SpooledUpload, UploadTooLargeError, UPLOAD_MAX_BYTES
+from utils.json_stream import JSONStreamOptions, sniff_json_stream
+from utils.metrics import render_metrics, timed_stage
+import asyncio
 import json
+import os
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 import traceback
 
+# Default and maximum number of items /intake/batch processes concurrently
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "64"))
+
+# Allowance for multipart boundaries and form fields on top of UPLOAD_MAX_BYTES
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+async def _preload_llm():
+    try:
+        await gemini_client.preload()
+    except Exception as e:
+        print(f"Gemini client preload failed: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The app accepts requests while the Gemini SDK loads in the background
+    preload = asyncio.create_task(_preload_llm()) if LLM_PRELOAD else None
+    if JOB_WORKERS > 0:
+        job_workers.start()
+    yield
+    if preload is not None:
+        await preload
+    await job_workers.stop()
+    pdf_parser_pool.shutdown()
+    shared_memory.close()
+    gemini_client.close()
+
 app = FastAPI(
     title="Multi-Format Intake Agent with Gemini AI",
     description="Accept data in PDF, JSON, or Email format, intelligently classify it using Gemini AI, and route to the appropriate agent.",
-    version="1.1.0"
+    version="1.1.0",
+    lifespan=lifespan
 )
 shared_memory = SharedMemory()
 gemini_client = GeminiClient()  # Initialize the Gemini client
-classifier = ClassifierAgent(shared_memory, gemini_client)
-json_agent = JSONAgent(shared_memory, gemini_client)
-email_agent = EmailAgent(shared_memory, gemini_client)
-pdf_agent = PDFAgent(shared_memory, gemini_client)
+pdf_parser_pool = PDFParserPool()  # Worker processes are started on the first PDF
+single_flight = SingleFlight()  # Coalesces identical in-flight documents across all pipelines
+intent_model = load_intent_model()  # None until train_intent_model.py has been run
+
+def build_pipeline(memory: SharedMemory) -> IntakePipeline:
+    """Wire the classifier and format agents to the given shared memory."""
+    return IntakePipeline(
+        memory,
+        ClassifierAgent(memory, gemini_client, single_flight, intent_model),
+        JSONAgent(memory, gemini_client, single_flight),
+        EmailAgent(memory, gemini_client, single_flight),
+        PDFAgent(memory, gemini_client, pdf_parser_pool, single_flight)
+    )
+
+pipeline = build_pipeline(shared_memory)
+# Bulk intake always batches its SharedMemory writes through group commits
+batch_pipeline = build_pipeline(shared_memory.group_commit_view())
+job_queue = JobQueue(shared_memory.pool)
+job_workers = JobWorkers(job_queue, pipeline)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Reject /intake uploads by Content-Length before the body is read."""
+    if request.method == "POST" and request.url.path == "/intake":
+        length = request.headers.get("content-length", "")
+        if length.isdigit() and int(length) > UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"error": "Payload too large", "detail": f"Uploads are limited to {UPLOAD_MAX_BYTES} bytes"}
+            )
+    return await call_next(request)
+
+@app.get("/metrics")
+def metrics():
+    """Per-stage latency histograms and fallback/parse-failure/cache-hit counters (Prometheus text format)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats/llm-cache")
+def llm_cache_stats():
+    """Hit/miss counters for the LLM response cache, shared across workers."""
+    return JSONResponse(content=gemini_client.cache_stats())
+
+@app.get("/stats/llm-scheduler")
+def llm_scheduler_stats():
+    """Queue depth, wait times and current rate/concurrency limits for Gemini calls."""
+    return JSONResponse(content=gemini_client.scheduler_stats())
+
+@app.get("/stats/intent-model")
+def intent_model_stats():
+    """How many intents the local model answered without an LLM call."""
+    if intent_model is None:
+        return JSONResponse(content={"enabled": False})
+    return JSONResponse(content=dict(intent_model.stats(), enabled=True))
+
+def _pdf_options(char_budget, pages, strategy, sample_pages, parallel, metadata_only):
+    """Build PDFOptions from /intake query parameters, or None if none were given."""
+    overrides = {}
+    if char_budget is not None:
+        overrides["char_budget"] = char_budget
+    if pages:
+        first, dash, last = pages.partition("-")
+        overrides["first_page"] = int(first)
+        overrides["last_page"] = int(last) if last else (None if dash else int(first))
+    if strategy:
+        overrides["strategy"] = strategy
+    if sample_pages is not None:
+        overrides["sample_pages"] = sample_pages
+    if parallel is not None:
+        overrides["parallel"] = parallel
+    if metadata_only:
+        overrides["metadata_only"] = True
+    return PDFOptions(**overrides) if overrides else None
+
+def _json_stream_options(analyze, concurrency):
+    """Build JSONStreamOptions from /intake query parameters, or None if none were given."""
+    overrides = {}
+    if analyze is not None:
+        overrides["analyze"] = analyze
+    if concurrency is not None:
+        overrides["concurrency"] = concurrency
+    return JSONStreamOptions(**overrides) if overrides else None
+
 @app.post("/intake")
-async def intake(request: Request, file: UploadFile = File(None), json_data: str = Form(None), email_text: str = Form(None)):
+async def intake(
+    request: Request,
+    file: UploadFile = File(None),
+    json_data: str = Form(None),
+    email_text: str = Form(None),
+    mode: str = Query("sync", pattern="^(sync|async)$"),
+    callback_url: str = Query(None),
+    pdf_char_budget: int = Query(None, ge=1),
+    pdf_pages: str = Query(None, pattern=r"^\d+(-\d*)?$"),
+    pdf_page_strategy: str = Query(None, pattern="^(sequential|sample)$"),
+    pdf_sample_pages: int = Query(None, ge=1),
+    pdf_parallel: bool = Query(None),
+    pdf_metadata_only: bool = Query(False),
+    json_analyze_records: bool = Query(None),
+    json_concurrency: int = Query(None, ge=1)
+):
+    """
+    Classify and process one input. With `mode=async` the payload is queued
+    and a job id is returned immediately; poll `/jobs/{id}` for the result or
+    pass a local `callback_url` to be notified.
+    
+    For PDFs, `pdf_pages` (e.g. `3-10`, `5-` or `7`), `pdf_char_budget`,
+    `pdf_page_strategy`, `pdf_sample_pages` and `pdf_parallel` override the
+    text extraction defaults for this request; `pdf_metadata_only=true` returns
+    version, page count, title and encryption/linearization flags read from
+    the trailer without extracting text. Truncated or corrupt PDFs are
+    rejected with a 400.
+    
+    JSON arrays and NDJSON (uploaded or in `json_data`) are streamed record by
+    record, each logged under the input's thread_id; `json_analyze_records`
+    runs the JSON analysis on every record, `json_concurrency` at a time.
+    """
+    upload = None
     try:
         print(f"Received request: file={file is not None}, json_data={json_data is not None}, email_text={email_text is not None}")
         
+        pdf_options = _pdf_options(pdf_char_budget, pdf_pages, pdf_page_strategy, pdf_sample_pages, pdf_parallel,
+                                   pdf_metadata_only)
+        json_options = _json_stream_options(json_analyze_records, json_concurrency)
+        if mode == "async" and (pdf_options is not None or json_options is not None):
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Invalid options", "detail": "PDF and JSON stream options are only supported with mode=sync"}
+            )
+        
+        if mode == "async" and callback_url and not is_local_url(callback_url):
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Invalid callback_url", "detail": "Callbacks are only delivered to local http(s) URLs"}
+            )
+        
         if file and file.filename:
-            content = await file.read()
+            # Stream the upload into a size-bounded spool instead of reading it whole
+            try:
+                with timed_stage("upload_read"):
+                    upload = await SpooledUpload.from_upload(file)
+            except UploadTooLargeError as e:
+                return JSONResponse(
+                    status_code=413,
+                    content={"error": "Payload too large", "detail": str(e)}
+                )
             input_type = "file"
-            input_data = content
-            print(f"Processing file: {file.filename}, size: {len(content)} bytes")
+            input_data = upload
+            payload = None
+            print(f"Processing file: {file.filename}, size: {upload.size} bytes")
+        elif json_data and json_data.strip() and sniff_json_stream(json_data):
+            # Arrays and NDJSON are parsed record by record by the JSON agent
+            input_data = json_data
+            payload = json_data.encode('utf-8')
+            input_type = "json"
+            print(f"Processing JSON stream: {json_data[:100]}...")
         elif json_data and json_data.strip():
             try:
                 input_data = json.loads(json_data)
+                payload = json_data.encode('utf-8')
                 input_type = "json"
                 print(f"Processing JSON data: {json_data[:100]}...")
             except json.JSONDecodeError as e:
@@ -47,6 +229,7 @@ async def intake(request: Request, file: UploadFile = File(None), json_data: str
                 )
         elif email_text and email_text.strip():
             input_data = email_text
+            payload = email_text.encode('utf-8')
             input_type = "email"
             print(f"Processing email text: {email_text[:100]}...")
         else:
@@ -56,34 +239,31 @@ async def intake(request: Request, file: UploadFile = File(None), json_data: str
                 content={"error": "No input provided", "detail": "Please provide either a file, JSON data, or email text"}
             )
 
-        # Classify input and route to the appropriate agent
-        format_type, intent = await classifier.classify(input_data, input_type)
-        print(f"Classified as format: {format_type}, intent: {intent}")
-        
-        # Log input and get the input_id
-        input_id = shared_memory.log_input("api", input_type, format_type, intent)
-        print(f"Logged input with ID: {input_id}")
+        if mode == "async":
+            if upload is not None:
+                payload = await asyncio.to_thread(upload.read_bytes)
+            job_id = await job_queue.enqueue_async(input_type, payload, callback_url)
+            job_workers.notify()
+            print(f"Queued job {job_id}")
+            return JSONResponse(
+                status_code=202,
+                content={"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+            )
         
-        if format_type == "json":
-            result = await json_agent.process(input_data, input_id)
-        elif format_type == "email":
-            result = await email_agent.process(input_data, input_id)
-        elif format_type == "pdf":
-            result = await pdf_agent.process(input_data, input_id)
-        else:
-            print(f"Unsupported format: {format_type}")
+        try:
+            result = await pipeline.run(input_data, input_type, pdf_options=pdf_options, json_options=json_options)
+        except UnsupportedFormatError as e:
+            print(f"Unsupported format: {e.format_type}")
             return JSONResponse(
                 status_code=400,
-                content={"error": f"Unsupported format: {format_type}"}
+                content={"error": str(e)}
+            )
+        except PDFProbeError as e:
+            print(f"Corrupt PDF: {str(e)}")
+            return JSONResponse(
+                status_code=400,
+                content={"error": "Corrupt PDF", "detail": str(e)}
             )
-
-        # Add input metadata to the response
-        result["input_metadata"] = {
-            "id": input_id,
-            "format": format_type,
-            "intent": intent,
-            "timestamp": shared_memory.get_input_timestamp(input_id)
-        }
         
         print(f"Returning result: {str(result)[:100]}...")
         return JSONResponse(content=result)
@@ -95,6 +275,194 @@ async def intake(request: Request, file: UploadFile = File(None), json_data: str
             status_code=500,
             content={"error": "Internal server error", "detail": str(e)}
         )
+    finally:
+        if upload is not None:
+            upload.close()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status of an async intake job, with its result once it has succeeded."""
+    job = await job_queue.get_async(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return JSONResponse(content=job)
+
+def _parse_batch_items(text):
+    """
+    Parse a JSON array or NDJSON into batch items. Objects are JSON documents
+    and plain strings are treated as email text.
+    """
+    stripped = text.strip()
+    if stripped.startswith('['):
+        values = json.loads(stripped)
+    else:
+        values = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+    return [("email", value) if isinstance(value, str) else ("json", value) for value in values]
+
+def _close_uploads(items):
+    for input_type, data in items:
+        if isinstance(data, SpooledUpload):
+            data.close()
+
+async def _read_batch_items(request: Request):
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data") or content_type.startswith("application/x-www-form-urlencoded"):
+        form = await request.form()
+        items = []
+        try:
+            for upload in form.getlist("files"):
+                if getattr(upload, "filename", None):
+                    with timed_stage("upload_read"):
+                        items.append(("file", await SpooledUpload.from_upload(upload)))
+        except UploadTooLargeError:
+            _close_uploads(items)
+            raise
+        for value in form.getlist("json_data"):
+            items.extend(_parse_batch_items(value))
+        for value in form.getlist("email_text"):
+            items.append(("email", value))
+        return items
+    body = await request.body()
+    return _parse_batch_items(body.decode('utf-8'))
+
+@app.post("/intake/batch")
+async def intake_batch(
+    request: Request,
+    stream: bool = False,
+    concurrency: int = Query(BATCH_CONCURRENCY, ge=1)
+):
+    """
+    Process many inputs in one request. Accepts multipart form data (repeated
+    `files`, `json_data` and `email_text` fields), a JSON array, or NDJSON.
+    Items run concurrently up to `concurrency`; with `stream=true` results are
+    streamed as NDJSON in completion order, otherwise returned in input order.
+    """
+    try:
+        items = await _read_batch_items(request)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Invalid batch payload", "detail": str(e)}
+        )
+    except UploadTooLargeError as e:
+        return JSONResponse(
+            status_code=413,
+            content={"error": "Payload too large", "detail": str(e)}
+        )
+    if not items:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "No input provided", "detail": "The batch contains no items"}
+        )
+    print(f"Received batch of {len(items)} items")
+    
+    semaphore = asyncio.Semaphore(min(concurrency, BATCH_MAX_CONCURRENCY))
+    
+    async def run_item(index, input_type, input_data):
+        async with semaphore:
+            try:
+                result = await batch_pipeline.run(input_data, input_type, source="batch")
+                return {"index": index, "status": "ok", "result": result}
+            except Exception as e:
+                print(f"Error processing batch item {index}: {str(e)}")
+                return {"index": index, "status": "error", "error": str(e)}
+    
+    # Rows logged by this batch's tasks are tracked apart from concurrent batches
+    # sharing the writer, so its flush only fails for its own rows
+    scope = CommitScope()
+    scope_token = commit_scope.set(scope)
+    try:
+        tasks = [asyncio.create_task(run_item(i, input_type, data)) for i, (input_type, data) in enumerate(items)]
+    finally:
+        commit_scope.reset(scope_token)
+    
+    if stream:
+        async def results():
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield json.dumps(await task) + "\n"
+                try:
+                    await asyncio.to_thread(batch_pipeline.shared_memory.flush, scope)
+                except GroupCommitError as e:
+                    yield json.dumps({"status": "error", "error": str(e), "failed_rows": e.failed}) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                _close_uploads(items)
+        return StreamingResponse(results(), media_type="application/x-ndjson")
+    
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        _close_uploads(items)
+    try:
+        await asyncio.to_thread(batch_pipeline.shared_memory.flush, scope)
+    except GroupCommitError as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": "Failed to store batch results", "detail": str(e), "failed_rows": e.failed}
+        )
+    failed = sum(1 for result in results if result["status"] == "error")
+    return JSONResponse(content={
+        "results": results,
+        "succeeded": len(results) - failed,
+        "failed": failed
+    })
+
+@app.get("/inputs")
+async def list_inputs(
+    intent: str = None,
+    format: str = None,
+    since: str = None,
+    until: str = None,
+    cursor: int = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """
+    List logged inputs newest first. Pass the returned next_cursor as `cursor`
+    to fetch the following page.
+    """
+    records, next_cursor = await shared_memory.list_inputs_async(
+        intent=intent, format=format, since=since, until=until, before_id=cursor, limit=limit
+    )
+    return JSONResponse(content={
+        "items": [record._asdict() for record in records],
+        "next_cursor": next_cursor
+    })
+
+@app.get("/inputs/{input_id}/results")
+async def input_results(input_id: int, cursor: int = None, limit: int = Query(50, ge=1, le=500)):
+    """Agent results recorded for a single input."""
+    results, next_cursor = await shared_memory.list_extracted_fields_async(
+        input_id=input_id, before_id=cursor, limit=limit
+    )
+    return JSONResponse(content={"items": results, "next_cursor": next_cursor})
+
+@app.get("/threads/{thread_id}/results")
+async def thread_results(thread_id: str, cursor: int = None, limit: int = Query(50, ge=1, le=500)):
+    """Agent results recorded under a thread/conversation/document id."""
+    results, next_cursor = await shared_memory.list_extracted_fields_async(
+        thread_id=thread_id, before_id=cursor, limit=limit
+    )
+    return JSONResponse(content={"items": results, "next_cursor": next_cursor})
+
+@app.get("/search")
+async def search(
+    q: str,
+    agent: str = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Full-text search over email subjects/bodies/summaries, PDF text and JSON
+    values, best matches first with highlighted snippets.
+    """
+    results = await shared_memory.search_async(q, agent=agent, limit=limit, offset=offset)
+    return JSONResponse(content={
+        "items": results,
+        "next_offset": offset + limit if len(results) == limit else None
+    })
 
 @app.get("/", response_class=HTMLResponse)
 def root():
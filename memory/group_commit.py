@@ -0,0 +1,263 @@
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Writer configuration (overridable per deployment through the environment)
+GROUP_COMMIT_BATCH_SIZE = int(os.environ.get("SHARED_MEMORY_BATCH_SIZE", "256"))
+GROUP_COMMIT_INTERVAL_MS = float(os.environ.get("SHARED_MEMORY_FLUSH_INTERVAL_MS", "5"))
+ID_BLOCK_SIZE = int(os.environ.get("SHARED_MEMORY_ID_BLOCK_SIZE", "64"))
+# Row failures kept for reporting through flush(); older ones are only counted
+MAX_REPORTED_FAILURES = 20
+
+
+class GroupCommitError(Exception):
+    """Raised by GroupCommitWriter.flush() when queued rows could not be committed."""
+
+    def __init__(self, failed, errors):
+        super().__init__(f"{failed} queued rows failed to commit: {'; '.join(errors)}")
+        self.failed = failed
+        self.errors = errors
+
+
+class CommitScope:
+    """
+    Collects the row failures of the statements submitted while it is the
+    current commit_scope, so one caller's flush() is not failed by rows
+    another caller queued on the same writer.
+    """
+
+    def __init__(self):
+        self.failed = 0
+        self.errors = deque(maxlen=MAX_REPORTED_FAILURES)
+
+
+# Scope of the statements submitted from the current context; asyncio tasks
+# and asyncio.to_thread calls inherit it from the code that created them
+commit_scope = contextvars.ContextVar("commit_scope", default=None)
+
+
+class _FlushRequest:
+    """Queue marker a flush() call waits on; failure_total is the writer's count when it was queued."""
+
+    __slots__ = ("done", "failure_total", "failed", "errors")
+
+    def __init__(self, failure_total):
+        self.done = threading.Event()
+        self.failure_total = failure_total
+        self.failed = 0
+        self.errors = []
+
+
+class IdAllocator:
+    """
+    Hands out AUTOINCREMENT ids for a table without inserting a row first.
+
+    Ids are reserved in blocks by advancing the table's sqlite_sequence entry,
+    so other workers (in either durability mode) never receive the same id and
+    rows can be committed later with their id already known.
+    """
+
+    def __init__(self, pool, table, block_size=ID_BLOCK_SIZE):
+        self.pool = pool
+        self.table = table
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (self.table,)).fetchone()
+            if row is None:
+                start = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {self.table}").fetchone()[0]
+                conn.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                    (self.table, start + self.block_size)
+                )
+            else:
+                start = row[0]
+                conn.execute(
+                    "UPDATE sqlite_sequence SET seq = ? WHERE name = ?",
+                    (start + self.block_size, self.table)
+                )
+        self._next = start + 1
+        self._end = start + self.block_size + 1
+
+    def has_reserved(self):
+        """True if next_id can be served without touching the database."""
+        return self._next < self._end
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve()
+            allocated = self._next
+            self._next += 1
+            return allocated
+
+
+class GroupCommitWriter:
+    """
+    Background thread that applies queued inserts in group commits.
+
+    Statements are buffered until `batch_size` are pending or `interval_ms`
+    has passed since the first one, then written in a single transaction, so
+    the fsync and lock acquisition cost is shared by the whole batch. If the
+    batch cannot be committed, its rows are retried one by one so only the
+    failing rows are lost; their submitters hear about it through on_done and
+    flush() raises GroupCommitError, for the rows of one CommitScope if given.
+    """
+
+    def __init__(self, pool, batch_size=GROUP_COMMIT_BATCH_SIZE, interval_ms=GROUP_COMMIT_INTERVAL_MS):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self._queue = queue.Queue()
+        self._closed = False
+        self._failure_total = 0
+        self._recent_failures = deque(maxlen=MAX_REPORTED_FAILURES)
+        self._thread = threading.Thread(target=self._run, name="shared-memory-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params, on_done=None):
+        """
+        Queue a statement for the next group commit.
+
+        Args:
+            sql: Parameterized INSERT statement
+            params: Statement parameters
+            on_done: Optional callback invoked from the writer thread once the
+                row has been committed, with None, or has failed, with the exception
+        """
+        if self._closed:
+            raise RuntimeError("GroupCommitWriter is closed")
+        self._queue.put((sql, params, on_done, commit_scope.get()))
+
+    def flush(self, scope: CommitScope = None):
+        """
+        Block until everything queued so far has been written.
+
+        Args:
+            scope: Only report failures of rows submitted under this scope
+
+        Raises:
+            GroupCommitError: If rows of the scope have failed to commit, or
+                without a scope, if any rows failed while this flush waited
+        """
+        request = self._wait()
+        if scope is not None:
+            if scope.failed:
+                raise GroupCommitError(scope.failed, list(scope.errors))
+        elif request.failed:
+            raise GroupCommitError(request.failed, request.errors)
+
+    def _wait(self):
+        request = _FlushRequest(self._failure_total)
+        self._queue.put(request)
+        request.done.wait()
+        return request
+
+    def close(self):
+        """Write pending rows and stop the writer thread; failures went to their callbacks."""
+        if self._closed:
+            return
+        self._wait()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], _FlushRequest):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        statements = [item for item in batch if not isinstance(item, _FlushRequest)]
+        errors = self._commit_batch(statements)
+        if errors is None:
+            errors = self._commit_rows(statements)
+
+        for (sql, params, on_done, scope), error in zip(statements, errors):
+            if error is not None:
+                message = f"{sql.split('(')[0].strip()}: {error}"
+                self._failure_total += 1
+                self._recent_failures.append(message)
+                if scope is not None:
+                    scope.failed += 1
+                    scope.errors.append(message)
+            if on_done:
+                try:
+                    on_done(error)
+                except Exception as e:
+                    print(f"Group commit callback failed: {str(e)}")
+        for item in batch:
+            if isinstance(item, _FlushRequest):
+                item.failed = self._failure_total - item.failure_total
+                item.errors = list(self._recent_failures)[-min(item.failed, MAX_REPORTED_FAILURES):] if item.failed else []
+                item.done.set()
+
+    def _commit_batch(self, statements):
+        """Write the statements in one transaction; None if it failed for good."""
+        for attempt in range(3):
+            try:
+                with self.pool.connection() as conn:
+                    # Consecutive rows for the same statement go through executemany
+                    start = 0
+                    while start < len(statements):
+                        end = start
+                        while end < len(statements) and statements[end][0] == statements[start][0]:
+                            end += 1
+                        conn.executemany(statements[start][0], [item[1] for item in statements[start:end]])
+                        start = end
+                return [None] * len(statements)
+            except sqlite3.OperationalError as e:
+                # Lock contention and I/O hiccups are worth another try
+                print(f"Group commit of {len(statements)} rows failed (attempt {attempt + 1}): {str(e)}")
+                time.sleep(0.05 * (attempt + 1))
+            except Exception:
+                # A bad row; retrying the same batch cannot help
+                return None
+        return None
+
+    def _commit_rows(self, statements):
+        """
+        Write the statements one by one in a single transaction, so a bad row
+        only fails itself.
+
+        Returns:
+            One entry per statement: None if committed, else the exception
+        """
+        errors = []
+        try:
+            with self.pool.connection() as conn:
+                for sql, params, _, _ in statements:
+                    try:
+                        conn.execute(sql, params)
+                        errors.append(None)
+                    except sqlite3.Error as e:
+                        # SQLite rolls back only the failing statement
+                        errors.append(e)
+        except Exception as e:
+            return [e] * len(statements)
+        return errors
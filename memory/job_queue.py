@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+# Queue configuration (overridable per deployment through the environment)
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Durable intake job queue stored in the SharedMemory database.
+
+    Workers claim jobs under a lease and renew it while the job runs; a job
+    whose worker dies (or whose process restarts) becomes claimable again once
+    its lease expires, until it runs out of attempts, so queued and
+    in-flight jobs survive restarts. Any process opening the same database can
+    act as a worker.
+    """
+
+    def __init__(self, pool, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.pool = pool
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, input_type, payload, callback_url=None):
+        """
+        Persist an intake payload and return the new job id.
+
+        Args:
+            input_type: "file", "json" or "email", as passed to the pipeline
+            payload: Raw payload bytes
+            callback_url: Optional URL notified when the job finishes
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, input_type, payload, callback_url, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, input_type, payload, callback_url, now, now)
+            )
+        return job_id
+
+    def claim(self):
+        """
+        Lease the oldest runnable job.
+
+        A running job whose lease expired is claimable again unless it is
+        out of attempts, in which case it is marked failed here; a job that
+        keeps killing or stalling its worker is not retried forever.
+
+        Returns:
+            Dict with id, input_type, payload, callback_url and attempts, or
+            None if nothing is runnable
+        """
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            exhausted = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (f"Lease expired on the last of {self.max_attempts} attempts", datetime.now().isoformat(),
+                 now, self.max_attempts)
+            ).rowcount
+            if exhausted:
+                logger.debug("Marked %d job(s) failed after their last lease expired", exhausted)
+            row = conn.execute(
+                "SELECT id, input_type, payload, callback_url, attempts FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_expires < ? AND attempts < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now, self.max_attempts)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_expires = ?, "
+                "updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, datetime.now().isoformat(), row[0])
+            )
+        return {
+            "id": row[0],
+            "input_type": row[1],
+            "payload": row[2],
+            "callback_url": row[3],
+            "attempts": row[4] + 1
+        }
+
+    def renew(self, job_id):
+        """
+        Extend the lease of a running job by lease_seconds from now.
+
+        Returns:
+            False if the job is no longer running, e.g. its lease expired and
+            it was failed or claimed again
+        """
+        with self.pool.connection() as conn:
+            renewed = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, datetime.now().isoformat(), job_id)
+            ).rowcount
+        return renewed > 0
+
+    def complete(self, job_id, result):
+        """Store the result and drop the payload, which is no longer needed."""
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, payload = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (json.dumps(result), datetime.now().isoformat(), job_id)
+            )
+
+    def fail(self, job_id, error, attempts):
+        """
+        Record a failure, re-queueing the job unless it is out of attempts.
+
+        Returns:
+            The job's new status
+        """
+        status = "queued" if attempts < self.max_attempts else "failed"
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                (status, error, datetime.now().isoformat(), job_id)
+            )
+        return status
+
+    def release(self, job_id):
+        """Put a claimed job back in the queue without counting the attempt."""
+        with self.pool.connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_expires = NULL, "
+                "updated_at = ? WHERE id = ? AND status = 'running'",
+                (datetime.now().isoformat(), job_id)
+            )
+
+    def get(self, job_id):
+        """Return the job's status and, once finished, its result or error."""
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT id, status, input_type, attempts, created_at, updated_at, result, error "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "input_type": row[2],
+            "attempts": row[3],
+            "created_at": row[4],
+            "updated_at": row[5],
+            "result": json.loads(row[6]) if row[6] else None,
+            "error": row[7]
+        }
+
+    async def renew_async(self, job_id):
+        return await asyncio.to_thread(self.renew, job_id)
+
+    async def enqueue_async(self, input_type, payload, callback_url=None):
+        return await asyncio.to_thread(self.enqueue, input_type, payload, callback_url)
+
+    async def get_async(self, job_id):
+        return await asyncio.to_thread(self.get, job_id)
@@ -0,0 +1,58 @@
+# Schema migrations for shared_memory.db, applied in order on startup.
+# The schema version is tracked in PRAGMA user_version; never edit a released
+# migration, append a new one instead.
+MIGRATIONS = [
+    # 1: indexes for the read APIs
+    [
+        "CREATE INDEX IF NOT EXISTS idx_extracted_fields_input_id ON extracted_fields (input_id)",
+        "CREATE INDEX IF NOT EXISTS idx_extracted_fields_thread_id ON extracted_fields (thread_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_extracted_fields_agent ON extracted_fields (agent, id)",
+        "CREATE INDEX IF NOT EXISTS idx_inputs_timestamp ON inputs (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_inputs_format ON inputs (format, id)",
+        "CREATE INDEX IF NOT EXISTS idx_inputs_intent ON inputs (intent, id)",
+    ],
+    # 2: full-text search over agent results; rows are indexed by SearchIndex
+    # from the last_id watermark, which also backfills existing history
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS extracted_fields_fts USING fts5("
+        "title, body, agent UNINDEXED, thread_id UNINDEXED, input_id UNINDEXED, "
+        "tokenize = 'porter unicode61')",
+        "CREATE TABLE IF NOT EXISTS search_index_state (last_id INTEGER NOT NULL)",
+        "INSERT INTO search_index_state (last_id) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM search_index_state)",
+    ],
+    # 3: durable queue for /intake?mode=async
+    [
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id TEXT PRIMARY KEY, "
+        "status TEXT NOT NULL, "
+        "input_type TEXT NOT NULL, "
+        "payload BLOB, "
+        "callback_url TEXT, "
+        "result TEXT, "
+        "error TEXT, "
+        "attempts INTEGER NOT NULL DEFAULT 0, "
+        "created_at TEXT NOT NULL, "
+        "updated_at TEXT NOT NULL, "
+        "lease_expires REAL)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)",
+    ],
+]
+
+
+def apply_migrations(conn):
+    """
+    Bring the database schema up to date.
+
+    Runs under an immediate transaction so concurrently starting workers
+    apply each migration exactly once.
+
+    Returns:
+        The schema version after migrating
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {number}")
+    return max(version, len(MIGRATIONS))
@@ -0,0 +1,188 @@
+import json
+import os
+import re
+import threading
+
+# Indexer configuration (overridable per deployment through the environment)
+SEARCH_INDEX_ENABLED = os.environ.get("SEARCH_INDEX_ENABLED", "1") not in ("0", "false", "no")
+SEARCH_INDEX_INTERVAL_MS = float(os.environ.get("SEARCH_INDEX_INTERVAL_MS", "500"))
+SEARCH_INDEX_BATCH_SIZE = int(os.environ.get("SEARCH_INDEX_BATCH_SIZE", "500"))
+
+# Upper bound on the text indexed per agent result
+MAX_INDEXED_CHARS = 200000
+
+
+def _flatten(value, path, parts):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(child, f"{path}.{key}" if path else str(key), parts)
+    elif isinstance(value, list):
+        for child in value:
+            _flatten(child, path, parts)
+    elif value is not None:
+        parts.append(f"{path}: {value}" if path else str(value))
+
+
+def flatten_json(value):
+    """Render every scalar in a JSON value as a 'key.path: value' line."""
+    parts = []
+    _flatten(value, "", parts)
+    return "\n".join(parts)
+
+
+def document_text(agent, data):
+    """
+    Build the (title, body) pair indexed for an agent result.
+
+    Args:
+        agent: Name of the agent that produced the result
+        data: The stored result dictionary
+
+    Returns:
+        Tuple of title and body text
+    """
+    if agent == "email_agent":
+        title = data.get("subject", "")
+        parts = [data.get("sender", ""), data.get("summary", ""), data.get("body", "")]
+    elif agent == "pdf_agent":
+        title = data.get("title", "")
+        parts = [
+            data.get("content_summary", ""),
+            " ".join(data.get("topics", [])),
+            data.get("extracted_text", "")
+        ]
+    else:
+        analysis = data.get("ai_analysis") or {}
+        title = analysis.get("summary", "")
+        parts = [flatten_json(data.get("data", data))]
+    body = "\n".join(str(part) for part in parts if part)
+    return str(title or ""), body[:MAX_INDEXED_CHARS]
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching all terms, ignoring FTS syntax."""
+    terms = re.findall(r"\w+\*?", text, flags=re.UNICODE)
+    return " ".join(f'"{term.rstrip("*")}"' + ("*" if term.endswith("*") else "") for term in terms)
+
+
+class SearchIndex:
+    """
+    FTS5 index over agent results, kept in sync incrementally.
+
+    Indexing runs off the intake write path: a background thread is nudged
+    after each write and catches the index up from a watermark stored in the
+    database, so every worker shares the same progress and rows written by any
+    worker (or before the index existed) are picked up.
+    """
+
+    def __init__(self, pool, interval_ms=SEARCH_INDEX_INTERVAL_MS, batch_size=SEARCH_INDEX_BATCH_SIZE):
+        self.pool = pool
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Signal that new rows were written; indexing happens asynchronously."""
+        self._wake.set()
+
+    def stop(self):
+        if self._thread:
+            self._stopped.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Search indexing failed: {str(e)}")
+            # Coalesce bursts of writes into one pass per interval
+            self._stopped.wait(self.interval)
+
+    def sync(self):
+        """
+        Index every agent result written since the last pass.
+
+        Returns:
+            Number of rows indexed
+        """
+        indexed = 0
+        while True:
+            with self.pool.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                watermark = conn.execute("SELECT last_id FROM search_index_state").fetchone()[0]
+                rows = conn.execute(
+                    "SELECT id, input_id, agent, data, thread_id FROM extracted_fields "
+                    "WHERE id > ? ORDER BY id LIMIT ?",
+                    (watermark, self.batch_size)
+                ).fetchall()
+                entries = []
+                for row_id, input_id, agent, data, thread_id in rows:
+                    try:
+                        title, body = document_text(agent, json.loads(data))
+                    except (ValueError, TypeError, AttributeError):
+                        title, body = "", ""
+                    entries.append((row_id, title, body, agent, thread_id, input_id))
+                conn.executemany(
+                    "INSERT INTO extracted_fields_fts (rowid, title, body, agent, thread_id, input_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    entries
+                )
+                if rows:
+                    conn.execute("UPDATE search_index_state SET last_id = ?", (rows[-1][0],))
+            indexed += len(rows)
+            if len(rows) < self.batch_size:
+                return indexed
+
+    def search(self, text, agent=None, limit=20, offset=0):
+        """
+        Full-text search over indexed agent results, best matches first.
+
+        Args:
+            text: Free-text query; every term must match
+            agent: Optionally restrict results to one agent
+            limit: Page size
+            offset: Number of results to skip
+
+        Returns:
+            List of result dicts with id, input_id, agent, thread_id, title,
+            snippet and score (lower bm25 is better)
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        clauses, params = ["extracted_fields_fts MATCH ?"], [query]
+        if agent is not None:
+            clauses.append("agent = ?")
+            params.append(agent)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT rowid, input_id, agent, thread_id, title, "
+                "snippet(extracted_fields_fts, 1, '[', ']', '...', 16), "
+                "bm25(extracted_fields_fts, 5.0, 1.0) AS score "
+                f"FROM extracted_fields_fts WHERE {' AND '.join(clauses)} "
+                "ORDER BY score LIMIT ? OFFSET ?",
+                (*params, limit, offset)
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "input_id": row[1],
+                "agent": row[2],
+                "thread_id": row[3],
+                "title": row[4],
+                "snippet": row[5],
+                "score": round(row[6], 4)
+            }
+            for row in rows
+        ]
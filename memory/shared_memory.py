@@ -1,83 +1,351 @@
-import sqlite3
+import asyncio
+import copy
 import json
+import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from typing import NamedTuple, Optional
+
+from memory.group_commit import CommitScope, GroupCommitWriter, IdAllocator
+from memory.migrations import apply_migrations
+from memory.search_index import SearchIndex, SEARCH_INDEX_ENABLED
+from memory.sqlite_pool import SQLitePool
+from utils.metrics import timed
+
+# SQLite file holding inputs, results and the job queue
+SHARED_MEMORY_PATH = os.environ.get("SHARED_MEMORY_PATH", "shared_memory.db")
+# "sync" commits every row before returning, "group" queues rows for a
+# background writer that commits them in batches
+SHARED_MEMORY_DURABILITY = os.environ.get("SHARED_MEMORY_DURABILITY", "sync")
+# Number of recent input records kept in process for the read APIs
+INPUT_RECORD_CACHE_SIZE = int(os.environ.get("INPUT_RECORD_CACHE_SIZE", "4096"))
+
+# Statements are kept as constants so every pooled connection reuses its
+# prepared statement cache
+INSERT_INPUT_SQL = "INSERT INTO inputs (source, type, timestamp, format, intent) VALUES (?, ?, ?, ?, ?)"
+INSERT_INPUT_WITH_ID_SQL = "INSERT INTO inputs (id, source, type, timestamp, format, intent) VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_EXTRACTED_FIELDS_SQL = "INSERT INTO extracted_fields (input_id, agent, data, thread_id) VALUES (?, ?, ?, ?)"
+SELECT_INPUT_SQL = "SELECT * FROM inputs WHERE id = ?"
+SELECT_EXTRACTED_FIELDS_SQL = "SELECT * FROM extracted_fields WHERE input_id = ?"
+
+
+class InputRecord(NamedTuple):
+    """A row of the inputs table; field order matches the table columns."""
+    id: int
+    source: str
+    type: str
+    timestamp: str
+    format: str
+    intent: str
 
 
 class SharedMemory:
-    def __init__(self, db_path="shared_memory.db"):
+    def __init__(self, db_path=SHARED_MEMORY_PATH, pool: SQLitePool = None,
+                 durability=SHARED_MEMORY_DURABILITY, search_indexing=SEARCH_INDEX_ENABLED):
+        if durability not in ("sync", "group"):
+            raise ValueError(f"Unsupported durability mode: {durability}")
         self.db_path = db_path
+        self.durability = durability
+        self.pool = pool or SQLitePool(db_path)
         self._init_db()
+        
+        self._writer = None
+        self._input_ids = None
+        # Inputs queued for the writer but not committed yet, so reads of a
+        # freshly allocated input_id still succeed
+        self._pending_inputs = {}
+        # LRU of recently logged or read input records
+        self._recent_inputs = OrderedDict()
+        self._records_lock = threading.Lock()
+        if durability == "group":
+            self._writer = GroupCommitWriter(self.pool)
+            self._input_ids = IdAllocator(self.pool, "inputs")
+        
+        self._group_view = None
+        self.search_index = SearchIndex(self.pool)
+        if search_indexing:
+            self.search_index.start()
+            # Catch up on anything written while no indexer was running
+            self.search_index.notify()
+
+    def group_commit_view(self):
+        """
+        Return a SharedMemory that shares this one's pool, caches and search
+        index but always writes through a group-commit writer. Bulk intake uses
+        it to batch writes regardless of the deployment's durability mode.
+        """
+        if self._writer:
+            return self
+        if self._group_view is None:
+            view = copy.copy(self)
+            view.durability = "group"
+            view._writer = GroupCommitWriter(self.pool)
+            view._input_ids = IdAllocator(self.pool, "inputs")
+            self._group_view = view
+        return self._group_view
 
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS inputs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source TEXT,
-            type TEXT,
-            timestamp TEXT,
-            format TEXT,
-            intent TEXT
-        )
-        ''')
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS extracted_fields (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            input_id INTEGER,
-            agent TEXT,
-            data TEXT,
-            thread_id TEXT,
-            FOREIGN KEY (input_id) REFERENCES inputs (id)
-        )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def log_input(self, source, type, format, intent):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS inputs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT,
+                type TEXT,
+                timestamp TEXT,
+                format TEXT,
+                intent TEXT
+            )
+            ''')
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS extracted_fields (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                input_id INTEGER,
+                agent TEXT,
+                data TEXT,
+                thread_id TEXT,
+                FOREIGN KEY (input_id) REFERENCES inputs (id)
+            )
+            ''')
+        with self.pool.connection() as conn:
+            apply_migrations(conn)
+
+    def log_input(self, source, type, format, intent) -> InputRecord:
+        """
+        Log an input and return its record, so callers can thread the id and
+        timestamp through the pipeline without reading them back.
+        """
         timestamp = datetime.now().isoformat()
-        cursor.execute(
-            "INSERT INTO inputs (source, type, timestamp, format, intent) VALUES (?, ?, ?, ?, ?)",
-            (source, type, timestamp, format, intent)
-        )
-        # Get the ID of the last inserted row
-        input_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return input_id
+        if self._writer:
+            record = InputRecord(self._input_ids.next_id(), source, type, timestamp, format, intent)
+            with self._records_lock:
+                self._pending_inputs[record.id] = record
+                self._remember(record)
+            self._writer.submit(INSERT_INPUT_WITH_ID_SQL, record, lambda error: self._committed(record.id, error))
+            return record
+        
+        with self.pool.connection() as conn:
+            cursor = conn.execute(INSERT_INPUT_SQL, (source, type, timestamp, format, intent))
+            # Get the ID of the last inserted row
+            record = InputRecord(cursor.lastrowid, source, type, timestamp, format, intent)
+        with self._records_lock:
+            self._remember(record)
+        return record
+
+    def _remember(self, record):
+        # Callers hold _records_lock
+        self._recent_inputs[record.id] = record
+        self._recent_inputs.move_to_end(record.id)
+        if len(self._recent_inputs) > INPUT_RECORD_CACHE_SIZE:
+            self._recent_inputs.popitem(last=False)
+
+    def _committed(self, input_id, error=None):
+        with self._records_lock:
+            self._pending_inputs.pop(input_id, None)
+            if error is not None:
+                # The id was handed out but the row does not exist; stop serving it
+                self._recent_inputs.pop(input_id, None)
+        if error is not None:
+            print(f"Input {input_id} could not be committed: {str(error)}")
+
+    def _fields_committed(self, error):
+        if error is None:
+            self.search_index.notify()
 
     def log_extracted_fields(self, input_id, agent, data, thread_id=None):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO extracted_fields (input_id, agent, data, thread_id) VALUES (?, ?, ?, ?)",
-            (input_id, agent, json.dumps(data), thread_id)
-        )
-        conn.commit()
-        conn.close()
-
-    def get_input(self, input_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM inputs WHERE id = ?", (input_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result
+        payload = json.dumps(data)
+        if self._writer:
+            self._writer.submit(
+                INSERT_EXTRACTED_FIELDS_SQL,
+                (input_id, agent, payload, thread_id),
+                self._fields_committed
+            )
+            return
+        
+        with self.pool.connection() as conn:
+            conn.execute(INSERT_EXTRACTED_FIELDS_SQL, (input_id, agent, payload, thread_id))
+        self.search_index.notify()
+
+    def log_extracted_fields_many(self, rows):
+        """
+        Log several results at once: one transaction in sync mode, one queued
+        row each in group mode.
+
+        Args:
+            rows: (input_id, agent, data, thread_id) tuples
+        """
+        params = [(input_id, agent, json.dumps(data), thread_id) for input_id, agent, data, thread_id in rows]
+        if not params:
+            return
+        if self._writer:
+            for row in params:
+                self._writer.submit(INSERT_EXTRACTED_FIELDS_SQL, row, self._fields_committed)
+            return
+
+        with self.pool.connection() as conn:
+            conn.executemany(INSERT_EXTRACTED_FIELDS_SQL, params)
+        self.search_index.notify()
+
+    def _cached_input(self, input_id):
+        with self._records_lock:
+            record = self._recent_inputs.get(input_id)
+            if record:
+                self._recent_inputs.move_to_end(input_id)
+                return record
+            return self._pending_inputs.get(input_id)
+
+    def get_input(self, input_id) -> Optional[InputRecord]:
+        record = self._cached_input(input_id)
+        if record:
+            return record
+        with self.pool.connection() as conn:
+            row = conn.execute(SELECT_INPUT_SQL, (input_id,)).fetchone()
+        if row is None:
+            return None
+        record = InputRecord(*row)
+        with self._records_lock:
+            self._remember(record)
+        return record
 
     def get_input_timestamp(self, input_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT timestamp FROM inputs WHERE id = ?", (input_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        record = self.get_input(input_id)
+        return record.timestamp if record else None
 
     def get_extracted_fields(self, input_id):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM extracted_fields WHERE input_id = ?", (input_id,))
-        results = cursor.fetchall()
-        conn.close()
-        return results 
\ No newline at end of file
+        with self.pool.connection() as conn:
+            return conn.execute(SELECT_EXTRACTED_FIELDS_SQL, (input_id,)).fetchall()
+
+    def list_inputs(self, intent=None, format=None, since=None, until=None, before_id=None, limit=50):
+        """
+        Page through inputs, newest first, using keyset pagination.
+        
+        Args:
+            intent: Only return inputs classified with this intent
+            format: Only return inputs of this format
+            since: Inclusive lower bound on the ISO timestamp
+            until: Exclusive upper bound on the ISO timestamp
+            before_id: Cursor; only return inputs with a smaller id
+            limit: Maximum number of rows to return
+            
+        Returns:
+            (records, next_cursor) where next_cursor is None on the last page
+        """
+        clauses, params = [], []
+        for column, value in (("intent", intent), ("format", format)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM inputs {where} ORDER BY id DESC LIMIT ?",
+                (*params, limit + 1)
+            ).fetchall()
+        
+        records = [InputRecord(*row) for row in rows[:limit]]
+        next_cursor = records[-1].id if len(rows) > limit else None
+        return records, next_cursor
+
+    def list_extracted_fields(self, thread_id=None, input_id=None, agent=None, before_id=None, limit=50):
+        """
+        Page through agent results, newest first, using keyset pagination.
+        
+        Returns:
+            (results, next_cursor) where each result is a dict with the stored
+            data decoded and next_cursor is None on the last page
+        """
+        clauses, params = [], []
+        for column, value in (("thread_id", thread_id), ("input_id", input_id), ("agent", agent)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT id, input_id, agent, data, thread_id FROM extracted_fields {where} ORDER BY id DESC LIMIT ?",
+                (*params, limit + 1)
+            ).fetchall()
+        
+        results = [
+            {"id": row[0], "input_id": row[1], "agent": row[2], "data": json.loads(row[3]), "thread_id": row[4]}
+            for row in rows[:limit]
+        ]
+        next_cursor = results[-1]["id"] if len(rows) > limit else None
+        return results, next_cursor
+
+    # Async variants run the blocking SQLite work in a thread so callers on the
+    # event loop never wait on disk I/O or lock contention
+
+    @timed("shared_memory.log_input")
+    async def log_input_async(self, source, type, format, intent):
+        if self._writer and self._input_ids.has_reserved():
+            # Served from the reserved id block, nothing touches the database
+            return self.log_input(source, type, format, intent)
+        return await asyncio.to_thread(self.log_input, source, type, format, intent)
+
+    @timed("shared_memory.log_extracted_fields")
+    async def log_extracted_fields_async(self, input_id, agent, data, thread_id=None):
+        if self._writer:
+            return self.log_extracted_fields(input_id, agent, data, thread_id)
+        return await asyncio.to_thread(self.log_extracted_fields, input_id, agent, data, thread_id)
+
+    @timed("shared_memory.get_input")
+    async def get_input_async(self, input_id):
+        return self._cached_input(input_id) or await asyncio.to_thread(self.get_input, input_id)
+
+    @timed("shared_memory.get_input_timestamp")
+    async def get_input_timestamp_async(self, input_id):
+        record = await self.get_input_async(input_id)
+        return record.timestamp if record else None
+
+    @timed("shared_memory.get_extracted_fields")
+    async def get_extracted_fields_async(self, input_id):
+        return await asyncio.to_thread(self.get_extracted_fields, input_id)
+
+    @timed("shared_memory.list_inputs")
+    async def list_inputs_async(self, **filters):
+        return await asyncio.to_thread(self.list_inputs, **filters)
+
+    @timed("shared_memory.list_extracted_fields")
+    async def list_extracted_fields_async(self, **filters):
+        return await asyncio.to_thread(self.list_extracted_fields, **filters)
+
+    @timed("shared_memory.search")
+    async def search_async(self, text, agent=None, limit=20, offset=0):
+        return await asyncio.to_thread(self.search_index.search, text, agent, limit, offset)
+
+    def flush(self, scope: CommitScope = None):
+        """
+        Wait until every queued row is written (no-op in sync mode).
+
+        Args:
+            scope: Only report failures of rows logged under this CommitScope
+
+        Raises:
+            GroupCommitError: If queued rows failed to commit
+        """
+        if self._writer:
+            self._writer.flush(scope)
+
+    def close(self):
+        if self._group_view:
+            self._group_view._writer.close()
+        if self._writer:
+            self._writer.close()
+        self.search_index.stop()
+        self.pool.close()
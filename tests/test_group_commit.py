@@ -0,0 +1,63 @@
+import pytest
+
+from memory.group_commit import CommitScope, GroupCommitError, GroupCommitWriter, commit_scope
+from memory.sqlite_pool import SQLitePool
+
+INSERT_SQL = "INSERT INTO items (id, name) VALUES (?, ?)"
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / "items.db"))
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def writer(pool):
+    # A long interval keeps every submitted row in the same batch as the flush
+    writer = GroupCommitWriter(pool, batch_size=100, interval_ms=10000)
+    yield writer
+    writer.close()
+
+
+def _names(pool):
+    with pool.connection() as conn:
+        return [row[0] for row in conn.execute("SELECT name FROM items ORDER BY id")]
+
+
+def test_failed_batch_falls_back_to_per_row_commits(pool, writer):
+    outcomes = {}
+    for row in [(1, "a"), (2, "b"), (1, "duplicate"), (3, "c")]:
+        writer.submit(INSERT_SQL, row, lambda error, name=row[1]: outcomes.__setitem__(name, error))
+
+    with pytest.raises(GroupCommitError) as raised:
+        writer.flush()
+
+    assert raised.value.failed == 1
+    assert "UNIQUE" in raised.value.errors[0]
+    assert _names(pool) == ["a", "b", "c"]
+    assert [name for name, error in outcomes.items() if error is not None] == ["duplicate"]
+    # The failure was reported once; later flushes only see their own rows
+    writer.submit(INSERT_SQL, (4, "d"))
+    writer.flush()
+
+
+def test_scoped_flush_only_reports_its_own_failures(pool, writer):
+    clean, failing = CommitScope(), CommitScope()
+    for scope, row in [(clean, (1, "a")), (failing, (1, "duplicate")), (clean, (2, "b"))]:
+        token = commit_scope.set(scope)
+        try:
+            writer.submit(INSERT_SQL, row)
+        finally:
+            commit_scope.reset(token)
+
+    writer.flush(clean)
+    with pytest.raises(GroupCommitError) as raised:
+        writer.flush(failing)
+
+    assert raised.value.failed == 1
+    assert clean.failed == 0
+    assert _names(pool) == ["a", "b"]
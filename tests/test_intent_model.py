@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from agents.email_agent import EmailAgent
+from agents.mime_parser import ATTACHMENT_SOURCE, parse_email
+from memory.shared_memory import SharedMemory
+from utils.intent_model import hashed_features, load_training_data
+
+EMAIL = (
+    b"From: Ana Buyer <ana@example.com>\r\n"
+    b"To: sales@example.com\r\n"
+    b"Subject: RFQ for 500 steel brackets\r\n"
+    b"Date: Mon, 5 Oct 2026 09:30:00 +0000\r\n"
+    b"Message-ID: <rfq-1@example.com>\r\n"
+    b"MIME-Version: 1.0\r\n"
+    b"Content-Type: multipart/mixed; boundary=\"b1\"\r\n"
+    b"\r\n"
+    b"--b1\r\n"
+    b"Content-Type: text/plain; charset=utf-8\r\n"
+    b"\r\n"
+    b"Hello,\r\n\r\nPlease quote 500 steel brackets, delivery by November.\r\n"
+    b"\r\n> Earlier thread that the parser strips\r\n"
+    b"--\r\nAna\r\n"
+    b"--b1\r\n"
+    b"Content-Type: application/pdf\r\n"
+    b"Content-Disposition: attachment; filename=\"drawing.pdf\"\r\n"
+    b"Content-Transfer-Encoding: base64\r\n"
+    b"\r\n"
+    b"JVBERi0xLjQK\r\n"
+    b"--b1--\r\n"
+)
+LLM_RESULT = {"sender": "ana@example.com", "subject": "RFQ for 500 steel brackets", "intent": "rfq",
+              "urgency": "normal", "summary": "Quote request"}
+
+
+class _PrecomputedClient:
+    """Marks the LLM as available; EmailAgent uses the llm_result it is given."""
+
+
+def _store_email(memory, intent, llm_result=LLM_RESULT, source="test"):
+    parsed = parse_email(EMAIL)
+    record = memory.log_input(source, "email", "email", intent)
+    agent = EmailAgent(memory, _PrecomputedClient())
+    asyncio.run(agent.process(EMAIL, record, llm_result, parsed))
+    return record
+
+
+def test_email_training_features_match_serving_features(tmp_path):
+    memory = SharedMemory(str(tmp_path / "memory.db"), search_indexing=False)
+    try:
+        _store_email(memory, "rfq")
+        memory.flush()
+    finally:
+        memory.close()
+
+    examples = load_training_data(str(tmp_path / "memory.db"))
+
+    # The pipeline classifies the parsed email's llm_text()
+    serving_text = parse_email(EMAIL).llm_text()
+    assert examples == [(serving_text, "rfq")]
+    assert hashed_features(examples[0][0]) == hashed_features(serving_text)
+
+
+def test_training_data_has_one_example_per_input_and_skips_fallback_labels(tmp_path):
+    memory = SharedMemory(str(tmp_path / "memory.db"), search_indexing=False)
+    try:
+        document = memory.log_input("test", "json", "json", "invoice")
+        for index in range(3):
+            memory.log_extracted_fields(document.id, "json_agent", {"data": {"id": index}}, "thread")
+        memory.log_input("test", "json", "json", "unknown")
+        stream = memory.log_input("test", "file", "ndjson", "invoice")
+        memory.log_extracted_fields(stream.id, "json_agent", {"data": {"id": 1}}, "thread")
+        _store_email(memory, "other")
+        _store_email(memory, "complaint", source=ATTACHMENT_SOURCE)
+        _store_email(memory, "rfq", llm_result={"intent": None})
+        memory.flush()
+    finally:
+        memory.close()
+
+    examples = load_training_data(str(tmp_path / "memory.db"))
+
+    assert examples == [(json.dumps({"id": 0}), "invoice")]
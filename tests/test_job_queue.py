@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from memory.job_queue import JobQueue
+from memory.shared_memory import SharedMemory
+
+
+@pytest.fixture
+def memory(tmp_path):
+    memory = SharedMemory(str(tmp_path / "memory.db"), search_indexing=False)
+    yield memory
+    memory.close()
+
+
+def _expire_lease(queue, job_id):
+    # Same effect as the worker dying and its lease running out, without sleeping
+    with queue.pool.connection() as conn:
+        conn.execute("UPDATE jobs SET lease_expires = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def test_expired_lease_is_claimed_again_until_the_attempt_cap(memory):
+    queue = JobQueue(memory.pool, lease_seconds=60, max_attempts=2)
+    job_id = queue.enqueue("json", b"{}")
+
+    assert queue.claim()["attempts"] == 1
+    assert queue.claim() is None
+    _expire_lease(queue, job_id)
+    claimed = queue.claim()
+    assert claimed["id"] == job_id
+    assert claimed["attempts"] == 2
+
+    _expire_lease(queue, job_id)
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert "last of 2 attempts" in job["error"]
+
+
+def test_fail_requeues_below_the_attempt_cap(memory):
+    queue = JobQueue(memory.pool, lease_seconds=60, max_attempts=2)
+    job_id = queue.enqueue("json", b"{}")
+
+    assert queue.fail(job_id, "boom", queue.claim()["attempts"]) == "queued"
+    assert queue.fail(job_id, "boom again", queue.claim()["attempts"]) == "failed"
+    assert queue.claim() is None
+    assert queue.get(job_id)["error"] == "boom again"
+
+
+def test_renew_extends_only_a_running_lease(memory):
+    queue = JobQueue(memory.pool, lease_seconds=60, max_attempts=1)
+    job_id = queue.enqueue("json", b"{}")
+    queue.claim()
+    _expire_lease(queue, job_id)
+
+    assert queue.renew(job_id)
+    assert queue.claim() is None
+    queue.complete(job_id, {"ok": True})
+    assert not queue.renew(job_id)
+    assert queue.get(job_id)["result"] == {"ok": True}
+
+
+def test_release_does_not_count_the_attempt(memory):
+    queue = JobQueue(memory.pool, lease_seconds=60, max_attempts=1)
+    job_id = queue.enqueue("json", b"{}")
+
+    queue.release(queue.claim()["id"])
+    claimed = queue.claim()
+    assert claimed["id"] == job_id
+    assert claimed["attempts"] == 1
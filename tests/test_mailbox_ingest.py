@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+from agents.mailbox_ingest import CheckpointMismatchError, MailboxIngester, iter_mbox
+from memory.shared_memory import SharedMemory
+
+MESSAGES = [
+    b"From: ana@example.com\nSubject: one\n\n>From the start of a line\n>>From a quoted line\n",
+    b"From: ben@example.com\nSubject: two\n\nSecond body\n",
+    b"From: cy@example.com\nSubject: three\n\nThird body\n",
+    b"From: di@example.com\nSubject: four\n\nFourth body\n",
+]
+
+
+def _escaped(message):
+    # How an mboxrd writer stores a body line starting with (>*)From
+    return b"\n".join(b">" + line if line.lstrip(b">").startswith(b"From ") and i else line
+                      for i, line in enumerate(message.split(b"\n")))
+
+
+def _write_mbox(path, messages=MESSAGES):
+    """Write an mboxrd file and return the byte offset after each message."""
+    offsets = []
+    with open(path, "wb") as f:
+        for message in messages:
+            f.write(b"From sender@example.com Mon Oct  5 10:00:00 2026\n")
+            f.write(_escaped(message))
+            f.write(b"\n")
+            offsets.append(f.tell())
+    return offsets
+
+
+def _read(message):
+    with message.data.open() as f:
+        return f.read()
+
+
+def test_iter_mbox_unescapes_from_lines_and_drops_the_separator_blank_line(tmp_path):
+    path = str(tmp_path / "archive.mbox")
+    offsets = _write_mbox(path)
+
+    messages = list(iter_mbox(path))
+
+    assert [_read(message) for message in messages] == MESSAGES
+    assert _read(messages[0]).endswith(b">From a quoted line\n")
+    assert [message.position for message in messages] == offsets
+    for message in messages:
+        message.data.close()
+
+
+def test_iter_mbox_resumes_from_a_message_offset(tmp_path):
+    path = str(tmp_path / "archive.mbox")
+    offsets = _write_mbox(path)
+
+    messages = list(iter_mbox(path, offsets[1]))
+
+    assert [_read(message) for message in messages] == MESSAGES[2:]
+    for message in messages:
+        message.data.close()
+
+
+def test_iter_mbox_rejects_an_offset_inside_a_message(tmp_path):
+    path = str(tmp_path / "archive.mbox")
+    offsets = _write_mbox(path)
+
+    with pytest.raises(CheckpointMismatchError):
+        next(iter_mbox(path, offsets[0] + 5))
+
+
+def test_watermark_only_advances_over_finished_messages(tmp_path):
+    path = str(tmp_path / "archive.mbox")
+    _write_mbox(path)
+    ingester = MailboxIngester(None, path)
+    sequences = [ingester._track(position) for position in (10, 20, 30)]
+
+    ingester._finish(sequences[1])
+    assert ingester.position is None
+    ingester._finish(sequences[0])
+    assert ingester.position == 20
+    ingester._finish(sequences[2])
+    assert ingester.position == 30
+
+
+class _OutOfOrderPipeline:
+    """Finishes the first message only after every other one, and records the checkpoint it saw then."""
+
+    def __init__(self, shared_memory, checkpoint_path, others):
+        self.shared_memory = shared_memory
+        self.checkpoint_path = checkpoint_path
+        self.others_done = asyncio.Event()
+        self.remaining = others
+        self.checkpoint_while_first_pending = "unread"
+
+    async def run(self, input_data, input_type, source):
+        if b"Subject: one" in input_data.head():
+            await self.others_done.wait()
+            try:
+                with open(self.checkpoint_path) as f:
+                    self.checkpoint_while_first_pending = json.load(f)
+            except FileNotFoundError:
+                self.checkpoint_while_first_pending = None
+        else:
+            self.remaining -= 1
+            if not self.remaining:
+                self.others_done.set()
+        return {}
+
+
+def test_out_of_order_completion_checkpoints_only_finished_prefix(tmp_path):
+    path = str(tmp_path / "archive.mbox")
+    offsets = _write_mbox(path)
+    checkpoint_path = str(tmp_path / "archive.checkpoint.json")
+    memory = SharedMemory(str(tmp_path / "memory.db"), search_indexing=False)
+    pipeline = _OutOfOrderPipeline(memory, checkpoint_path, len(MESSAGES) - 1)
+    try:
+        ingester = MailboxIngester(pipeline, path, checkpoint_path=checkpoint_path, concurrency=len(MESSAGES),
+                                   checkpoint_every=1)
+        summary = asyncio.run(ingester.run())
+    finally:
+        memory.close()
+
+    # Later messages finishing first must not move the checkpoint past the first one
+    assert pipeline.checkpoint_while_first_pending is None
+    assert summary["messages"] == len(MESSAGES)
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["position"] == offsets[-1]
+    assert checkpoint["messages"] == len(MESSAGES)
@@ -0,0 +1,70 @@
+"""
+Train or evaluate the local intent model from the labelled intake history in
+shared_memory.db. The API loads the trained model at startup and only calls
+Gemini for intent classification when the model is not confident enough.
+
+    python train_intent_model.py train [--db shared_memory.db] [--out intent_model.json]
+    python train_intent_model.py evaluate [--db shared_memory.db] [--holdout 5]
+"""
+import argparse
+
+from memory.shared_memory import SHARED_MEMORY_PATH
+from utils.intent_model import IntentModel, load_training_data, INTENT_MODEL_PATH, INTENT_MODEL_THRESHOLD
+
+EVALUATION_THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+def train(args):
+    examples = load_training_data(args.db)
+    if not examples:
+        print(f"No labelled email/JSON inputs found in {args.db}")
+        return
+    model = IntentModel().fit(examples)
+    model.save(args.out)
+    print(f"Trained on {len(examples)} examples: {model.class_docs}")
+    print(f"Saved model to {args.out}")
+
+
+def evaluate(args):
+    examples = load_training_data(args.db)
+    # Every n-th example is held out, which keeps the split deterministic
+    test = examples[::args.holdout]
+    training = [example for i, example in enumerate(examples) if i % args.holdout]
+    if not training or not test:
+        print(f"Not enough labelled examples in {args.db} ({len(examples)})")
+        return
+    model = IntentModel().fit(training)
+    predictions = [(model.predict(text), intent) for text, intent in test]
+
+    correct = sum(1 for (predicted, _), intent in predictions if predicted == intent)
+    print(f"Trained on {len(training)} examples, tested on {len(test)}")
+    print(f"Overall accuracy: {correct / len(test):.3f}")
+    print("threshold  coverage  accuracy  (coverage = share of inputs that skip the LLM)")
+    for threshold in sorted(set(EVALUATION_THRESHOLDS + (INTENT_MODEL_THRESHOLD,))):
+        confident = [(predicted, intent) for (predicted, confidence), intent in predictions
+                     if confidence >= threshold]
+        accuracy = (sum(1 for predicted, intent in confident if predicted == intent) / len(confident)
+                    if confident else 0.0)
+        print(f"{threshold:9.2f}  {len(confident) / len(test):8.3f}  {accuracy:8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or evaluate the local intent model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train on the full history and save the model")
+    train_parser.add_argument("--db", default=SHARED_MEMORY_PATH)
+    train_parser.add_argument("--out", default=INTENT_MODEL_PATH)
+    train_parser.set_defaults(func=train)
+
+    evaluate_parser = subparsers.add_parser("evaluate", help="Report accuracy and coverage on a holdout split")
+    evaluate_parser.add_argument("--db", default=SHARED_MEMORY_PATH)
+    evaluate_parser.add_argument("--holdout", type=int, default=5, help="Hold out every n-th example")
+    evaluate_parser.set_defaults(func=evaluate)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
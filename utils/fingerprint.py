@@ -0,0 +1,31 @@
+import hashlib
+import json
+
+
+def normalize_input(value):
+    """
+    Normalize an input value so that semantically identical payloads produce
+    the same serialized form (dict key order, line endings, outer whitespace).
+    """
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    if isinstance(value, str):
+        return value.replace('\r\n', '\n').strip()
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def fingerprint(*parts):
+    """
+    Build a stable SHA-256 hex digest from the given parts.
+
+    Args:
+        parts: Values to hash; each is normalized with normalize_input
+
+    Returns:
+        Hex digest identifying the combination of parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(normalize_input(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
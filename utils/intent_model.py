@@ -0,0 +1,214 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import zlib
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from agents.mime_parser import ATTACHMENT_SOURCE, EmailAttachment, ParsedEmail
+
+# Local intent model configuration (overridable per deployment through the environment)
+INTENT_MODEL_ENABLED = os.environ.get("INTENT_MODEL_ENABLED", "1") not in ("0", "false", "no")
+INTENT_MODEL_PATH = os.environ.get("INTENT_MODEL_PATH", "intent_model.json")
+INTENT_MODEL_THRESHOLD = float(os.environ.get("INTENT_MODEL_THRESHOLD", "0.9"))
+
+# Labels worth learning; "unknown"/"other" are what the fallback paths return
+TRAINING_INTENTS = ("rfq", "invoice", "complaint", "regulation", "inquiry")
+
+# Only the head of a document is featurized; routine invoices/RFQs say what
+# they are early, and this bounds the cost on very large inputs
+MAX_FEATURE_CHARS = 20000
+DEFAULT_BUCKETS = 1 << 18
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def hashed_features(text: str, buckets: int = DEFAULT_BUCKETS) -> Counter:
+    """Count word unigrams and bigrams of the text, hashed into a fixed number of buckets."""
+    tokens = TOKEN_PATTERN.findall(text[:MAX_FEATURE_CHARS].lower())
+    features = Counter()
+    previous = None
+    for token in tokens:
+        features[zlib.crc32(token.encode('utf-8')) % buckets] += 1
+        if previous is not None:
+            features[zlib.crc32(f"{previous} {token}".encode('utf-8')) % buckets] += 1
+        previous = token
+    return features
+
+
+def email_training_text(record: Dict) -> str:
+    """
+    Rebuild the text ClassifierAgent saw for an email from its email_agent record.
+
+    Records written before emails were parsed carry the raw email as body and
+    no headers, which is also what the classifier saw for them.
+    """
+    attachments = [
+        EmailAttachment(attachment.get("filename", ""), attachment.get("content_type", ""),
+                        attachment.get("size_bytes", 0), attachment.get("format"), None)
+        for attachment in record.get("attachments") or []
+    ]
+    return ParsedEmail(record.get("headers") or {}, record.get("body", ""), attachments).llm_text()
+
+
+def load_training_data(db_path: str) -> List[Tuple[str, str]]:
+    """
+    Read labelled (text, intent) pairs from a SharedMemory database.
+
+    The text is rebuilt exactly as ClassifierAgent sees it: the parsed email's
+    llm_text() for email_agent results and the serialized document for
+    json_agent results. Each input yields one example. Skipped are PDFs and
+    JSON streams, whose classifier text is not stored, attachments, which
+    inherit their email's intent, and labels from the fallback paths
+    ("unknown"/"other", or an email extracted without the LLM).
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT i.intent, e.agent, e.data FROM inputs i "
+            "JOIN extracted_fields e ON e.id = (SELECT MIN(id) FROM extracted_fields WHERE input_id = i.id) "
+            "WHERE i.format IN ('email', 'json') AND e.agent IN ('email_agent', 'json_agent') "
+            "AND i.source != ? AND i.intent IN ({}) "
+            "ORDER BY i.id".format(", ".join("?" * len(TRAINING_INTENTS))),
+            (ATTACHMENT_SOURCE,) + TRAINING_INTENTS
+        ).fetchall()
+    finally:
+        conn.close()
+
+    examples = []
+    for intent, agent, data in rows:
+        try:
+            data = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(data, dict):
+            continue
+        if agent == "email_agent":
+            if data.get("ai_enhanced") is False:
+                continue
+            text = email_training_text(data)
+        else:
+            text = json.dumps(data.get("data", data))
+        if text:
+            examples.append((str(text), intent))
+    return examples
+
+
+class IntentModel:
+    """
+    Multinomial naive Bayes over hashed word n-grams.
+
+    Small enough to train in seconds from the intake history and to predict
+    in well under a millisecond, so routine documents can be classified
+    without an LLM call when the model is confident.
+    """
+
+    def __init__(self, buckets: int = DEFAULT_BUCKETS, alpha: float = 1.0):
+        self.buckets = buckets
+        self.alpha = alpha
+        self.class_docs: Dict[str, int] = {}
+        self.feature_counts: Dict[str, Dict[int, int]] = {}
+        self.class_totals: Dict[str, int] = {}
+        self.trained_at = None
+        self.predictions = 0
+        self.confident_predictions = 0
+
+    def fit(self, examples: List[Tuple[str, str]]) -> "IntentModel":
+        """Train on (text, intent) pairs, replacing any previous state."""
+        self.class_docs, self.feature_counts, self.class_totals = {}, {}, {}
+        for text, intent in examples:
+            self.class_docs[intent] = self.class_docs.get(intent, 0) + 1
+            counts = self.feature_counts.setdefault(intent, {})
+            for bucket, count in hashed_features(text, self.buckets).items():
+                counts[bucket] = counts.get(bucket, 0) + count
+                self.class_totals[intent] = self.class_totals.get(intent, 0) + count
+        self.trained_at = datetime.now().isoformat()
+        return self
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """
+        Predict the intent of a document.
+
+        Returns:
+            Tuple of the most likely intent and its posterior probability,
+            or (None, 0.0) if the model has not been trained
+        """
+        if not self.class_docs:
+            return None, 0.0
+        features = hashed_features(text, self.buckets)
+        total_docs = sum(self.class_docs.values())
+        scores = {}
+        for intent, docs in self.class_docs.items():
+            counts = self.feature_counts.get(intent, {})
+            denominator = math.log(self.class_totals.get(intent, 0) + self.alpha * self.buckets)
+            score = math.log(docs / total_docs)
+            for bucket, count in features.items():
+                score += count * (math.log(counts.get(bucket, 0) + self.alpha) - denominator)
+            scores[intent] = score
+
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def predict_confident(self, text: str, threshold: float = INTENT_MODEL_THRESHOLD) -> Optional[str]:
+        """Return the predicted intent only if its confidence reaches the threshold."""
+        intent, confidence = self.predict(text)
+        self.predictions += 1
+        if intent is None or confidence < threshold:
+            return None
+        self.confident_predictions += 1
+        return intent
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "trained_at": self.trained_at,
+            "training_examples": dict(self.class_docs),
+            "threshold": INTENT_MODEL_THRESHOLD,
+            "predictions": self.predictions,
+            "confident_predictions": self.confident_predictions
+        }
+
+    def save(self, path: str = INTENT_MODEL_PATH):
+        state = {
+            "buckets": self.buckets,
+            "alpha": self.alpha,
+            "trained_at": self.trained_at,
+            "class_docs": self.class_docs,
+            "class_totals": self.class_totals,
+            "feature_counts": {
+                intent: {str(bucket): count for bucket, count in counts.items()}
+                for intent, counts in self.feature_counts.items()
+            }
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = INTENT_MODEL_PATH) -> "IntentModel":
+        with open(path) as f:
+            state = json.load(f)
+        model = cls(state["buckets"], state["alpha"])
+        model.trained_at = state.get("trained_at")
+        model.class_docs = state["class_docs"]
+        model.class_totals = state["class_totals"]
+        model.feature_counts = {
+            intent: {int(bucket): count for bucket, count in counts.items()}
+            for intent, counts in state["feature_counts"].items()
+        }
+        return model
+
+
+def load_intent_model(path: str = INTENT_MODEL_PATH) -> Optional[IntentModel]:
+    """Load the trained model if it is enabled and has been trained, else None."""
+    if not INTENT_MODEL_ENABLED or not os.path.exists(path):
+        return None
+    try:
+        return IntentModel.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Failed to load intent model from {path}: {str(e)}")
+        return None
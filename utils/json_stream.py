@@ -0,0 +1,193 @@
+import io
+import json
+import os
+import re
+from typing import Iterator, NamedTuple, Optional, TextIO, Tuple
+
+from utils.spooled_upload import SpooledUpload, SNIFF_BYTES
+
+# Streaming defaults; each can be overridden per request through JSONStreamOptions
+JSON_STREAM_ANALYZE = os.environ.get("JSON_STREAM_ANALYZE", "0") in ("1", "true", "yes")
+JSON_STREAM_CONCURRENCY = int(os.environ.get("JSON_STREAM_CONCURRENCY", "8"))
+# Records parsed (and, without analysis, logged) per worker thread hop
+JSON_STREAM_CHUNK_RECORDS = int(os.environ.get("JSON_STREAM_CHUNK_RECORDS", "256"))
+
+# Formats the classifier reports for payloads that are streamed record by record
+JSON_STREAM_FORMATS = ("json_array", "ndjson")
+
+READ_CHUNK_CHARS = 64 * 1024
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+
+class JSONStreamOptions(NamedTuple):
+    """
+    How a JSON array or NDJSON payload is processed.
+
+    analyze: Run the JSON agent's LLM analysis on every record instead of
+        only logging it
+    concurrency: Records analyzed at once
+    """
+    analyze: bool = JSON_STREAM_ANALYZE
+    concurrency: int = JSON_STREAM_CONCURRENCY
+
+
+class MalformedRecord(NamedTuple):
+    """
+    Yielded in place of an NDJSON line that is not valid JSON, or as the last
+    item of a malformed JSON array (line is None: the rest of the array is lost).
+    """
+    line: Optional[int]
+    error: str
+
+
+def detect_json_stream(head: bytes, tail: bytes) -> Optional[str]:
+    """
+    Recognize a top-level JSON array or NDJSON from the first and last bytes.
+
+    Returns:
+        "json_array", "ndjson", or None for anything else (including a single
+        JSON object, pretty-printed or not)
+    """
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if text.startswith(b"["):
+        return "json_array" if tail.rstrip().endswith(b"]") else None
+    if not text.startswith(b"{"):
+        return None
+
+    first, newline, rest = text.partition(b"\n")
+    if newline:
+        # One complete object on the first line, followed by more lines
+        candidate = first if rest.strip() else None
+    else:
+        # The first record is longer than the head; look at the last line instead
+        lines = tail.rstrip().rsplit(b"\n", 1)
+        candidate = lines[1] if len(lines) == 2 else None
+    if candidate is None:
+        return None
+    try:
+        return "ndjson" if isinstance(json.loads(candidate), dict) else None
+    except ValueError:
+        return None
+
+
+def sniff_json_stream(data) -> Optional[str]:
+    """detect_json_stream for a SpooledUpload, bytes or str payload."""
+    if isinstance(data, SpooledUpload):
+        return detect_json_stream(data.head(), data.tail())
+    if isinstance(data, str):
+        return detect_json_stream(data[:SNIFF_BYTES].encode('utf-8'), data[-SNIFF_BYTES:].encode('utf-8'))
+    if isinstance(data, bytes):
+        return detect_json_stream(data[:SNIFF_BYTES], data[-SNIFF_BYTES:])
+    return None
+
+
+def open_text(source) -> TextIO:
+    """Open a SpooledUpload, bytes or str payload as a text stream."""
+    if isinstance(source, str):
+        return io.StringIO(source)
+    raw = source.open() if isinstance(source, SpooledUpload) else io.BytesIO(source)
+    return io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace')
+
+
+def iter_json_array(f: TextIO) -> Iterator:
+    """
+    Yield the elements of a top-level JSON array one at a time.
+
+    Only the element being decoded and one read chunk are held in memory.
+
+    Raises:
+        ValueError: If the array is malformed; elements already yielded stand
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        # Read at least as much as is buffered, so re-decoding a large
+        # element stays linear overall
+        chunk = f.read(max(READ_CHUNK_CHARS, len(buf) - pos))
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def next_char():
+        nonlocal pos
+        while True:
+            pos = WHITESPACE_RE.match(buf, pos).end()
+            if pos < len(buf) or eof:
+                return buf[pos:pos + 1]
+            fill()
+
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    index = 0
+    while True:
+        char = next_char()
+        if char == "]":
+            return
+        if index:
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' after element {index - 1}")
+            pos += 1
+            next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"Malformed element {index}: {e.msg}") from None
+                fill()
+                continue
+            # A number or literal at the very end of the buffer may continue
+            # in the next chunk
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            break
+        pos = end
+        yield value
+        index += 1
+
+
+def iter_ndjson(f: TextIO) -> Iterator:
+    """Yield one value per non-blank line, or a MalformedRecord for lines that do not parse."""
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield MalformedRecord(line_number, e.msg)
+
+
+def iter_records(source, format_type: str) -> Iterator[Tuple[int, object]]:
+    """
+    Yield (index, value) for every record of a JSON array or NDJSON payload.
+
+    Malformed records are yielded as MalformedRecord values. The underlying
+    file is closed when the generator finishes or is closed.
+    """
+    if format_type not in JSON_STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format: {format_type}")
+    with open_text(source) as f:
+        values = iter_json_array(f) if format_type == "json_array" else iter_ndjson(f)
+        index = 0
+        try:
+            for value in values:
+                yield index, value
+                index += 1
+        except ValueError as e:
+            yield index, MalformedRecord(None, str(e))
+
+
+def take(records: Iterator, count: int = JSON_STREAM_CHUNK_RECORDS) -> list:
+    """Pull up to count items from an iterator (run in a worker thread)."""
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) >= count:
+            break
+    return chunk
@@ -0,0 +1,210 @@
+import json
+import os
+import re
+from typing import Any, Iterable, List
+
+# Size of the structural summary sent to the LLM in place of the document
+JSON_SUMMARY_TOKEN_BUDGET = int(os.environ.get("JSON_SUMMARY_TOKEN_BUDGET", "1000"))
+
+# Rough characters per token used to turn the token budget into a length
+CHARS_PER_TOKEN = 4
+# Distinct key paths tracked; values at new paths beyond this (e.g. objects
+# keyed by ids) are counted but not described
+MAX_PATHS = 500
+# Distinct sample values kept per path, and their maximum length
+MAX_SAMPLES = 3
+SAMPLE_CHARS = 40
+
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+TYPE_NAMES = {
+    type(None): "null",
+    bool: "boolean",
+    int: "integer",
+    float: "number",
+    str: "string",
+    dict: "object",
+    list: "array"
+}
+
+
+def _child_path(path, key):
+    key = str(key)
+    if IDENTIFIER_RE.match(key):
+        return f"{path}.{key}"
+    return f"{path}[{json.dumps(key)}]"
+
+
+def _sample(value):
+    if isinstance(value, str):
+        return json.dumps(value[:SAMPLE_CHARS] + ("..." if len(value) > SAMPLE_CHARS else ""))
+    return json.dumps(value, default=str)
+
+
+class _PathStats:
+    """What was seen at one key path."""
+
+    __slots__ = ("path", "order", "depth", "children", "count", "types", "nulls", "samples",
+                 "min_length", "max_length")
+
+    def __init__(self, path, order, depth):
+        self.path = path
+        self.order = order
+        self.depth = depth
+        # key (None for array elements) -> _PathStats, so paths are only
+        # built as strings once
+        self.children = {}
+        self.count = 0
+        self.types = {}
+        self.nulls = 0
+        self.samples = []
+        self.min_length = None
+        self.max_length = None
+
+    def add(self, value):
+        self.count += 1
+        value_type = type(value)
+        type_name = TYPE_NAMES.get(value_type) or value_type.__name__
+        self.types[type_name] = self.types.get(type_name, 0) + 1
+        if value is None:
+            self.nulls += 1
+        elif value_type is dict or value_type is list:
+            length = len(value)
+            if self.min_length is None or length < self.min_length:
+                self.min_length = length
+            if self.max_length is None or length > self.max_length:
+                self.max_length = length
+        elif len(self.samples) < MAX_SAMPLES:
+            sample = _sample(value)
+            if sample not in self.samples:
+                self.samples.append(sample)
+
+    def describe(self):
+        parts = ["|".join(sorted(self.types, key=self.types.get, reverse=True))]
+        if self.count > 1:
+            parts.append(f"n={self.count}")
+        if self.nulls:
+            parts.append(f"{self.nulls * 100 // self.count}% null")
+        if self.min_length is not None:
+            label = "keys" if "object" in self.types else "len"
+            if self.min_length == self.max_length:
+                parts.append(f"{label} {self.min_length}")
+            else:
+                parts.append(f"{label} {self.min_length}-{self.max_length}")
+        if self.samples:
+            parts.append("e.g. " + ", ".join(self.samples))
+        return f"{self.path}: " + ", ".join(parts)
+
+
+class JSONSummary:
+    """
+    Compact schema of a JSON document: key paths ($.items[].price) with their
+    types, counts, null rates, array lengths and sample values.
+    """
+
+    def __init__(self, paths: List[_PathStats], root_keys, values: int, untracked: int):
+        self.paths = paths
+        self.root_keys = root_keys
+        self.values = values
+        self.untracked = untracked
+
+    def missing_fields(self, fields: Iterable[str]) -> List[str]:
+        """Required top-level fields absent from the document."""
+        return [field for field in fields if field not in self.root_keys]
+
+    def render(self, token_budget: int = JSON_SUMMARY_TOKEN_BUDGET) -> str:
+        """
+        Describe the document within roughly token_budget tokens.
+
+        Paths are listed depth first in the order they were first seen. When
+        they do not all fit, the deepest levels are dropped first so every
+        top-level key stays visible.
+        """
+        char_budget = token_budget * CHARS_PER_TOKEN
+        header = f"JSON structure: {len(self.paths)} key paths, {self.values} values"
+        if self.untracked:
+            header += f", {self.untracked} more under untracked paths"
+        ordered = sorted(self.paths, key=lambda stats: stats.order)
+        lines = [(stats.depth, stats.describe()) for stats in ordered]
+
+        max_depth = max((depth for depth, _ in lines), default=0)
+        while max_depth > 1:
+            if len(header) + sum(len(line) + 1 for depth, line in lines if depth <= max_depth) <= char_budget:
+                break
+            max_depth -= 1
+        kept = [line for depth, line in lines if depth <= max_depth]
+
+        text = [header]
+        used = len(header)
+        for line in kept:
+            if used + len(line) + 1 > char_budget:
+                break
+            text.append(line)
+            used += len(line) + 1
+        omitted = len(lines) - len(text) + 1
+        if omitted:
+            text.append(f"... {omitted} more paths omitted")
+        return "\n".join(text)
+
+
+def summarize_json(data: Any, max_paths: int = MAX_PATHS) -> JSONSummary:
+    """
+    Walk a parsed JSON document once and collect its structure.
+
+    The walk is iterative, so deeply nested documents do not hit the
+    recursion limit, and nothing is serialized apart from short samples.
+    Elements of an array share one path ending in [].
+
+    Args:
+        data: The parsed document
+        max_paths: Number of distinct key paths described in detail
+
+    Returns:
+        JSONSummary of the document
+    """
+    root = _PathStats("$", (0,), 0)
+    paths = [root]
+    untracked = 0
+
+    def child_stats(stats, key):
+        child = stats.children.get(key)
+        if child is None:
+            if len(paths) >= max_paths:
+                return None
+            path = stats.path + "[]" if key is None else _child_path(stats.path, key)
+            # Ordering by the registration index of every ancestor lists
+            # paths depth first, in the order they were first seen
+            child = stats.children[key] = _PathStats(path, stats.order + (len(paths),), stats.depth + 1)
+            paths.append(child)
+        return child
+
+    root.add(data)
+    stack = [(root, data)] if type(data) in (dict, list) else []
+    while stack:
+        stats, value = stack.pop()
+        if not value:
+            continue
+        if type(value) is dict:
+            items = value.items()
+        else:
+            element_stats = child_stats(stats, None)
+            if element_stats is None:
+                untracked += len(value)
+                continue
+            items = ((None, child) for child in value)
+        pending = []
+        for key, child in items:
+            target = element_stats if key is None else child_stats(stats, key)
+            if target is None:
+                # The value and everything under it go undescribed
+                untracked += 1
+                continue
+            target.add(child)
+            if type(child) in (dict, list):
+                pending.append((target, child))
+        stack.extend(reversed(pending))
+
+    root_keys = set(data) if isinstance(data, dict) else set()
+    values = sum(stats.count for stats in paths)
+    return JSONSummary(paths, root_keys, values, untracked)
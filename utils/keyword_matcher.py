@@ -0,0 +1,113 @@
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Optional
+
+# Optional JSON file replacing the default keyword table, in the same shape:
+# {"intent": {"invoice": {"invoice": 2, "payment": 1}, ...}, "urgency": {...}}
+KEYWORD_TABLE_PATH = os.environ.get("KEYWORD_TABLE_PATH")
+
+# category -> label -> keyword/phrase -> weight. Label order breaks score ties.
+DEFAULT_KEYWORD_TABLE = {
+    "intent": {
+        "rfq": {"rfq": 3, "request for quote": 3, "quotation": 2, "quote": 1},
+        "invoice": {"invoice": 3, "payment": 1, "bill": 1},
+        "complaint": {"complaint": 3, "issue": 1, "problem": 1},
+        "regulation": {"regulation": 3, "compliance": 2, "legal": 1},
+        "inquiry": {"inquiry": 3, "question": 1, "information": 1}
+    },
+    "urgency": {
+        "high": {"urgent": 2, "asap": 2, "immediately": 1, "critical": 1},
+        "low": {"low priority": 2, "when you have time": 2}
+    }
+}
+
+
+def _trie_pattern(node):
+    """Turn a character trie into a regex alternation that prefers the longest match."""
+    end = node.get("", False)
+    branches = [re.escape(char) + _trie_pattern(child)
+                for char, child in sorted(node.items()) if char != ""]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return f"(?:{pattern})?" if end else pattern
+
+
+class KeywordMatcher:
+    """
+    Single-pass, case-insensitive multi-keyword matcher.
+
+    All keywords are compiled into one trie-shaped regex, so the text is
+    scanned once however many keywords the table holds. Keywords
+    must start on a word boundary ('bill' matches 'billing', not 'rebill').
+    """
+
+    def __init__(self, table: Dict[str, Dict[str, Dict[str, float]]]):
+        self.table = table
+        self._keywords = {}
+        self._weights = {}
+        trie = {}
+        for category, labels in table.items():
+            for label, keywords in labels.items():
+                for keyword, weight in keywords.items():
+                    keyword = keyword.lower()
+                    self._keywords.setdefault(keyword, []).append((category, label))
+                    self._weights[(category, label, keyword)] = weight
+                    node = trie
+                    for char in keyword:
+                        node = node.setdefault(char, {})
+                    node[""] = True
+        self._pattern = re.compile(r"\b" + _trie_pattern(trie)) if trie else None
+
+    def scan(self, text: str) -> Dict[str, Dict[str, Counter]]:
+        """
+        Find every keyword occurrence in one pass.
+
+        Returns:
+            category -> label -> Counter of matched keywords
+        """
+        hits = {category: {} for category in self.table}
+        if self._pattern is None:
+            return hits
+        # Lowercasing once and matching case-sensitively is much faster than
+        # re.IGNORECASE on large inputs
+        counts = Counter(self._pattern.findall(text.lower()))
+        for keyword, count in counts.items():
+            for category, label in self._keywords.get(keyword, ()):
+                hits[category].setdefault(label, Counter())[keyword] += count
+        return hits
+
+    def scores(self, hits: Dict[str, Dict[str, Counter]], category: str) -> Dict[str, float]:
+        """Weighted score per label of a category (keyword weight x occurrences)."""
+        return {
+            label: sum(self._weights[(category, label, keyword)] * count for keyword, count in counter.items())
+            for label, counter in hits.get(category, {}).items()
+        }
+
+    def best(self, hits: Dict[str, Dict[str, Counter]], category: str, default: str) -> str:
+        """Highest scoring label of a category, or default if nothing matched."""
+        scores = self.scores(hits, category)
+        if not scores:
+            return default
+        order = list(self.table[category])
+        return max(scores, key=lambda label: (scores[label], -order.index(label)))
+
+    def classify(self, text: str, category: str, default: str) -> str:
+        return self.best(self.scan(text), category, default)
+
+
+def load_keyword_table(path: Optional[str] = KEYWORD_TABLE_PATH):
+    """Return the keyword table from the configured JSON file, or the built-in defaults."""
+    if not path:
+        return DEFAULT_KEYWORD_TABLE
+    with open(path) as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def get_keyword_matcher() -> KeywordMatcher:
+    """The process-wide matcher, compiled once from the configured table."""
+    return KeywordMatcher(load_keyword_table())
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from memory.sqlite_pool import SQLitePool
+
+# Cache configuration (overridable per deployment through the environment)
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") not in ("0", "false", "no")
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_SECONDS = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+# Hit/miss counters and last-access times are buffered in memory and written
+# in one transaction at most this often, so lookups never take the write lock
+LLM_CACHE_FLUSH_SECONDS = float(os.environ.get("LLM_CACHE_FLUSH_SECONDS", "5"))
+# Expired and least recently used entries are evicted once per this many puts
+LLM_CACHE_EVICT_EVERY = int(os.environ.get("LLM_CACHE_EVICT_EVERY", "100"))
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache for LLM responses.
+
+    Entries live in a local SQLite file so they survive restarts and are shared
+    by every worker process pointing at the same path. Entries expire after
+    `ttl_seconds` and the least recently used ones are evicted once the cache
+    holds more than `max_entries` rows.
+
+    Lookups are read-only: last-access times and counters are buffered and
+    written every `flush_seconds`, and eviction runs every `evict_every`
+    puts, so the cache may briefly exceed `max_entries`.
+    """
+
+    def __init__(self, db_path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, flush_seconds: float = LLM_CACHE_FLUSH_SECONDS,
+                 evict_every: int = LLM_CACHE_EVICT_EVERY):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.flush_seconds = flush_seconds
+        self.evict_every = max(1, evict_every)
+        self.pool = SQLitePool(db_path)
+        self._lock = threading.Lock()
+        self._accessed: Dict[str, float] = {}
+        self._counters: Dict[str, list] = {}
+        self._last_flush = time.monotonic()
+        self._puts = 0
+        self._init_db()
+
+    def _init_db(self):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                method TEXT,
+                value TEXT,
+                created_at REAL,
+                last_access REAL,
+                latency_ms REAL
+            )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache_stats (
+                method TEXT PRIMARY KEY,
+                hits INTEGER DEFAULT 0,
+                misses INTEGER DEFAULT 0,
+                saved_ms REAL DEFAULT 0
+            )
+            ''')
+
+    def _record(self, method, hits=0, misses=0, saved_ms=0.0, key=None, accessed_at=None):
+        with self._lock:
+            counters = self._counters.setdefault(method, [0, 0, 0.0])
+            counters[0] += hits
+            counters[1] += misses
+            counters[2] += saved_ms
+            if key is not None:
+                self._accessed[key] = accessed_at
+            due = time.monotonic() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered last-access times and hit/miss counters in one transaction."""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            counters, self._counters = self._counters, {}
+            self._last_flush = time.monotonic()
+        if not accessed and not counters:
+            return
+        try:
+            with self.pool.connection() as conn:
+                conn.executemany(
+                    "UPDATE llm_cache SET last_access = MAX(last_access, ?) WHERE key = ?",
+                    [(accessed_at, key) for key, accessed_at in accessed.items()]
+                )
+                conn.executemany(
+                    "INSERT INTO llm_cache_stats (method, hits, misses, saved_ms) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(method) DO UPDATE SET hits = hits + excluded.hits, "
+                    "misses = misses + excluded.misses, saved_ms = saved_ms + excluded.saved_ms",
+                    [(method, hits, misses, saved_ms) for method, (hits, misses, saved_ms) in counters.items()]
+                )
+        except Exception as e:
+            # Counters and recency are best effort; a lost flush only skews stats and LRU order
+            print(f"Failed to flush LLM cache counters: {str(e)}")
+
+    def get(self, key: str, method: str) -> Optional[Any]:
+        """
+        Look up a cached response.
+
+        Args:
+            key: Content-addressed cache key
+            method: Name of the client method, used for the hit/miss counters
+
+        Returns:
+            The cached value, or None on a miss or an expired entry
+        """
+        now = time.time()
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT value, created_at, latency_ms FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row and now - row[1] <= self.ttl_seconds:
+            self._record(method, hits=1, saved_ms=row[2] or 0.0, key=key, accessed_at=now)
+            return json.loads(row[0])
+        # Expired entries are left for the next eviction
+        self._record(method, misses=1)
+        return None
+
+    def put(self, key: str, method: str, value: Any, latency_ms: float):
+        """
+        Store a response, evicting expired or least recently used entries
+        every evict_every puts.
+
+        Args:
+            key: Content-addressed cache key
+            method: Name of the client method that produced the value
+            value: JSON-serializable response
+            latency_ms: How long the uncached call took, credited on later hits
+        """
+        now = time.time()
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % self.evict_every == 0
+        if evict:
+            # Pending recency updates go first so eviction sees them
+            self.flush()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, method, value, created_at, last_access, latency_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, method, json.dumps(value), now, now, latency_ms)
+            )
+            if evict:
+                self._evict(cursor, now)
+
+    def _evict(self, cursor, now):
+        cursor.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        cursor.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY last_access LIMIT "
+            "MAX(0, (SELECT COUNT(*) FROM llm_cache) - ?))",
+            (self.max_entries,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return cache counters aggregated across all workers sharing the file.
+
+        Returns:
+            Dictionary with entry count, hits, misses, hit rate, LLM round trips
+            saved and the latency those round trips would have cost
+        """
+        self.flush()
+        with self.pool.connection() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            rows = conn.execute("SELECT method, hits, misses, saved_ms FROM llm_cache_stats").fetchall()
+
+        by_method = {
+            method: {"hits": hits, "misses": misses, "saved_latency_ms": round(saved_ms, 1)}
+            for method, hits, misses, saved_ms in rows
+        }
+        hits = sum(row[1] for row in rows)
+        misses = sum(row[2] for row in rows)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "saved_round_trips": hits,
+            "saved_latency_ms": round(sum(row[3] for row in rows), 1),
+            "by_method": by_method
+        }
+
+    def close(self):
+        self.flush()
+        self.pool.close()
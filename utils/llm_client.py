@@ -1,22 +1,159 @@
-import google.generativeai as genai
+import asyncio
 import os
+import sqlite3
+import threading
+import time
 from typing import Dict, List, Any, Optional
 
-# Configure the Gemini API with the provided key
+from utils.fingerprint import fingerprint
+from utils.llm_cache import LLMCache, LLM_CACHE_ENABLED
+from utils.llm_scheduler import LLMScheduler
+from utils.json_summary import JSONSummary, summarize_json
+from utils.metrics import observe_stage, record_event
+
 API_KEY = "YOUR_Gemini_API_KEY"
-genai.configure(api_key=API_KEY)
+
+# Import the Gemini SDK in the background right after startup instead of on
+# the first LLM call
+LLM_PRELOAD = os.environ.get("LLM_PRELOAD", "1") not in ("0", "false", "no")
+
+_genai_lock = threading.Lock()
+_genai = None
+
+
+def load_genai():
+    """
+    Import and configure google.generativeai on first use.
+
+    The SDK's import tree takes about a second, so it is kept out of module
+    import and off the path to a worker's first request.
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            # Configure the Gemini API with the provided key
+            genai.configure(api_key=API_KEY)
+            _genai = genai
+        return _genai
+
+# Bump whenever a prompt template changes so stale cached responses are ignored
+PROMPT_VERSION = "2"
 
 class GeminiClient:
     """Client for interacting with Google's Gemini API."""
     
-    def __init__(self, model_name: str = "gemini-1.5-flash"):
+    def __init__(self, model_name: str = "gemini-1.5-flash", cache: Optional[LLMCache] = None,
+                 scheduler: Optional[LLMScheduler] = None):
         """
         Initialize the Gemini client.
         
         Args:
             model_name: The name of the Gemini model to use.
+            cache: Optional response cache; defaults to the shared on-disk cache
+                unless LLM_CACHE_ENABLED is turned off.
+            scheduler: Optional rate/concurrency scheduler shared by every call
+                made through this client.
+        """
+        self.model_name = model_name
+        # Created on first use, see model and preload()
+        self._model = None
+        if cache is None and LLM_CACHE_ENABLED:
+            cache = LLMCache()
+        self.cache = cache
+        self.scheduler = scheduler or LLMScheduler()
+    
+    @property
+    def model(self):
+        """The Gemini model, created (and the SDK imported) on first access."""
+        if self._model is None:
+            model = load_genai().GenerativeModel(self.model_name)
+            # Keep a model installed while the SDK was loading
+            if self._model is None:
+                self._model = model
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
+    async def preload(self):
+        """
+        Create the model in a worker thread, so neither startup nor the
+        event loop waits for the SDK import.
         """
-        self.model = genai.GenerativeModel(model_name)
+        if self._model is None:
+            await asyncio.to_thread(lambda: self.model)
+    
+    def close(self):
+        """Close the response cache's database connections."""
+        if self.cache is not None:
+            self.cache.close()
+    
+    async def _generate(self, prompt: str):
+        """Send a prompt to the model through the scheduler."""
+        await self.preload()
+        return await self.scheduler.submit(lambda: self.model.generate_content_async(prompt))
+    
+    async def _cached(self, method: str, key_input: Any, compute):
+        """
+        Serve a call from the response cache, or run it and store the result.
+        
+        Args:
+            method: Name of the public client method
+            key_input: The inputs that fully determine the prompt
+            compute: Coroutine function returning (result, cacheable)
+            
+        Returns:
+            The (possibly cached) result of the call
+        """
+        started = time.perf_counter()
+        try:
+            return await self._cached_call(method, key_input, compute)
+        finally:
+            observe_stage(f"llm.{method}", time.perf_counter() - started)
+    
+    async def _cached_call(self, method: str, key_input: Any, compute):
+        if self.cache is None:
+            result, cacheable = await compute()
+            if not cacheable:
+                record_event("llm_fallback")
+            return result
+        
+        key = fingerprint(method, self.model_name, PROMPT_VERSION, key_input)
+        try:
+            cached = await asyncio.to_thread(self.cache.get, key, method)
+            if cached is not None:
+                record_event("cache_hit")
+                return cached
+        except sqlite3.Error as e:
+            print(f"LLM cache lookup failed: {str(e)}")
+        
+        started = time.perf_counter()
+        result, cacheable = await compute()
+        latency_ms = (time.perf_counter() - started) * 1000
+        if not cacheable:
+            record_event("llm_fallback")
+        
+        # Degraded fallback results are not cached so the next call retries the model
+        if cacheable:
+            try:
+                await asyncio.to_thread(self.cache.put, key, method, result, latency_ms)
+            except sqlite3.Error as e:
+                print(f"LLM cache store failed: {str(e)}")
+        return result
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for the response cache."""
+        if self.cache is None:
+            return {"enabled": False}
+        stats = self.cache.stats()
+        stats["enabled"] = True
+        return stats
+    
+    def scheduler_stats(self) -> Dict[str, Any]:
+        """Return queue depth, wait times and limits of the call scheduler."""
+        return self.scheduler.stats()
     
     async def classify_content(self, content: str, categories: List[str]) -> str:
         """
@@ -29,6 +166,13 @@ class GeminiClient:
         Returns:
             The most likely category from the provided list
         """
+        return await self._cached(
+            "classify_content",
+            [content[:4000], categories],
+            lambda: self._classify_content(content, categories)
+        )
+    
+    async def _classify_content(self, content: str, categories: List[str]):
         prompt = f"""
         Classify the following content into one of these categories: {', '.join(categories)}.
         Respond with only the category name, nothing else.
@@ -37,7 +181,7 @@ class GeminiClient:
         {content[:4000]}  # Limiting content length to avoid token limits
         """
         
-        response = await self.model.generate_content_async(prompt)
+        response = await self._generate(prompt)
         result = response.text.strip().lower()
         
         # Make sure the result is one of the valid categories
@@ -45,10 +189,10 @@ class GeminiClient:
             # Return the original case version
             for cat in categories:
                 if cat.lower() == result:
-                    return cat
+                    return cat, True
         
         # Default to the first category if no match
-        return categories[0]
+        return categories[0], False
     
     async def extract_email_metadata(self, email_text: str) -> Dict[str, Any]:
         """
@@ -60,6 +204,13 @@ class GeminiClient:
         Returns:
             Dictionary with sender, subject, intent, urgency, and summary
         """
+        return await self._cached(
+            "extract_email_metadata",
+            email_text[:4000],
+            lambda: self._extract_email_metadata(email_text)
+        )
+    
+    async def _extract_email_metadata(self, email_text: str):
         prompt = f"""
         Extract the following information from this email:
         - Sender: The email address or name of the sender
@@ -75,7 +226,7 @@ class GeminiClient:
         {email_text[:4000]}
         """
         
-        response = await self.model.generate_content_async(prompt)
+        response = await self._generate(prompt)
         response_text = response.text.strip()
         
         # Try to extract JSON if it's enclosed in backticks or other markers
@@ -84,6 +235,7 @@ class GeminiClient:
         elif "```" in response_text:
             response_text = response_text.split("```")[1].strip()
         
+        cacheable = True
         try:
             # Try to parse as JSON
             import json
@@ -91,6 +243,7 @@ class GeminiClient:
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON from Gemini: {e}")
             print(f"Raw response: {response_text}")
+            cacheable = False
             
             # If JSON parsing fails, use a simple extraction
             result = {}
@@ -107,21 +260,32 @@ class GeminiClient:
                 if field not in result:
                     result[field] = "unknown"
         
-        return result
+        return result, cacheable
     
-    async def analyze_json_data(self, json_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def analyze_json_data(self, json_data: Dict[str, Any],
+                                summary: Optional[JSONSummary] = None) -> Dict[str, Any]:
         """
         Analyze JSON data using Gemini to extract key insights.
         
         Args:
             json_data: The JSON data to analyze
+            summary: Structural summary of json_data if the caller already has one
             
         Returns:
             Dictionary with analysis results
         """
-        # Convert JSON to string representation for the prompt
+        # The model sees a bounded structural summary rather than the document
+        if summary is None:
+            summary = await asyncio.to_thread(summarize_json, json_data)
+        structure = summary.render()
+        return await self._cached(
+            "analyze_json_data",
+            structure,
+            lambda: self._analyze_json_data(structure)
+        )
+    
+    async def _analyze_json_data(self, structure: str):
         import json
-        json_str = json.dumps(json_data, indent=2)
         
         prompt = f"""
         Analyze this JSON data and provide a comprehensive analysis in clear, simple English:
@@ -147,11 +311,12 @@ class GeminiClient:
         
         Don't include any markdown formatting, just pure JSON.
         
-        JSON Data:
-        {json_str[:4000]}
+        The JSON document is described by its key paths ($ is the root, [] marks array
+        elements) with their types, counts, null rates, lengths and sample values:
+        {structure}
         """
         
-        response = await self.model.generate_content_async(prompt)
+        response = await self._generate(prompt)
         response_text = response.text.strip()
         
         # Try to extract JSON if it's enclosed in backticks or other markers
@@ -160,12 +325,14 @@ class GeminiClient:
         elif "```" in response_text:
             response_text = response_text.split("```")[1].strip()
         
+        cacheable = True
         try:
             # Try to parse as JSON
             result = json.loads(response_text)
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON from Gemini: {e}")
             print(f"Raw response: {response_text}")
+            cacheable = False
             
             # If JSON parsing fails, create a structured response
             result = {
@@ -179,6 +346,11 @@ class GeminiClient:
                 "summary": "This is a JSON document containing structured data."
             }
         
+        return self._normalize_json_analysis(result), cacheable
+    
+    @staticmethod
+    def _normalize_json_analysis(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Coerce a JSON analysis response into the shape the JSON agent expects."""
         # Ensure all fields are properly formatted
         if isinstance(result.get("main_entities"), str):
             result["main_entities"] = [result["main_entities"]]
@@ -203,6 +375,95 @@ class GeminiClient:
         
         return result
     
+    async def classify_and_extract(self, format_type: str, content: Any, categories: List[str]) -> Dict[str, Any]:
+        """
+        Classify intent and run the format agent's extraction in a single prompt.
+        
+        Args:
+            format_type: Either "email" or "json"
+            content: Email text, or the parsed JSON document
+            categories: List of possible intent categories
+            
+        Returns:
+            Dictionary with 'intent' (one of the categories) and 'fields' holding
+            the same keys extract_email_metadata / analyze_json_data would return
+        """
+        if format_type not in ("email", "json"):
+            raise ValueError(f"Combined classification is not supported for format: {format_type}")
+        if format_type == "email":
+            body = content[:4000]
+        else:
+            body = (await asyncio.to_thread(summarize_json, content)).render()
+        return await self._cached(
+            "classify_and_extract",
+            [format_type, body, categories],
+            lambda: self._classify_and_extract(format_type, body, categories)
+        )
+    
+    async def _classify_and_extract(self, format_type: str, body: str, categories: List[str]):
+        import json
+        if format_type == "email":
+            task = """
+        Also extract the following information from this email:
+        - sender: The email address or name of the sender
+        - subject: The email subject line
+        - intent: The purpose of the email (options: rfq, invoice, complaint, regulation, inquiry, other)
+        - urgency: How urgent is this email (options: high, normal, low)
+        - summary: A brief 1-2 sentence summary of the email content
+        """
+            label = "Email"
+        else:
+            task = """
+        Also analyze this JSON data in clear, simple English and provide:
+        - main_entities (array): The primary objects or entities represented in this data
+        - structure_description (string): The overall structure and organization of this JSON
+        - key_data_points (array): The most important information contained in this data
+        - missing_fields (array): Any critical fields that appear to be missing
+        - data_quality (string): The completeness and quality of the data (good, fair, poor)
+        - likely_purpose (string): The likely purpose or use case for this data
+        - insights (array): 3-4 key insights from this data that would be valuable to a user
+        - summary (string): A 2-3 sentence plain English summary explaining what this JSON represents
+        """
+            label = "JSON structure (key paths with types, counts, null rates, lengths and sample values)"
+        
+        prompt = f"""
+        Classify the following content into one of these categories: {', '.join(categories)}.
+        {task}
+        Format your response as a clean JSON object with the keys 'intent' (the category name)
+        and 'fields' (an object holding the extracted information above).
+        Don't include any markdown formatting, just pure JSON.
+        
+        {label}:
+        {body}
+        """
+        
+        response = await self._generate(prompt)
+        response_text = response.text.strip()
+        
+        # Try to extract JSON if it's enclosed in backticks or other markers
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0].strip()
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].strip()
+        
+        # Unlike the single-purpose methods there is no useful degraded answer here;
+        # let the caller fall back to the two-pass pipeline instead
+        result = json.loads(response_text)
+        if not isinstance(result, dict) or not isinstance(result.get("fields"), dict):
+            raise ValueError("Combined response is missing the 'fields' object")
+        
+        intent = str(result.get("intent", "")).strip().lower()
+        matched = [cat for cat in categories if cat.lower() == intent]
+        fields = result["fields"]
+        if format_type == "json":
+            fields = self._normalize_json_analysis(fields)
+        else:
+            for field in ["sender", "subject", "intent", "urgency", "summary"]:
+                if field not in fields:
+                    fields[field] = "unknown"
+        
+        return {"intent": matched[0] if matched else categories[0], "fields": fields}, bool(matched)
+    
     async def extract_pdf_content(self, pdf_text: str, file_size: int) -> Dict[str, Any]:
         """
         Analyze PDF content using Gemini.
@@ -214,6 +475,13 @@ class GeminiClient:
         Returns:
             Dictionary with analysis of the PDF
         """
+        return await self._cached(
+            "extract_pdf_content",
+            [pdf_text, file_size],
+            lambda: self._extract_pdf_content(pdf_text, file_size)
+        )
+    
+    async def _extract_pdf_content(self, pdf_text: str, file_size: int):
         prompt = f"""
         Based on this extracted PDF content, analyze the document and provide:
         - Likely document type: (report, invoice, manual, article, etc.)
@@ -229,7 +497,7 @@ class GeminiClient:
         Size: {file_size} bytes
         """
         
-        response = await self.model.generate_content_async(prompt)
+        response = await self._generate(prompt)
         response_text = response.text.strip()
         
         # Try to extract JSON if it's enclosed in backticks or other markers
@@ -238,6 +506,7 @@ class GeminiClient:
         elif "```" in response_text:
             response_text = response_text.split("```")[1].strip()
         
+        cacheable = True
         try:
             # Try to parse as JSON
             import json
@@ -245,6 +514,7 @@ class GeminiClient:
         except json.JSONDecodeError as e:
             print(f"Error parsing JSON from Gemini: {e}")
             print(f"Raw response: {response_text}")
+            cacheable = False
             
             # If JSON parsing fails, create a structured response manually
             result = {
@@ -269,4 +539,5 @@ class GeminiClient:
                 else:
                     result[field] = "Unknown"
         
-        return result 
+        return result, cacheable
+
@@ -0,0 +1,216 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Scheduler configuration (overridable per deployment through the environment)
+LLM_RATE_PER_SECOND = float(os.environ.get("LLM_RATE_PER_SECOND", "10"))
+LLM_BURST = float(os.environ.get("LLM_BURST", "20"))
+LLM_INITIAL_CONCURRENCY = float(os.environ.get("LLM_INITIAL_CONCURRENCY", "8"))
+LLM_MAX_CONCURRENCY = float(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "60"))
+
+# Priority lanes; lower values are admitted first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_BULK: "bulk"}
+
+# Priority of the LLM calls made by the current request/job; set by the
+# pipeline and inherited by every task it spawns
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+# HTTP status codes worth retrying; 429 and 503 also shrink the concurrency window
+RETRYABLE_CODES = (429, 500, 502, 503, 504)
+OVERLOAD_CODES = (429, 503)
+RETRYABLE_ERRORS = ("ResourceExhausted", "ServiceUnavailable", "InternalServerError", "TooManyRequests")
+
+
+def _error_code(error):
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return 429
+    if type(error).__name__ == "ServiceUnavailable":
+        return 503
+    return None
+
+
+class LLMScheduler:
+    """
+    Admission control for LLM calls.
+
+    Combines a token bucket (sustained request rate with a burst allowance),
+    an AIMD concurrency window (grows by one slot per window of successful
+    calls, halves on 429/503), priority lanes for queued calls, and jittered
+    exponential-backoff retries bounded by a per-call deadline.
+    """
+
+    def __init__(self, rate_per_second=LLM_RATE_PER_SECOND, burst=LLM_BURST,
+                 initial_concurrency=LLM_INITIAL_CONCURRENCY, max_concurrency=LLM_MAX_CONCURRENCY,
+                 min_concurrency=1, max_retries=LLM_MAX_RETRIES, deadline_seconds=LLM_DEADLINE_SECONDS,
+                 backoff_base=0.5, backoff_cap=8.0):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.deadline_seconds = deadline_seconds
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._window = float(initial_concurrency)
+        self._last_decrease = 0.0
+        self._in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+
+        self._calls = 0
+        self._retries = 0
+        self._overloads = 0
+        self._failures = 0
+        self._wait_ewma_ms = 0.0
+        self._max_wait_ms = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def _acquire_token(self, deadline):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise asyncio.TimeoutError("LLM call deadline exceeded waiting for rate limit")
+            await asyncio.sleep(wait)
+
+    async def _acquire_slot(self, priority, deadline):
+        if self._in_flight < int(self._window) and not self._waiters:
+            self._in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await asyncio.wait_for(future, max(0.0, deadline - time.monotonic()))
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            # _dispatch may have granted the slot just before the cancellation
+            # or timeout was delivered; hand it to the next waiter
+            if future.done() and not future.cancelled():
+                self._release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise asyncio.TimeoutError("LLM call deadline exceeded waiting for a concurrency slot")
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters and self._in_flight < int(self._window):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # The waiter timed out or was cancelled
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _on_success(self):
+        self._window = min(self.max_concurrency, self._window + 1 / self._window)
+        self._dispatch()
+
+    def _on_overload(self):
+        self._overloads += 1
+        now = time.monotonic()
+        # Halve at most once per second so one burst of 429s counts as one signal
+        if now - self._last_decrease >= 1.0:
+            self._window = max(self.min_concurrency, self._window / 2)
+            self._last_decrease = now
+
+    def _record_wait(self, wait_ms):
+        self._wait_ewma_ms = 0.9 * self._wait_ewma_ms + 0.1 * wait_ms
+        self._max_wait_ms = max(self._max_wait_ms, wait_ms)
+
+    async def submit(self, call: Callable[[], Awaitable[Any]], priority: Optional[int] = None,
+                     deadline_seconds: Optional[float] = None) -> Any:
+        """
+        Run an LLM call under rate, concurrency and retry control.
+
+        Args:
+            call: Zero-argument coroutine function performing one attempt
+            priority: Lane to queue in; defaults to the llm_priority context
+            deadline_seconds: Total budget for queueing, retries and the call
+
+        Returns:
+            The call's result
+
+        Raises:
+            The last error if the call is not retryable, retries are exhausted
+            or the deadline passes (as asyncio.TimeoutError)
+        """
+        priority = llm_priority.get() if priority is None else priority
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        self._calls += 1
+        attempt = 0
+        while True:
+            queued_at = time.monotonic()
+            await self._acquire_slot(priority, deadline)
+            error = None
+            try:
+                self._record_wait((time.monotonic() - queued_at) * 1000)
+                await self._acquire_token(deadline)
+                result = await asyncio.wait_for(call(), max(0.0, deadline - time.monotonic()))
+                self._on_success()
+                return result
+            except asyncio.TimeoutError:
+                self._failures += 1
+                raise
+            except Exception as e:
+                error = e
+            finally:
+                self._release()
+
+            code = _error_code(error)
+            if code in OVERLOAD_CODES:
+                self._on_overload()
+            retryable = code in RETRYABLE_CODES or type(error).__name__ in RETRYABLE_ERRORS
+            backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            if not retryable or attempt >= self.max_retries or time.monotonic() + backoff >= deadline:
+                self._failures += 1
+                raise error
+            self._retries += 1
+            attempt += 1
+            await asyncio.sleep(backoff)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait times and the current limits, for capacity sizing."""
+        self._refill()
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {
+            "queue_depth": sum(depth.values()),
+            "queue_depth_by_lane": depth,
+            "in_flight": self._in_flight,
+            "concurrency_window": round(self._window, 2),
+            "rate_per_second": self.rate,
+            "tokens_available": round(self._tokens, 2),
+            "avg_wait_ms": round(self._wait_ewma_ms, 1),
+            "max_wait_ms": round(self._max_wait_ms, 1),
+            "calls": self._calls,
+            "retries": self._retries,
+            "overload_responses": self._overloads,
+            "failures": self._failures
+        }
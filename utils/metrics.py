@@ -0,0 +1,238 @@
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+# Collect stage latencies and event counters for GET /metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") not in ("0", "false", "no")
+
+# Latency buckets in seconds, from sub-millisecond SQLite calls to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label combination."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram per label combination.
+
+    observe() only increments one bucket; cumulative counts are computed when
+    the metrics are rendered.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self) -> Dict[Tuple, Tuple[float, int]]:
+        """Return (sum, count) per label combination."""
+        with self._lock:
+            return {labels: (data[1], data[2]) for labels, data in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(data[0]), data[1], data[2]]) for labels, data in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "intake_stage_duration_seconds",
+    "Latency of each intake pipeline stage",
+    ("stage",)
+)
+EVENT_COUNTERS = {
+    "llm_fallback": REGISTRY.counter(
+        "intake_llm_fallbacks_total",
+        "LLM calls that failed or returned an unusable answer and fell back to rules or defaults",
+        ("format", "intent")
+    ),
+    "parse_failure": REGISTRY.counter(
+        "intake_parse_failures_total",
+        "Inputs or records that could not be parsed",
+        ("format", "intent")
+    ),
+    "cache_hit": REGISTRY.counter(
+        "intake_llm_cache_hits_total",
+        "LLM calls answered from the response cache",
+        ("format", "intent")
+    )
+}
+
+
+class _RequestEvents:
+    """Events of one pipeline run, counted once its format and intent are known."""
+
+    __slots__ = ("format", "intent", "events")
+
+    def __init__(self):
+        self.format = "unknown"
+        self.intent = "unknown"
+        self.events = []
+
+
+_request_events: ContextVar[Optional[_RequestEvents]] = ContextVar("request_events", default=None)
+
+
+def observe_stage(stage: str, seconds: float):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe((stage,), seconds)
+
+
+class timed_stage:
+    """
+    Time a block as a pipeline stage:
+
+        with timed_stage("upload_read"):
+            ...
+    """
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_stage(self.stage, time.perf_counter() - self.started)
+
+
+def timed(stage: str):
+    """Decorator timing every call of a coroutine function as a pipeline stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                observe_stage(stage, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def record_event(event: str):
+    """
+    Note an LLM fallback, parse failure or cache hit for the current pipeline
+    run. It is counted under the run's format and intent when the run ends.
+    """
+    request = _request_events.get()
+    if request is not None:
+        request.events.append(event)
+
+
+def label_request(format: str = None, intent: str = None):
+    """Set the format/intent labels of the current pipeline run."""
+    request = _request_events.get()
+    if request is not None:
+        if format is not None:
+            request.format = format
+        if intent is not None:
+            request.intent = intent
+
+
+def start_request():
+    """Start collecting events for a pipeline run; pass the token to finish_request."""
+    return _request_events.set(_RequestEvents())
+
+
+def finish_request(token):
+    request = _request_events.get()
+    _request_events.reset(token)
+    if request is None or not METRICS_ENABLED:
+        return
+    for event in request.events:
+        EVENT_COUNTERS[event].inc((request.format, request.intent))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+from utils.spooled_upload import SpooledUpload
+
+
+def content_key(*parts) -> str:
+    """
+    Build a SHA-256 key from the exact content of the given parts.
+
+    Unlike utils.fingerprint, nothing is normalized: bytes are hashed as-is
+    and strings keep their whitespace, so only byte-identical payloads (which
+    produce identical results) share a key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        # Raw content is keyed by its own digest, so a spooled upload and the
+        # same bytes held in memory share a key
+        if isinstance(part, SpooledUpload):
+            digest.update(b'b')
+            digest.update(part.content_digest())
+        elif isinstance(part, bytes):
+            digest.update(b'b')
+            digest.update(hashlib.sha256(part).digest())
+        elif isinstance(part, str):
+            digest.update(b's')
+            digest.update(part.encode('utf-8', errors='surrogatepass'))
+        else:
+            digest.update(b'j')
+            digest.update(json.dumps(part, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one in-flight computation.
+
+    The first caller starts the computation as its own task; callers arriving
+    while it runs await the same task. Results are not kept once the task
+    finishes, so this only deduplicates overlapping work. Cancelling one
+    caller does not cancel the shared computation.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run compute() for key, or join the run already in flight for it.
+
+        Args:
+            key: Identity of the computation, e.g. from content_key()
+            compute: Zero-argument coroutine function
+
+        Returns:
+            The shared result; callers must copy it before mutating it
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller was cancelled
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
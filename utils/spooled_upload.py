@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from typing import BinaryIO
+
+# Upload limits (overridable per deployment through the environment)
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.environ.get("UPLOAD_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Bytes read from each end of an upload for format sniffing
+SNIFF_BYTES = 4096
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds UPLOAD_MAX_BYTES."""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only handle over a memoryview; reads copy only what they return."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def read(self, size=-1):
+        start = min(self._position, len(self._view))
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), start + size)
+        self._position = max(self._position, end)
+        return bytes(self._view[start:end])
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class SpooledUpload:
+    """
+    Upload content kept in memory up to a threshold and in a named temporary
+    file beyond it, so memory per request stays bounded whatever the file size.
+
+    The content is hashed while it is written, and agents read it through
+    file handles (or the file path, for worker processes) instead of bytes.
+    """
+
+    def __init__(self, max_bytes=UPLOAD_MAX_BYTES, memory_bytes=UPLOAD_SPOOL_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.size = 0
+        self.path = None
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._sha256 = hashlib.sha256()
+
+    @classmethod
+    async def from_upload(cls, upload, max_bytes=UPLOAD_MAX_BYTES) -> "SpooledUpload":
+        """
+        Stream a Starlette UploadFile into a new spool, chunk by chunk.
+
+        Raises:
+            UploadTooLargeError: As soon as more than max_bytes have been read
+        """
+        spool = cls(max_bytes)
+        try:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if spool._file is None:
+                    spool.write(chunk)
+                else:
+                    await asyncio.to_thread(spool.write, chunk)
+            spool.finish()
+        except BaseException:
+            spool.close()
+            raise
+        return spool
+
+    def write(self, chunk: bytes):
+        if self.size + len(chunk) > self.max_bytes:
+            raise UploadTooLargeError(self.max_bytes)
+        self._sha256.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.size > self.memory_bytes:
+            self._rollover()
+        (self._file or self._buffer).write(chunk)
+
+    def _rollover(self):
+        self._file = tempfile.NamedTemporaryFile(prefix="intake-", delete=False)
+        self.path = self._file.name
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def finish(self):
+        """Flush buffered writes so the content can be read back."""
+        if self._file is not None:
+            self._file.flush()
+
+    def content_digest(self) -> bytes:
+        """SHA-256 digest of the content, computed while spooling."""
+        return self._sha256.digest()
+
+    def open(self) -> BinaryIO:
+        """
+        Open an independent binary read handle positioned at the start.
+
+        In-memory content is read through a view of the spool buffer rather
+        than a copy; the spool must not be written to while it is open.
+        """
+        if self.path is not None:
+            self.finish()
+            return open(self.path, 'rb')
+        return _BufferReader(self._buffer.getbuffer())
+
+    def head(self, size: int = SNIFF_BYTES) -> bytes:
+        with self.open() as f:
+            return f.read(size)
+
+    def tail(self, size: int = SNIFF_BYTES) -> bytes:
+        with self.open() as f:
+            f.seek(max(0, self.size - size))
+            return f.read()
+
+    def read_bytes(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    def read_text(self) -> str:
+        return self.read_bytes().decode('utf-8', errors='ignore')
+
+    def ensure_file(self) -> str:
+        """Move in-memory content to disk if needed and return the file path."""
+        if self.path is None:
+            self._rollover()
+            self.finish()
+        return self.path
+
+    def close(self):
+        """Release the buffer and delete the temporary file, if any."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self._buffer = None
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,35 @@
+"""
+Standalone job worker: drains the /intake?mode=async queue from
+shared_memory.db without serving HTTP. Run API servers with JOB_WORKERS=0 to
+leave all job processing to these processes.
+
+    python worker.py
+"""
+import asyncio
+import os
+
+from agents.job_worker import JobWorkers
+from main import gemini_client, job_queue, pipeline, pdf_parser_pool, shared_memory
+
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "4"))
+
+
+async def run():
+    workers = JobWorkers(job_queue, pipeline, concurrency=WORKER_CONCURRENCY)
+    workers.start()
+    print(f"Job worker started with {WORKER_CONCURRENCY} concurrent jobs")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await workers.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pdf_parser_pool.shutdown()
+        shared_memory.close()
+        gemini_client.close()